@@ -0,0 +1,47 @@
+import argparse
+import json
+import time
+
+from ..bots.exchange_info import exchange_info_cache
+from .data import load_klines
+from .engine import run_backtest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the Bollinger band strategy on local klines")
+    parser.add_argument("paths", nargs="+", help="CSV/Parquet kline files or directories")
+    parser.add_argument("--symbol", help="Symbol, to take tick size and quantity step from the exchange info cache")
+    parser.add_argument("--order-size", type=float, required=True, help="Quote amount per order, as in /bot/trades")
+    parser.add_argument("--tick-size", type=float)
+    parser.add_argument("--qty-step", type=float)
+    parser.add_argument("--commission", type=float, default=0.0)
+    parser.add_argument("--capital", type=float)
+    parser.add_argument("--trades", help="Write the trade list to this CSV file")
+    args = parser.parse_args()
+
+    tick_size, qty_step = args.tick_size, args.qty_step
+    if args.symbol and (tick_size is None or qty_step is None):
+        info = exchange_info_cache.peek("https://api.binance.com", args.symbol)
+        if info is not None:
+            tick_size = tick_size or info.tick_size
+            qty_step = qty_step or info.qty_step
+    if tick_size is None or qty_step is None:
+        parser.error("--tick-size and --qty-step are required when the symbol is not in the exchange info cache")
+
+    start = time.perf_counter()
+    candles = load_klines(*args.paths)
+    loaded = time.perf_counter()
+    result = run_backtest(candles, args.order_size, tick_size, qty_step, commission=args.commission,
+                          capital=args.capital)
+    done = time.perf_counter()
+
+    summary = result.summary()
+    summary.update(candles=len(candles), load_s=round(loaded - start, 3), backtest_s=round(done - loaded, 3))
+    print(json.dumps(summary, indent=2))
+
+    if args.trades:
+        result.trades.to_csv(args.trades, index=False)
+
+
+if __name__ == "__main__":
+    main()
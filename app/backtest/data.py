@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from ..bots.candle_store import COLUMNS
+from ..bots.kline_archive import KlineArchive
+
+# Header names accepted for each candle column, besides the positional Binance kline layout
+COLUMN_ALIASES = {
+    "t": ("open_time", "timestamp", "time", "t", "date"),
+    "o": ("open", "o"),
+    "h": ("high", "h"),
+    "l": ("low", "l"),
+    "c": ("close", "c"),
+    "v": ("volume", "v"),
+}
+
+
+def read_frame(path):
+    if path.endswith(".parquet") or path.endswith(".pq"):
+        try:
+            return pd.read_parquet(path)
+        except ImportError as e:
+            raise ImportError(f"Reading {path} needs pyarrow or fastparquet: {e}")
+
+    frame = pd.read_csv(path, header=None)
+    if isinstance(frame.iloc[0, 0], str) and not frame.iloc[0, 0].isdigit():
+        # First row is a header
+        frame = pd.read_csv(path)
+    return frame
+
+
+def to_candles(frame):
+    """(n, 6) float array in `COLUMNS` order from a kline DataFrame."""
+    names = {str(name).lower(): name for name in frame.columns}
+    columns = []
+    for i, column in enumerate(COLUMNS):
+        match = next((names[alias] for alias in COLUMN_ALIASES[column] if alias in names), None)
+        # Binance dumps (data.binance.vision) have no header: open time, open, high, low, close, volume, ...
+        columns.append(frame[match] if match is not None else frame.iloc[:, i])
+
+    t = columns[0]
+    if pd.api.types.is_datetime64_any_dtype(t):
+        t = t.astype("int64") // 1_000_000
+    elif not pd.api.types.is_numeric_dtype(t):
+        t = pd.to_datetime(t, utc=True).astype("int64") // 1_000_000
+
+    candles = np.empty((len(frame), len(COLUMNS)))
+    candles[:, 0] = np.asarray(t, dtype=np.int64)
+    for i in range(1, len(COLUMNS)):
+        candles[:, i] = np.asarray(columns[i], dtype=float)
+
+    # Newer dumps use microseconds
+    micros = candles[:, 0] > 1e14
+    candles[micros, 0] //= 1000
+    return candles
+
+
+def read_candles(path):
+    if path.endswith(".klines"):
+        return KlineArchive(path).candles()
+    return to_candles(read_frame(path))
+
+
+def load_klines(*paths):
+    """Load closed klines from archives or CSV/Parquet files (or directories of them), sorted and de-duplicated."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.endswith((".klines", ".csv", ".parquet", ".pq"))))
+        else:
+            files.append(path)
+    if not files:
+        raise ValueError(f"No kline files found in {paths}")
+
+    candles = np.concatenate([read_candles(path) for path in files])
+    candles = candles[np.argsort(candles[:, 0], kind="stable")]
+    keep = np.ones(len(candles), dtype=bool)
+    keep[1:] = candles[1:, 0] != candles[:-1, 0]
+    return candles[keep]
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+from ..bots import strategy
+
+
+def bollinger_bands(close, window=strategy.band_window, num_std=strategy.band_std):
+    """(lower, upper) bands over a whole close series, NaN until `window` candles are known.
+
+    Same definition as `IndicatorEngine`: rolling mean +/- `num_std` sample standard deviations.
+    """
+    rolling = pd.Series(close).rolling(window)
+    mean = rolling.mean().to_numpy()
+    std = rolling.std(ddof=1).to_numpy()
+    return mean - num_std * std, mean + num_std * std
+
+
+def entry_filters(close, lower, upper, filters, ema_short_period=strategy.ema_short_period,
+                  ema_long_period=strategy.ema_long_period, regime_filter=strategy.regime_filter,
+                  band_width_filter=strategy.band_width_filter):
+    """Boolean array of the candles passing every `IndicatorEngine` filter named in `filters`.
+
+    Names: "ema_trend", "ema_regime", "band_width" and "macd", computed like the
+    engine's `ema_trend_filter`, `ema_regime_filter`, `bbands_width_filter` and `macd_above_0`.
+    """
+    series = pd.Series(close)
+    passed = np.ones(len(close), dtype=bool)
+    for name in filters:
+        if name == "ema_trend":
+            short = series.ewm(span=ema_short_period).mean().to_numpy()
+            passed &= short > series.ewm(span=ema_long_period).mean().to_numpy()
+        elif name == "ema_regime":
+            passed &= close > series.ewm(span=regime_filter).mean().to_numpy()
+        elif name == "band_width":
+            passed &= upper / lower > band_width_filter
+        elif name == "macd":
+            line = series.ewm(span=12, adjust=False).mean() - series.ewm(span=26, adjust=False).mean()
+            passed &= (line - line.ewm(span=9, adjust=False).mean()).to_numpy() > 0
+        else:
+            raise ValueError(f"Unknown entry filter: {name}")
+    return passed
+
+
+def next_true(mask):
+    """`out[i]` is the first index `j >= i` with `mask[j]`, or `len(mask)`; one extra sentinel slot at the end."""
+    n = len(mask)
+    index = np.where(mask, np.arange(n), n)
+    return np.append(np.minimum.accumulate(index[::-1])[::-1], n)
+
+
+class BacktestResult:
+    """Trades, equity curve and summary of one backtest run."""
+
+    def __init__(self, trades, equity, capital):
+        self.trades = trades
+        self.equity = equity
+        self.capital = capital
+
+    @property
+    def closed_trades(self):
+        return self.trades[self.trades["exit_time"].notna()]
+
+    def summary(self):
+        closed = self.closed_trades
+        peak = self.equity.cummax()
+        drawdown = peak - self.equity
+        return {
+            "trades": len(closed),
+            "open_position": bool(len(self.trades) and self.trades["exit_time"].isna().iloc[-1]),
+            "pnl": float(closed["pnl"].sum()),
+            "return_pct": float(closed["pnl"].sum() / self.capital * 100),
+            "win_rate": float((closed["pnl"] > 0).mean()) if len(closed) else 0.0,
+            "avg_bars_held": float(closed["bars_held"].mean()) if len(closed) else 0.0,
+            "max_drawdown": float(drawdown.max()) if len(drawdown) else 0.0,
+            "max_drawdown_pct": float((drawdown / peak).max() * 100) if len(drawdown) else 0.0,
+            "final_equity": float(self.equity.iloc[-1]) if len(self.equity) else self.capital,
+        }
+
+
+def run_backtest(candles, order_size, tick_size, qty_step, commission=0.0, capital=None,
+                 band_window=strategy.band_window, band_std=strategy.band_std, filters=(),
+                 fee_percent=strategy.fee_percent, **filter_params):
+    """Replay `candles` ((n, 6) array in `candle_store.COLUMNS` order) through the `run_bot` strategy.
+
+    At each candle close, as in `run_bot`:
+      - flat and close > lower band: a limit buy is placed at the lower band,
+        sized `order_size / close` and rounded to `qty_step`;
+      - buy order open: it is replaced at the new lower band and size;
+      - position: the take profit is placed or replaced at the upper band for
+        `strategy.quantity_after_fees` of the filled quantity;
+      - take profit filled: the bot is flat again and may enter on the same close.
+    `filters` adds `IndicatorEngine` filters to the entry condition (see
+    `entry_filters`, tuned through `filter_params`); run_bot uses none.
+    A buy resting at price p during a candle fills if its low <= p (at the open
+    if it gapped below), a take profit if its high >= p. Prices are rounded to
+    `tick_size`. `commission` is charged on both legs; the remainder the take
+    profit leaves unsold (`quantity - exit_quantity`) is valued at the exit price.
+
+    The candle-by-candle conditions are NumPy arrays over the whole series;
+    Python only steps from one trade to the next through next-hit indexes.
+    """
+    t, o, h, l, c = (candles[:, i] for i in range(5))
+    n = len(candles)
+    capital = order_size if capital is None else capital
+
+    lower, upper = bollinger_bands(c, band_window, band_std)
+    buy_price = strategy.round_step(lower, tick_size)
+    buy_qty = strategy.position_size(order_size, c, qty_step)
+    tp_price = strategy.round_step(upper, tick_size)
+
+    # Orders placed at close i rest during candle i + 1
+    entry_signal = c > lower
+    if filters:
+        entry_signal &= entry_filters(c, lower, upper, filters, **filter_params)
+    buy_hit = np.zeros(n, dtype=bool)
+    buy_hit[1:] = l[1:] <= buy_price[:-1]
+    tp_hit = np.zeros(n, dtype=bool)
+    tp_hit[1:] = h[1:] >= tp_price[:-1]
+
+    next_signal = next_true(entry_signal)
+    next_buy = next_true(buy_hit)
+    next_tp = next_true(tp_hit)
+
+    entries, fills, exits = [], [], []
+    k = next_signal[0]
+    while k < n:
+        j = next_buy[k + 1] if k + 1 < n else n
+        if j >= n:
+            break  # Buy order still open at the end
+        m = next_tp[j + 1] if j + 1 < n else n
+        entries.append(k)
+        fills.append(j)
+        exits.append(m)
+        if m >= n:
+            break  # Position still open at the end
+        k = next_signal[m]
+
+    entries, fills, exits = np.array(entries, dtype=int), np.array(fills, dtype=int), np.array(exits, dtype=int)
+    closed = exits < n
+    exits_c = np.minimum(exits, n - 1)
+
+    quantity = buy_qty[fills - 1]
+    entry_price = np.minimum(o[fills], buy_price[fills - 1])
+    exit_price = np.where(closed, np.maximum(o[exits_c], tp_price[exits_c - 1]), np.nan)
+    exit_quantity = np.where(closed, strategy.quantity_after_fees(quantity, tp_price[exits_c - 1], qty_step,
+                                                                      fee_percent), np.nan)
+
+    entry_value = quantity * entry_price
+    exit_value = exit_quantity * exit_price
+    residual_value = (quantity - exit_quantity) * exit_price
+    pnl = exit_value + residual_value - entry_value - commission * (entry_value + exit_value)
+
+    trades = pd.DataFrame({
+        "signal_time": pd.to_datetime(t[entries], unit="ms", utc=True),
+        "entry_time": pd.to_datetime(t[fills], unit="ms", utc=True),
+        "entry_price": entry_price,
+        "quantity": quantity,
+        "exit_time": pd.to_datetime(np.where(closed, t[exits_c], np.nan), unit="ms", utc=True),
+        "exit_price": exit_price,
+        "exit_quantity": exit_quantity,
+        "pnl": pnl,
+        "return_pct": pnl / entry_value * 100,
+        "bars_held": np.where(closed, exits - fills, n - fills),
+        "buy_replacements": fills - entries - 1,
+    })
+
+    # Equity at every close: realized PnL plus the open position marked to the close
+    position = np.zeros(n + 1)
+    cost = np.zeros(n + 1)
+    realized = np.zeros(n + 1)
+    np.add.at(position, fills, quantity)
+    np.add.at(position, exits, -quantity)
+    np.add.at(cost, fills, entry_value * (1 + commission))
+    np.add.at(cost, exits, -entry_value * (1 + commission))
+    np.add.at(realized, exits[closed], pnl[closed])
+    equity = capital + np.cumsum(realized)[:n] + np.cumsum(position)[:n] * c - np.cumsum(cost)[:n]
+
+    return BacktestResult(trades, pd.Series(equity, index=pd.to_datetime(t, unit="ms", utc=True)), capital)
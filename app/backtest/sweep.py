@@ -0,0 +1,207 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from .data import load_klines
+from .engine import run_backtest
+
+# Parameters a sweep can vary, with the type their values are parsed as
+SWEEP_PARAMS = {
+    "band_window": int,
+    "band_std": float,
+    "ema_short_period": int,
+    "ema_long_period": int,
+    "regime_filter": int,
+    "band_width_filter": float,
+    "fee_percent": float,
+}
+
+# Parameters that only tune an entry filter, and that filter
+FILTER_PARAMS = {
+    "ema_short_period": "ema_trend",
+    "ema_long_period": "ema_trend",
+    "regime_filter": "ema_regime",
+    "band_width_filter": "band_width",
+}
+
+_candles = None
+_shm = None
+
+
+def attach_candles(name, shape):
+    """Pool initializer: map the parent's candle array instead of receiving a copy."""
+    global _candles, _shm
+    # Pool workers share the parent's resource tracker, so the parent's unlink is the only cleanup
+    _shm = shared_memory.SharedMemory(name=name)
+    _candles = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+    _candles.flags.writeable = False
+
+
+def evaluate(job):
+    params, settings = job
+    start = time.perf_counter()
+    result = run_backtest(_candles, settings["order_size"], settings["tick_size"], settings["qty_step"],
+                          commission=settings["commission"], filters=settings["filters"], **params)
+    summary = result.summary()
+    summary.update(params=params, elapsed_s=round(time.perf_counter() - start, 4))
+    return summary
+
+
+def grid(space):
+    """Every combination of `space` ({param: [values]})."""
+    ranges = [name for name, values in space.items() if isinstance(values, tuple)]
+    if ranges:
+        raise ValueError(f"Ranges {ranges} can only be used with random search")
+    names = list(space)
+    for values in itertools.product(*(space[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def random_search(space, samples, seed=None):
+    """`samples` random combinations; a (lo, hi) range is sampled uniformly, a list of values by choice."""
+    rng = random.Random(seed)
+    for _ in range(samples):
+        params = {}
+        for name, values in space.items():
+            if not isinstance(values, tuple):
+                params[name] = rng.choice(values)
+            elif SWEEP_PARAMS[name] is float:
+                params[name] = rng.uniform(*values)
+            else:
+                params[name] = rng.randint(*values)
+        yield params
+
+
+def valid(params):
+    return params.get("ema_short_period", 0) < params.get("ema_long_period", float("inf"))
+
+
+def params_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def completed(out_path):
+    """Parameter sets already in `out_path`, so an interrupted sweep resumes where it stopped."""
+    done = set()
+    if os.path.exists(out_path):
+        with open(out_path) as f:
+            for line in f:
+                try:
+                    done.add(params_key(json.loads(line)["params"]))
+                except (ValueError, KeyError):
+                    continue  # Line cut short by an interruption
+    return done
+
+
+def run_sweep(candles, combinations, out_path, settings, processes=None, chunksize=4):
+    """Backtest every parameter set of `combinations` on a process pool, appending one JSON line per result.
+
+    The candles are copied once into shared memory and mapped read-only by
+    every worker, so adding workers does not add copies of the series.
+    Returns the number of parameter sets evaluated.
+    """
+    done = completed(out_path)
+    jobs = []
+    skipped = 0
+    for params in combinations:
+        if not valid(params):
+            skipped += 1
+        elif params_key(params) not in done:
+            jobs.append((params, settings))
+    if skipped:
+        print(f"[Sweep] Skipped {skipped} parameter sets with ema_short_period >= ema_long_period")
+    if not jobs:
+        return 0
+
+    candles = np.ascontiguousarray(candles, dtype=np.float64)
+    shm = shared_memory.SharedMemory(create=True, size=candles.nbytes)
+    try:
+        np.ndarray(candles.shape, dtype=np.float64, buffer=shm.buf)[:] = candles
+
+        with Pool(processes, initializer=attach_candles, initargs=(shm.name, candles.shape)) as pool, \
+                open(out_path, "a") as out:
+            for i, summary in enumerate(pool.imap_unordered(evaluate, jobs, chunksize), 1):
+                out.write(json.dumps(summary) + "\n")
+                out.flush()
+                if i % 100 == 0:
+                    print(f"[Sweep] {i}/{len(jobs)} parameter sets done")
+    finally:
+        shm.close()
+        shm.unlink()
+    return len(jobs)
+
+
+def parse_space(items):
+    """["band_window=15,20,25", "band_std=1.5:2.5"] -> {param: values}; lo:hi is a (lo, hi) range for random search."""
+    space = {}
+    for item in items:
+        name, values = item.split("=", 1)
+        if name not in SWEEP_PARAMS:
+            raise ValueError(f"Unknown sweep parameter {name}, expected one of {sorted(SWEEP_PARAMS)}")
+        if ":" in values:
+            lo, hi = values.split(":", 1)
+            space[name] = (SWEEP_PARAMS[name](lo), SWEEP_PARAMS[name](hi))
+        else:
+            space[name] = [SWEEP_PARAMS[name](value) for value in values.split(",")]
+    return space
+
+
+def check_space(space, filters):
+    """Reject swept parameters whose filter is off: every value would give the same result."""
+    unused = [name for name in space if name in FILTER_PARAMS and FILTER_PARAMS[name] not in filters]
+    if unused:
+        raise ValueError(", ".join(f"{name} only has an effect with --filters {FILTER_PARAMS[name]}"
+                                   for name in unused))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep strategy parameters over local klines")
+    parser.add_argument("paths", nargs="+", help="CSV/Parquet kline files or directories")
+    parser.add_argument("--param", action="append", default=[], required=True,
+                        help="name=v1,v2,... (grid values) or name=lo:hi (random range), repeatable")
+    parser.add_argument("--random", type=int, help="Sample this many random combinations instead of the full grid")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--filters", default="", help="Entry filters, e.g. ema_trend,ema_regime,band_width,macd")
+    parser.add_argument("--order-size", type=float, required=True)
+    parser.add_argument("--tick-size", type=float, required=True)
+    parser.add_argument("--qty-step", type=float, required=True)
+    parser.add_argument("--commission", type=float, default=0.0)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--out", default="sweep.jsonl")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    filters = [name for name in args.filters.split(",") if name]
+    space = parse_space(args.param)
+    try:
+        check_space(space, filters)
+    except ValueError as e:
+        parser.error(str(e))
+    combinations = random_search(space, args.random, args.seed) if args.random else grid(space)
+    settings = {
+        "order_size": args.order_size,
+        "tick_size": args.tick_size,
+        "qty_step": args.qty_step,
+        "commission": args.commission,
+        "filters": filters,
+    }
+
+    start = time.perf_counter()
+    evaluated = run_sweep(load_klines(*args.paths), combinations, args.out, settings, processes=args.processes)
+    print(f"[Sweep] Evaluated {evaluated} parameter sets in {time.perf_counter() - start:.1f}s -> {args.out}")
+
+    with open(args.out) as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    for summary in sorted(results, key=lambda r: r["pnl"], reverse=True)[:args.top]:
+        print(json.dumps({"pnl": round(summary["pnl"], 4), "max_drawdown": round(summary["max_drawdown"], 4),
+                          "trades": summary["trades"], "params": summary["params"]}))
+
+
+if __name__ == "__main__":
+    main()
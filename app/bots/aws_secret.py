@@ -1,13 +1,14 @@
 import base64
 import os
 
-import boto3
 import json
 
 from dotenv import load_dotenv
 load_dotenv()
 
 def get_secret(secret_name):
+    import boto3  # Only needed when a secret is fetched, kept off the import path
+
     session = boto3.session.Session()
     client = session.client(service_name='secretsmanager', region_name=os.getenv("AWS_REGION_NAME"))
 
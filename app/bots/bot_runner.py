@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+
+import redis
+import redis.asyncio as aioredis
+
+from ..db.write_behind import close_write_behind, write_behind_stats
+from ..redis_client import REDIS_URL, get_async_redis, get_redis
+from .bot_state import amendment_stats
+from .events import ABORT_CHANNEL
+from .scheduler import get_candle_scheduler
+from .transport import rate_limit_stats, transport_stats
+from .user_data import get_user_data_manager
+
+logger = logging.getLogger(__name__)
+
+# Every hosted bot holds a lease, kept alive by its runner. A bot whose lease expired (its worker crashed)
+# is no longer hosted anywhere and is started again by the `recover_bots` task.
+LEASE_PREFIX = "bots:lease:"
+
+
+def lease_key(task_id):
+    return f"{LEASE_PREFIX}{task_id}"
+
+
+class RunnerFull(Exception):
+    """The runner cannot host another bot right now; the start should be retried elsewhere."""
+
+
+class HostedBot:
+    """A bot coroutine hosted by a `BotRunner`, with what is needed to restart it elsewhere."""
+
+    def __init__(self, task_id, ticker, kwargs, is_aborted=None):
+        self.task_id = task_id
+        self.ticker = ticker
+        self.kwargs = kwargs
+        self.is_aborted = is_aborted
+        self.started_at = time.time()
+        self.task = None
+        self.cancel_requested = False
+        self.aborted = False
+
+
+class BotRunner:
+    """Hosts many bots as asyncio tasks on one event loop running in a background thread.
+
+    A worker process used to be pinned to a single `run_bot` loop; the runner
+    lets one process serve up to `capacity` bots. Bots are started and
+    cancelled from other threads (Celery task / control handlers) through the
+    thread-safe `submit` and `cancel`.
+
+    Bots sleep until their next candle, so stop requests are pushed: the
+    runner subscribes once to ABORT_CHANNEL on `redis_url` and cancels the
+    bot whose task id is published there (see `publish_abort`).
+
+    With a `redis_url`, a bot is only started once the runner `claim`s its
+    lease; the leases of hosted bots are renewed every `lease_ttl` / 3
+    seconds and dropped when the bot stops.
+    """
+
+    def __init__(self, capacity=1000, name=None, redis_url=None, resubscribe_delay=1, lease_ttl=90):
+        self.capacity = capacity
+        self.redis_url = redis_url
+        self.lease_ttl = lease_ttl
+        self.resubscribe_delay = resubscribe_delay
+        self.abort_subscribed = False
+        self.aborts_pushed = 0
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.bots = {}
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.finished = 0
+        self.failed = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever, name="bot-runner", daemon=True)
+            self.thread.start()
+        if self.redis_url:
+            asyncio.run_coroutine_threadsafe(self.listen_aborts(), self.loop)
+            asyncio.run_coroutine_threadsafe(self.keep_leases(), self.loop)
+
+    def claim(self, task_id):
+        """Take the lease of `task_id`. False if another runner hosts the bot."""
+        if not self.redis_url:
+            return True
+        try:
+            client = get_redis()
+            if client.set(lease_key(task_id), self.name, nx=True, ex=self.lease_ttl):
+                return True
+            owner = client.get(lease_key(task_id))
+            return owner is None or owner.decode() == self.name
+        except redis.RedisError as e:
+            # Rather a bot hosted twice for a while than a bot not hosted at all
+            logger.error(f"[Runner {self.name}] Could not claim bot {task_id}, starting it anyway: {e}")
+            return True
+
+    def release_claim(self, task_id):
+        """Give up the lease of a bot this runner did not start after all, e.g. because it is full."""
+        if not self.redis_url:
+            return
+        try:
+            get_redis().delete(lease_key(task_id))
+        except redis.RedisError as e:
+            logger.error(f"[Runner {self.name}] Could not release the lease of bot {task_id}: {e}")
+
+    async def keep_leases(self):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            with self.lock:
+                task_ids = list(self.bots)
+            if not task_ids:
+                continue
+            try:
+                async with get_async_redis().pipeline(transaction=False) as pipe:
+                    for task_id in task_ids:
+                        pipe.set(lease_key(task_id), self.name, ex=self.lease_ttl)
+                    await pipe.execute()
+            except redis.RedisError as e:
+                logger.error(f"[Runner {self.name}] Could not renew bot leases: {e}")
+
+    async def drop_leases(self, task_ids):
+        if not self.redis_url or not task_ids:
+            return
+        try:
+            await get_async_redis().delete(*(lease_key(task_id) for task_id in task_ids))
+        except redis.RedisError as e:
+            logger.error(f"[Runner {self.name}] Could not drop bot leases: {e}")
+
+    def submit(self, task_id, ticker, kwargs, bot_factory, on_done=None, is_aborted=None):
+        """Start `bot_factory(**kwargs)` on the runner loop under `task_id`.
+
+        Raises `RunnerFull` when the runner is at capacity.
+        `on_done(task_id, result, exception)` is called from the runner thread.
+        `is_aborted()` is checked for hosted bots whenever the abort subscription (re)connects.
+        """
+        self.start()
+
+        with self.lock:
+            if task_id in self.bots:
+                return self.bots[task_id]
+            if len(self.bots) >= self.capacity:
+                raise RunnerFull(f"Runner {self.name} is at capacity ({self.capacity} bots)")
+            bot = HostedBot(task_id, ticker, kwargs, is_aborted)
+            self.bots[task_id] = bot
+
+        def create_task():
+            if bot.cancel_requested:
+                with self.lock:
+                    self.bots.pop(task_id, None)
+                return
+            bot.task = self.loop.create_task(bot_factory(**kwargs), name=f"bot-{task_id}")
+            bot.task.add_done_callback(lambda task: self.on_bot_done(bot, task, on_done))
+
+        self.loop.call_soon_threadsafe(create_task)
+        logger.info(f"[Runner {self.name}] Started bot {task_id} on {ticker} ({len(self.bots)}/{self.capacity})")
+        return bot
+
+    def on_bot_done(self, bot, task, on_done):
+        with self.lock:
+            self.bots.pop(bot.task_id, None)
+        self.loop.create_task(self.drop_leases([bot.task_id]))
+
+        result, exception = None, None
+        if task.cancelled():
+            logger.info(f"[Runner {self.name}] Bot {bot.task_id} {'aborted' if bot.aborted else 'cancelled'}")
+        elif task.exception() is not None:
+            exception = task.exception()
+            self.failed += 1
+            logger.error(f"[Runner {self.name}] Bot {bot.task_id} failed: {exception!r}")
+        else:
+            result = task.result()
+            self.finished += 1
+
+        if on_done is not None:
+            try:
+                on_done(bot.task_id, result, exception)
+            except Exception as e:
+                logger.error(f"[Runner {self.name}] Completion callback failed for bot {bot.task_id}: {e}")
+
+    def cancel(self, task_id):
+        """Cancel a hosted bot. Returns False if it is not hosted here."""
+        with self.lock:
+            bot = self.bots.get(task_id)
+        if bot is None:
+            return False
+        bot.cancel_requested = True
+        self.loop.call_soon_threadsafe(lambda: bot.task is not None and bot.task.cancel())
+        return True
+
+    def abort(self, task_id):
+        """Cancel a hosted bot whose task was aborted. Returns False if it is not hosted here."""
+        with self.lock:
+            bot = self.bots.get(task_id)
+        if bot is None:
+            return False
+        bot.aborted = True
+        return self.cancel(task_id)
+
+    async def listen_aborts(self):
+        """Cancel bots as soon as /bot/stop publishes their task id on ABORT_CHANNEL."""
+        while True:
+            client = aioredis.Redis.from_url(self.redis_url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(ABORT_CHANNEL)
+                    # Aborts published while we were not subscribed are lost, catch up from the result backend
+                    await self.reconcile_aborts()
+                    self.abort_subscribed = True
+
+                    async for message in pubsub.listen():
+                        if message["type"] == "message" and self.abort(message["data"].decode()):
+                            self.aborts_pushed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[Runner {self.name}] Abort subscription lost, resubscribing: {e}")
+                await asyncio.sleep(self.resubscribe_delay)
+            finally:
+                self.abort_subscribed = False
+                await client.aclose()
+
+    async def reconcile_aborts(self):
+        with self.lock:
+            bots = [bot for bot in self.bots.values() if bot.is_aborted is not None]
+        if not bots:
+            return
+
+        try:
+            aborted = await asyncio.to_thread(lambda: [bot for bot in bots if bot.is_aborted()])
+        except Exception as e:
+            logger.error(f"[Runner {self.name}] Abort check failed: {e}")
+            return
+
+        for bot in aborted:
+            self.abort(bot.task_id)
+
+    def drain(self, timeout=10):
+        """Cancel every hosted bot and return them, e.g. to requeue them on shutdown."""
+        with self.lock:
+            bots = list(self.bots.values())
+        if self.loop is None:
+            return bots
+
+        async def cancel_all():
+            tasks = [bot.task for bot in bots if bot.task is not None]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Released so the requeued bots can be claimed by another runner right away
+            await self.drop_leases([bot.task_id for bot in bots])
+            # Trade updates still buffered must reach Mongo before the worker exits
+            await close_write_behind()
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_all(), self.loop).result(timeout)
+        except Exception as e:
+            logger.error(f"[Runner {self.name}] Timed out draining bots: {e}")
+        return bots
+
+    def stats(self):
+        """Capacity metric reported to the API through the `runner_stats` control command."""
+        with self.lock:
+            hosted = len(self.bots)
+            tickers = sorted({bot.ticker for bot in self.bots.values()})
+        return {
+            "runner": self.name,
+            "bots": hosted,
+            "capacity": self.capacity,
+            "free": self.capacity - hosted,
+            "utilization": hosted / self.capacity if self.capacity else 1.0,
+            "tickers": tickers,
+            "finished": self.finished,
+            "failed": self.failed,
+            "abort_subscribed": self.abort_subscribed,
+            "aborts_pushed": self.aborts_pushed,
+            "scheduler": get_candle_scheduler(self.loop).stats() if self.loop is not None else {},
+            "user_data": get_user_data_manager(self.loop).stats() if self.loop is not None else {},
+            "rate_limit": rate_limit_stats(self.loop),
+            "http": transport_stats(self.loop),
+            "amendments": amendment_stats.snapshot(),
+            "write_behind": write_behind_stats(self.loop) if self.loop is not None else {},
+        }
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_bot_runner():
+    """The runner of this worker process, sized from BOT_RUNNER_CAPACITY."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = BotRunner(capacity=int(os.getenv("BOT_RUNNER_CAPACITY", "1000")), redis_url=REDIS_URL,
+                                lease_ttl=int(os.getenv("BOT_LEASE_TTL", "90")))
+        return _runner
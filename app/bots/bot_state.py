@@ -0,0 +1,217 @@
+import logging
+import math
+import threading
+import weakref
+from enum import Enum
+
+logger = logging.getLogger(__name__)
+
+
+class OrderStatus(Enum):
+    OPEN_ORDER = 'OPEN_ORDER',
+    POSITION = 'POSITION'
+
+
+class TakeProfitStatus(Enum):
+    NOT_PLACED = "NOT_PLACED",
+    PLACED = 'PLACED'
+
+
+class OrderIndex:
+    """Maps (symbol, order id) to the `BotState` that placed the order.
+
+    The user data stream only tells which order filled; the index finds the bot
+    it belongs to. Entries are weak, so a stopped bot's state is reclaimed even
+    if one of its orders was never released.
+    """
+
+    def __init__(self):
+        self.states = weakref.WeakValueDictionary()
+        self.lock = threading.Lock()
+
+    def add(self, state, order_id):
+        with self.lock:
+            self.states[(state.symbol, order_id)] = state
+
+    def discard(self, symbol, order_id):
+        with self.lock:
+            self.states.pop((symbol, order_id), None)
+
+    def get(self, symbol, order_id):
+        with self.lock:
+            return self.states.get((symbol, order_id))
+
+    def __len__(self):
+        with self.lock:
+            return len(self.states)
+
+
+order_index = OrderIndex()
+
+# Execution report statuses after which an order no longer rests on the book
+CLOSED_STATUSES = ("FILLED", "CANCELED", "EXPIRED", "REJECTED", "EXPIRED_IN_MATCH")
+
+
+class AmendmentStats:
+    """Process-wide count of cancelReplace amendments sent and skipped as no-ops."""
+
+    def __init__(self):
+        self.sent = 0
+        self.suppressed = 0
+
+    def snapshot(self):
+        total = self.sent + self.suppressed
+        return {"sent": self.sent, "suppressed": self.suppressed,
+                "suppressed_ratio": self.suppressed / total if total else 0.0}
+
+
+amendment_stats = AmendmentStats()
+
+
+class OpenOrders:
+    """Local copy of one bot's resting orders: order id -> (side, price, quantity).
+
+    Kept current from order responses and `executionReport` events, so an
+    amendment is only sent when the rounded price or quantity really differs
+    from the order on the book. An order the book doesn't know is always
+    amended.
+    """
+
+    __slots__ = ("orders", "sent", "suppressed")
+
+    def __init__(self):
+        self.orders = {}
+        self.sent = 0
+        self.suppressed = 0
+
+    def record(self, order_id, side, price, quantity, status="NEW"):
+        if status in CLOSED_STATUSES:
+            self.orders.pop(order_id, None)
+        else:
+            self.orders[order_id] = (side, float(price), float(quantity))
+
+    def record_response(self, response):
+        """Record an order from a POST /api/v3/order response or a cancelReplace `newOrderResponse`."""
+        if response and "orderId" in response and "price" in response:
+            self.record(response["orderId"], response.get("side"), response["price"], response["origQty"],
+                        response.get("status", "NEW"))
+
+    def apply_report(self, report):
+        self.record(report["i"], report["S"], report["p"], report["q"], report["X"])
+
+    def discard(self, order_id):
+        self.orders.pop(order_id, None)
+
+    def unchanged(self, order_id, price, quantity):
+        """True (and counted as suppressed) if `order_id` already rests at `price` for `quantity`."""
+        order = self.orders.get(order_id)
+        if order is not None and math.isclose(order[1], price) and math.isclose(order[2], quantity):
+            self.suppressed += 1
+            amendment_stats.suppressed += 1
+            return True
+        self.sent += 1
+        amendment_stats.sent += 1
+        return False
+
+
+class BotState:
+    """Order bookkeeping of one bot, owned by its `run_bot` coroutine.
+
+    Replaces the module-level per-symbol dicts, so any number of bots (even on
+    the same symbol) can share a process. Order ids are registered in
+    `order_index` for the fill handlers and released by `release`.
+    """
+
+    __slots__ = ("symbol", "order_status", "target_order_status", "target_order_qty",
+                 "buy_order_counter", "buy_order_id", "buy_order_status", "quantity_after_fee",
+                 "target_counter", "target_order_id", "target_order_count", "take_profit_status",
+                 "open_orders", "events", "__weakref__")
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.open_orders = OpenOrders()
+        self.events = None  # `BotEvents` the fills are published to
+        self.buy_order_id = 0
+        self.target_order_id = 0
+        self.reset()
+
+    def reset(self):
+        """Back to no order and no position, e.g. once the take profit filled."""
+        self.release()
+
+        self.order_status = OrderStatus.OPEN_ORDER
+        self.target_order_status = OrderStatus.OPEN_ORDER
+        self.target_order_qty = 0
+
+        # BUY order
+        self.buy_order_counter = 0
+        self.buy_order_id = 0
+        self.buy_order_status = OrderStatus.OPEN_ORDER
+        self.quantity_after_fee = 0
+
+        # Take profit order
+        self.target_counter = 0
+        self.target_order_id = 0
+        self.target_order_count = 0
+        self.take_profit_status = TakeProfitStatus.NOT_PLACED
+
+    def snapshot(self):
+        """The orders and position of the bot, stored on its trade so a restarted bot can pick them up."""
+        return {
+            "buy_order_id": self.buy_order_id,
+            "target_order_id": self.target_order_id,
+            "target_order_qty": self.target_order_qty,
+            "position": self.order_status == OrderStatus.POSITION,
+            "take_profit_placed": self.take_profit_status == TakeProfitStatus.PLACED,
+        }
+
+    def set_buy_order_id(self, order_id):
+        order_index.discard(self.symbol, self.buy_order_id)
+        self.buy_order_id = order_id
+        order_index.add(self, order_id)
+
+    def set_target_order_id(self, order_id):
+        order_index.discard(self.symbol, self.target_order_id)
+        self.target_order_id = order_id
+        order_index.add(self, order_id)
+
+    def release(self):
+        """Drop this bot's orders from `order_index`."""
+        order_index.discard(self.symbol, self.buy_order_id)
+        order_index.discard(self.symbol, self.target_order_id)
+        self.open_orders.orders.clear()
+
+
+def apply_execution_report(report):
+    """Apply an `executionReport` from the user data stream to the open orders of the bot that owns the order."""
+    state = order_index.get(report.get('s'), report.get('i'))
+    if state is not None:
+        state.open_orders.apply_report(report)
+    if report.get('X') == 'FILLED':
+        apply_fill(report)
+    return state
+
+
+def apply_fill(order_data):
+    """Apply a FILLED `executionReport` from the user data stream to the bot that owns the order."""
+    order_type = order_data.get('S')
+    order_symbol = order_data.get('s')
+    order_id = order_data.get('i')
+    order_qty = order_data.get('q')
+
+    # Fills of orders no running bot owns are only logged
+    state = order_index.get(order_symbol, order_id)
+
+    if state is not None and order_type == 'BUY' and order_id == state.buy_order_id:
+        state.order_status = OrderStatus.POSITION
+        state.target_order_qty = float(order_qty)
+
+    if state is not None and order_type == 'SELL' and order_id == state.target_order_id:
+        state.target_order_status = OrderStatus.POSITION
+
+    if state is not None and state.events is not None:
+        state.events.emit_soon("fill", side=order_type, order_id=order_id, quantity=float(order_qty),
+                               price=float(order_data.get('L', 0)))
+
+    logger.info("[%s] %s Order { %s } is FILLED" % (order_symbol, order_type, order_id))
+    return state
@@ -0,0 +1,231 @@
+import datetime
+import logging
+import struct
+import threading
+import time
+
+import numpy as np
+import redis
+
+logger = logging.getLogger(__name__)
+
+INTERVAL_MS = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 3_600_000,
+    "2h": 2 * 3_600_000,
+    "4h": 4 * 3_600_000,
+    "6h": 6 * 3_600_000,
+    "8h": 8 * 3_600_000,
+    "12h": 12 * 3_600_000,
+    "1d": 86_400_000,
+    "3d": 3 * 86_400_000,
+    "1w": 7 * 86_400_000,
+}
+
+# Column order of every candle row: open time (ms), open, high, low, close, volume
+COLUMNS = ("t", "o", "h", "l", "c", "v")
+CANDLE_FORMAT = struct.Struct("<q5d")
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def parse_rest_kline(row):
+    return (int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]))
+
+
+def closed_klines(raw):
+    """Parse `/api/v3/klines` rows, skipping the candle that is still forming."""
+    cutoff = now_ms()
+    return [parse_rest_kline(row) for row in raw if int(row[6]) < cutoff]
+
+
+class CandleRing:
+    """Bounded ring of closed candles for one (symbol, interval).
+
+    Rows are written twice, at `i` and `i + capacity`, so the newest `n <= capacity`
+    candles are always one contiguous slice and can be handed out as a
+    read-only NumPy view. A view stays valid for `capacity - n` further appends;
+    all `capacity` candles would be overwritten by the next one, so they are
+    handed out as a copy. `clear` starts a new buffer, leaving earlier views intact.
+    """
+
+    def __init__(self, interval, capacity):
+        self.interval_ms = INTERVAL_MS[interval]
+        self.capacity = capacity
+        self.data = np.zeros((2 * capacity, len(COLUMNS)))
+        self.write_pos = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def last_open_time(self):
+        if self.size == 0:
+            return None
+        return int(self.data[self.write_pos + self.capacity - 1, 0])
+
+    def is_current(self, at_ms):
+        """True when the most recently closed candle at `at_ms` is already stored."""
+        last = self.last_open_time()
+        return last is not None and last + 2 * self.interval_ms > at_ms
+
+    def append(self, candle):
+        """Append a closed candle. Returns False if it would leave a gap."""
+        last = self.last_open_time()
+        if last is not None:
+            if candle[0] <= last:
+                return True  # Already have it
+            if candle[0] != last + self.interval_ms:
+                return False
+
+        self.data[self.write_pos] = candle
+        self.data[self.write_pos + self.capacity] = candle
+        self.write_pos = (self.write_pos + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return True
+
+    def clear(self):
+        self.data = np.zeros_like(self.data)
+        self.write_pos = 0
+        self.size = 0
+
+    def tail(self, n=None):
+        """Read-only view of the newest `n` candles (all stored candles by default)."""
+        n = self.size if n is None else min(n, self.size)
+        end = self.write_pos + self.capacity
+        view = self.data[end - n:end]
+        if n == self.capacity:
+            view = view.copy()
+        view.flags.writeable = False
+        return view
+
+    def since(self, start_ms):
+        """Read-only view of the stored candles with open time >= `start_ms`."""
+        end = self.write_pos + self.capacity
+        open_times = self.data[end - self.size:end, 0]
+        return self.tail(self.size - np.searchsorted(open_times, start_ms))
+
+
+class CandleStore:
+    """Closed candles keyed by (symbol, interval), shared by bots and worker processes.
+
+    Each process keeps a `CandleRing` per key; Redis holds the same candles in a
+    sorted set (score = open time, member = packed row) trimmed to `capacity`, so
+    a worker that starts or reconnects pulls the tail another worker already
+    downloaded instead of going to the REST API. Only the candles missing after
+    the newest known one are ever requested from Binance.
+    """
+
+    def __init__(self, redis_client=None, capacity=1000, key_prefix="candles", rest_page_limit=1000):
+        self.redis = redis_client
+        self.capacity = capacity
+        self.key_prefix = key_prefix
+        self.rest_page_limit = rest_page_limit
+        self.rings = {}
+        self.lock = threading.Lock()
+
+    def key(self, symbol, interval):
+        return f"{self.key_prefix}:{symbol}:{interval}"
+
+    def ring(self, symbol, interval):
+        with self.lock:
+            ring = self.rings.get((symbol, interval))
+            if ring is None:
+                ring = CandleRing(interval, self.capacity)
+                self.rings[(symbol, interval)] = ring
+            return ring
+
+    def drop(self, symbol, interval):
+        """Release the local ring; the Redis copy stays for other workers."""
+        with self.lock:
+            self.rings.pop((symbol, interval), None)
+
+    def append(self, symbol, interval, candle):
+        """Add one closed candle pushed by the exchange. Returns False on a gap."""
+        ring = self.ring(symbol, interval)
+        with ring.lock:
+            if not ring.append(candle):
+                return False
+        self.publish(symbol, interval, [candle])
+        return True
+
+    def window(self, symbol, interval, start_ms=0):
+        """`getChart`-style slice: read-only view of candles with open time >= `start_ms`."""
+        ring = self.ring(symbol, interval)
+        with ring.lock:
+            return ring.since(start_ms)
+
+    def fill_tail(self, rest_client, symbol, interval, limit=500):
+        """Bring the ring up to the last closed candle: Redis first, then REST for what is still missing.
+
+        `limit` is the number of candles fetched when nothing is known yet.
+        Returns the number of candles downloaded from the REST API.
+        """
+        ring = self.ring(symbol, interval)
+        self.sync(symbol, interval)
+
+        fetched = 0
+        while not ring.is_current(now_ms()):
+            last = ring.last_open_time()
+            if last is None:
+                raw = rest_client.getKlines(symbol, interval, limit=limit)
+            else:
+                start_t = datetime.datetime.fromtimestamp((last + ring.interval_ms) / 1000, datetime.timezone.utc)
+                raw = rest_client.getKlines(symbol, interval, start_t=start_t, limit=self.rest_page_limit)
+
+            candles = closed_klines(raw)
+            if not candles:
+                break
+
+            with ring.lock:
+                for candle in candles:
+                    if not ring.append(candle):
+                        # The exchange has a hole in its history, restart the ring after it
+                        ring.clear()
+                        ring.append(candle)
+            self.publish(symbol, interval, candles)
+            fetched += len(candles)
+
+        return fetched
+
+    def sync(self, symbol, interval):
+        """Pull candles newer than the local tail that other workers stored in Redis."""
+        if self.redis is None:
+            return 0
+
+        ring = self.ring(symbol, interval)
+        last = ring.last_open_time()
+        try:
+            if last is None:
+                members = self.redis.zrange(self.key(symbol, interval), 0, -1)
+            else:
+                members = self.redis.zrangebyscore(self.key(symbol, interval), f"({last}", "+inf")
+        except redis.RedisError as e:
+            logger.error(f"[CandleStore] Redis read failed for {symbol} {interval}: {e}")
+            return 0
+
+        synced = 0
+        with ring.lock:
+            for member in members:
+                candle = CANDLE_FORMAT.unpack(member)
+                if not ring.append(candle):
+                    break  # Redis has a hole too, REST will fill it
+                synced += 1
+        return synced
+
+    def publish(self, symbol, interval, candles):
+        if self.redis is None:
+            return
+
+        key = self.key(symbol, interval)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zadd(key, {CANDLE_FORMAT.pack(int(c[0]), *c[1:6]): int(c[0]) for c in candles})
+            pipe.zremrangebyrank(key, 0, -self.capacity - 1)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"[CandleStore] Redis write failed for {symbol} {interval}: {e}")
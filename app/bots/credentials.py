@@ -0,0 +1,136 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cryptography.fernet import Fernet, MultiFernet
+
+from .aws_secret import get_secret
+
+logger = logging.getLogger(__name__)
+
+
+def parse_keys(secret):
+    """Fernet keys of the encryption secret: comma-separated, newest (the one that encrypts) first."""
+    if isinstance(secret, bytes):
+        secret = secret.decode()
+    keys = [key.strip() for key in secret.split(",") if key.strip()]
+    if not keys:
+        raise ValueError("The encryption secret holds no key")
+    return keys
+
+
+class CredentialCipher:
+    """Encrypts and decrypts the users' exchange credentials with the keys of the encryption secret.
+
+    The keys are fetched on first use and refreshed every `refresh_interval`
+    seconds by a background thread, never on the import path. With several
+    keys in the secret, the first encrypts and all of them decrypt
+    (`MultiFernet`), so a key can be rotated in without breaking stored
+    credentials; `rotate` re-encrypts a token with the newest key.
+    Decrypted credentials are kept for `cache_ttl` seconds, at most
+    `cache_size` of them, so runners restarting bots skip the decryption.
+    """
+
+    def __init__(self, load_secret, refresh_interval=3600, cache_size=1024, cache_ttl=3600):
+        self.load_secret = load_secret
+        self.refresh_interval = refresh_interval
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.keys = None
+        self.cipher = None
+        self.lock = threading.Lock()
+        self.refresher = None
+        self.decrypted = OrderedDict()  # token -> (expires at, plaintext)
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """The cipher, fetching the keys (and starting the refresher) on first use."""
+        cipher = self.cipher
+        if cipher is not None:
+            return cipher
+        with self.lock:
+            if self.cipher is None:
+                self.set_keys(parse_keys(self.load_secret()))
+                if self.refresh_interval:
+                    self.refresher = threading.Thread(target=self.refresh_forever, name="secret-refresh", daemon=True)
+                    self.refresher.start()
+            return self.cipher
+
+    def set_keys(self, keys):
+        self.keys = keys
+        self.cipher = MultiFernet([Fernet(key) for key in keys])
+
+    def refresh(self):
+        keys = parse_keys(self.load_secret())
+        with self.lock:
+            if keys != self.keys:
+                self.set_keys(keys)
+                logger.info(f"[Credentials] Encryption keys refreshed ({len(keys)} active)")
+
+    def refresh_forever(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep the keys we have; they stay valid until the secret drops them
+                logger.error(f"[Credentials] Could not refresh the encryption keys: {e}")
+
+    def encrypt(self, plaintext):
+        return self.load().encrypt(plaintext.encode()).decode()
+
+    def decrypt(self, token):
+        now = time.monotonic()
+        with self.lock:
+            cached = self.decrypted.get(token)
+            if cached is not None and cached[0] > now:
+                self.decrypted.move_to_end(token)
+                self.hits += 1
+                return cached[1]
+
+        plaintext = self.load().decrypt(token.encode()).decode()
+        with self.lock:
+            self.misses += 1
+            self.decrypted[token] = (now + self.cache_ttl, plaintext)
+            self.decrypted.move_to_end(token)
+            while len(self.decrypted) > self.cache_size:
+                self.decrypted.popitem(last=False)
+        return plaintext
+
+    def rotate(self, token):
+        """`token` re-encrypted with the newest key."""
+        return self.load().rotate(token.encode()).decode()
+
+    def stats(self):
+        with self.lock:
+            return {"keys": len(self.keys or ()), "cached": len(self.decrypted), "hits": self.hits,
+                    "misses": self.misses}
+
+
+_cipher = None
+_cipher_lock = threading.Lock()
+
+
+def load_encryption_secret():
+    # ENCRYPTION_KEYS stands in for Secrets Manager locally, e.g. in development and the import budget check
+    local_keys = os.getenv('ENCRYPTION_KEYS')
+    if local_keys:
+        return local_keys
+    return get_secret(os.getenv('SECRET_NAME'))
+
+
+def get_cipher():
+    """Process-wide cipher on the SECRET_NAME secret, tuned by SECRET_REFRESH_INTERVAL and CREDENTIAL_CACHE_*."""
+    global _cipher
+    with _cipher_lock:
+        if _cipher is None:
+            _cipher = CredentialCipher(
+                load_encryption_secret,
+                refresh_interval=float(os.getenv("SECRET_REFRESH_INTERVAL", "3600")),
+                cache_size=int(os.getenv("CREDENTIAL_CACHE_SIZE", "1024")),
+                cache_ttl=float(os.getenv("CREDENTIAL_CACHE_TTL", "3600")),
+            )
+        return _cipher
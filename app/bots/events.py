@@ -0,0 +1,60 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from redis.exceptions import RedisError
+
+from ..logging_config import log_context
+from ..redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+EVENT_STREAM = "bot_events"
+EVENT_STREAM_MAXLEN = int(os.getenv("BOT_EVENTS_MAXLEN", "100000"))
+
+# Task ids of bots to stop, followed by every bot runner
+ABORT_CHANNEL = "bots:abort"
+
+
+class BotEvents:
+    """Publishes what one bot does to the `bot_events` Redis stream, read by the API's live endpoint.
+
+    Events carry the user, trade and ticker of the bot. Publishing never fails
+    the bot: if Redis is unavailable the event is logged and dropped.
+    """
+
+    def __init__(self, user_id, trade_id, ticker):
+        self.user_id = user_id
+        self.trade_id = trade_id
+        self.ticker = ticker
+
+    async def emit(self, event_type, **data):
+        event = {"type": event_type, "user_id": self.user_id, "trade_id": self.trade_id, "ticker": self.ticker,
+                 "ts": int(time.time() * 1000), **data}
+        try:
+            await get_async_redis().xadd(EVENT_STREAM, {"user_id": self.user_id or "", "event": json.dumps(event)},
+                                         maxlen=EVENT_STREAM_MAXLEN, approximate=True)
+        except RedisError as e:
+            logger.error(f"[Events] Could not publish {event_type} of trade {self.trade_id}: {e}")
+
+    async def emit_as_bot(self, event_type, **data):
+        # Fills are emitted from the account's shared user data task, log under this bot instead
+        log_context.set({"trade_id": self.trade_id, "symbol": self.ticker, "user_id": self.user_id})
+        await self.emit(event_type, **data)
+
+    def emit_soon(self, event_type, **data):
+        """`emit` in the background, for the bot's hot path and synchronous code such as the fill handler."""
+        task = asyncio.get_running_loop().create_task(self.emit_as_bot(event_type, **data))
+        # The loop only keeps weak references to tasks
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+
+
+_pending = set()
+
+
+def publish_abort(redis_client, task_id):
+    """Tell whichever runner hosts `task_id` to stop it; await the result with a redis.asyncio client."""
+    return redis_client.publish(ABORT_CHANNEL, task_id)
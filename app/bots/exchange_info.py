@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "tradelikebot-exchange-info.json")
+
+
+class SymbolInfo:
+    """The exchangeInfo fields the bot needs for one symbol."""
+
+    __slots__ = ("symbol", "tick_size", "qty_step", "base_asset", "quote_asset", "fetched_at")
+
+    def __init__(self, symbol, tick_size, qty_step, base_asset, quote_asset, fetched_at):
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self.qty_step = qty_step
+        self.base_asset = base_asset
+        self.quote_asset = quote_asset
+        self.fetched_at = fetched_at
+
+    @classmethod
+    def from_exchange_info(cls, raw, fetched_at):
+        tick_size = 0
+        qty_step = 0
+
+        for f in raw["filters"]:
+            if f["filterType"] == "PRICE_FILTER":
+                tick_size = float(f["tickSize"])
+            elif f["filterType"] == "LOT_SIZE":
+                qty_step = float(f["stepSize"])
+
+        return cls(raw["symbol"], tick_size, qty_step, raw["baseAsset"], raw["quoteAsset"], fetched_at)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ExchangeInfoCache:
+    """Process-wide exchange metadata, looked up and downloaded one symbol at a time.
+
+    Entries are keyed by (base url, symbol) since the testnet lists different
+    filters, expire after `ttl` seconds and are persisted to `path` so a
+    restarted worker starts warm. If a refresh fails the stale entry is served.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def peek(self, base_url, symbol):
+        """Cached entry for `symbol`, even past its TTL, without any I/O."""
+        with self.lock:
+            if self.entries is None:
+                self.entries = self.load()
+            return self.entries.get(f"{base_url}|{symbol}")
+
+    def get(self, rest_client, symbol):
+        key = f"{rest_client.baseurl}|{symbol}"
+
+        with self.lock:
+            if self.entries is None:
+                self.entries = self.load()
+            info = self.entries.get(key)
+
+        if info is not None and time.time() - info.fetched_at < self.ttl:
+            return info
+
+        try:
+            raw = rest_client.getExchangeInfo(symbol)
+            if not raw.get("symbols"):
+                raise ValueError(raw)
+            fresh = SymbolInfo.from_exchange_info(raw["symbols"][0], time.time())
+        except Exception as e:
+            if info is not None:
+                logger.error(f"[ExchangeInfo] Refresh failed for {symbol}, serving cached filters: {e}")
+                return info
+            raise ValueError(f"Unable to load exchange info for {symbol}: {e}")
+
+        with self.lock:
+            self.entries[key] = fresh
+            self.save()
+        return fresh
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return {key: SymbolInfo(**value) for key, value in json.load(f).items()}
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"[ExchangeInfo] Ignoring unreadable cache file {self.path}: {e}")
+            return {}
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({key: info.to_dict() for key, info in self.entries.items()}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"[ExchangeInfo] Could not persist cache to {self.path}: {e}")
+
+
+exchange_info_cache = ExchangeInfoCache(os.getenv("EXCHANGE_INFO_CACHE_PATH", DEFAULT_CACHE_PATH),
+                                        ttl=int(os.getenv("EXCHANGE_INFO_TTL", "3600")))
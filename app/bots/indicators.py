@@ -0,0 +1,192 @@
+import math
+from collections import deque
+
+NaN = float("nan")
+
+
+class RollingStats:
+    """Rolling mean and sample standard deviation over the last `window` values.
+
+    Matches `Series.rolling(window).mean()` / `.std()`: NaN until the window is
+    full, ddof=1. Each update is O(1) (Welford add/remove); the sums are
+    recomputed from the window every `resync_every` updates so rounding error
+    cannot accumulate on long-running streams.
+    """
+
+    def __init__(self, window, resync_every=1000):
+        self.window = window
+        self.resync_every = resync_every
+        self.values = deque(maxlen=window)
+        self.mean_x = 0.0
+        self.m2 = 0.0
+        self.same_value_count = 0
+        self.updates = 0
+
+    def update(self, x):
+        if len(self.values) == self.window:
+            old = self.values[0]
+            old_mean = self.mean_x
+            self.mean_x += (x - old) / self.window
+            self.m2 += (x - old) * (x - self.mean_x + old - old_mean)
+        else:
+            n = len(self.values) + 1
+            delta = x - self.mean_x
+            self.mean_x += delta / n
+            self.m2 += delta * (x - self.mean_x)
+
+        if self.values and x == self.values[-1]:
+            self.same_value_count += 1
+        else:
+            self.same_value_count = 1
+        self.values.append(x)
+
+        self.updates += 1
+        if self.updates % self.resync_every == 0:
+            self.resync()
+
+    def resync(self):
+        n = len(self.values)
+        self.mean_x = sum(self.values) / n if n else 0.0
+        self.m2 = sum((v - self.mean_x) ** 2 for v in self.values)
+
+    @property
+    def ready(self):
+        return len(self.values) == self.window
+
+    @property
+    def mean(self):
+        return self.mean_x if self.ready else NaN
+
+    @property
+    def std(self):
+        if not self.ready:
+            return NaN
+        if self.window == 1:
+            return NaN
+        if self.same_value_count >= self.window:
+            return 0.0
+        return math.sqrt(max(self.m2, 0.0) / (self.window - 1))
+
+
+class EMA:
+    """Recursive exponential moving average, equivalent to `Series.ewm(span=span, adjust=adjust).mean()`."""
+
+    def __init__(self, span, adjust=True):
+        self.alpha = 2.0 / (span + 1)
+        self.adjust = adjust
+        self.numerator = 0.0
+        self.denominator = 0.0
+        self.value = NaN
+
+    def update(self, x):
+        if self.adjust:
+            # Weighted average with weights (1 - alpha)^i, kept as running sums
+            self.numerator = x + (1 - self.alpha) * self.numerator
+            self.denominator = 1 + (1 - self.alpha) * self.denominator
+            self.value = self.numerator / self.denominator
+        elif math.isnan(self.value):
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+
+class MACD:
+    """MACD line, signal line, histogram and crossover of the MACD/signal lines."""
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.fast = EMA(fast, adjust=False)
+        self.slow = EMA(slow, adjust=False)
+        self.signal = EMA(signal, adjust=False)
+        self.line = NaN
+        self.signal_line = NaN
+        self.histogram = NaN
+        self.crossover = 0
+
+    def update(self, x):
+        prev_line, prev_signal = self.line, self.signal_line
+
+        self.line = self.fast.update(x) - self.slow.update(x)
+        self.signal_line = self.signal.update(self.line)
+        self.histogram = self.line - self.signal_line
+
+        # NaN comparisons are False, like the shift(1) of the first row in pandas
+        if self.line > self.signal_line and prev_line < prev_signal:
+            self.crossover = 1
+        elif self.line < self.signal_line and prev_line > prev_signal:
+            self.crossover = -1
+        else:
+            self.crossover = 0
+
+
+class IndicatorEngine:
+    """Running state of every indicator the strategy reads, updated once per closed candle.
+
+    Replaces the DataFrame recompute of `get_chart_data` / `get_latest_bbands`:
+    Bollinger bands over `band_window` closes, the short/long/regime EMAs and
+    their filters, the band width filter and MACD(12, 26, 9).
+    """
+
+    def __init__(self, band_window=20, band_std=2, ema_short_period=45, ema_long_period=100, regime_filter=480,
+                 band_width_filter=1.03):
+        self.band_std = band_std
+        self.band_width_filter = band_width_filter
+        self.bands = RollingStats(band_window)
+        self.ema_short = EMA(ema_short_period)
+        self.ema_long = EMA(ema_long_period)
+        self.ema_regime = EMA(regime_filter)
+        self.macd = MACD()
+
+        self.last_open_time = None
+        self.close = NaN
+        self.rolling_mean = NaN
+        self.rolling_std = NaN
+        self.upper_band = NaN
+        self.lower_band = NaN
+
+    def update(self, candle):
+        """Consume one closed (open_time_ms, open, high, low, close, volume) candle or candle-store row.
+
+        Candles at or before the last consumed one are ignored, so overlapping
+        windows can be fed without double counting.
+        """
+        if self.last_open_time is not None and candle[0] <= self.last_open_time:
+            return False
+
+        close = float(candle[4])
+        self.last_open_time = int(candle[0])
+        self.close = close
+
+        self.bands.update(close)
+        self.rolling_mean = self.bands.mean
+        self.rolling_std = self.bands.std
+        self.upper_band = self.rolling_mean + self.band_std * self.rolling_std
+        self.lower_band = self.rolling_mean - self.band_std * self.rolling_std
+
+        self.ema_short.update(close)
+        self.ema_long.update(close)
+        self.ema_regime.update(close)
+        self.macd.update(close)
+        return True
+
+    def update_many(self, candles):
+        updated = 0
+        for candle in candles:
+            updated += self.update(candle)
+        return updated
+
+    @property
+    def ema_trend_filter(self):
+        return self.ema_short.value > self.ema_long.value
+
+    @property
+    def ema_regime_filter(self):
+        return self.close > self.ema_regime.value
+
+    @property
+    def bbands_width_filter(self):
+        return self.upper_band / self.lower_band > self.band_width_filter
+
+    @property
+    def macd_above_0(self):
+        return self.macd.histogram > 0
@@ -0,0 +1,204 @@
+import argparse
+import datetime
+import logging
+import os
+import struct
+import time
+
+import numpy as np
+
+from .candle_store import COLUMNS, INTERVAL_MS, now_ms
+from .transport import get_transport
+
+logger = logging.getLogger(__name__)
+
+BASE_URLS = {
+    False: "https://api.binance.com",
+    True: "https://testnet.binance.vision",
+}
+
+MAGIC = b"TLBKLN01"
+HEADER = struct.Struct("<8sqqq")  # magic, count, capacity, interval_ms
+HEADER_SIZE = 64
+DTYPES = (np.int64,) + (np.float64,) * (len(COLUMNS) - 1)
+
+
+def archive_path(root, symbol, interval):
+    return os.path.join(root, f"{symbol}-{interval}.klines")
+
+
+class KlineArchive:
+    """Closed klines of one (symbol, interval) in a single memory-mapped columnar file.
+
+    Layout: a 64-byte header (magic, count, capacity, interval_ms) followed by
+    one fixed-size region per column of `COLUMNS` (open time as int64, prices
+    and volume as float64), each `capacity` rows long. `column` and `columns`
+    are read-only views into the mapping, so readers never copy the data.
+    Open with `mode="r+"` to append. Appends write the rows first and the new
+    count last, so a crash never exposes a half-written candle; when full, the
+    file is rewritten with twice the capacity.
+    """
+
+    def __init__(self, path, interval=None, mode="r", initial_capacity=1 << 16):
+        self.path = path
+        self.mode = mode
+        self.mm = None
+        if not os.path.exists(path):
+            if interval is None or mode == "r":
+                raise FileNotFoundError(path)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            self.create(tmp_path, INTERVAL_MS[interval], initial_capacity)
+            os.replace(tmp_path, path)
+        self.open()
+
+    @staticmethod
+    def create(path, interval_ms, capacity, count=0):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, count, capacity, interval_ms).ljust(HEADER_SIZE, b"\0"))
+            f.truncate(HEADER_SIZE + capacity * 8 * len(COLUMNS))
+
+    def open(self):
+        self.mm = np.memmap(self.path, dtype=np.uint8, mode=self.mode)
+        magic, _, self.capacity, self.interval_ms = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a kline archive")
+
+    @property
+    def count(self):
+        return HEADER.unpack_from(self.mm, 0)[1]
+
+    def region(self, i, capacity=None, mm=None):
+        capacity = capacity or self.capacity
+        mm = self.mm if mm is None else mm
+        return np.ndarray((capacity,), dtype=DTYPES[i], buffer=mm, offset=HEADER_SIZE + i * capacity * 8)
+
+    def column(self, name, start=0, stop=None):
+        """Read-only view of one column, e.g. `column("c")` for the closes."""
+        view = self.region(COLUMNS.index(name))[start:self.count if stop is None else stop]
+        view.flags.writeable = False
+        return view
+
+    def columns(self, start=0, stop=None):
+        return {name: self.column(name, start, stop) for name in COLUMNS}
+
+    def candles(self, start=0, stop=None):
+        """(n, 6) array in `COLUMNS` order, as the candle store and backtester use (this one is a copy)."""
+        return np.column_stack([self.column(name, start, stop) for name in COLUMNS]).astype(np.float64)
+
+    def since(self, start_ms):
+        """Index of the first candle with open time >= `start_ms`."""
+        return int(np.searchsorted(self.column("t"), start_ms))
+
+    def last_open_time(self):
+        count = self.count
+        return int(self.region(0)[count - 1]) if count else None
+
+    def append(self, rows):
+        """Append an (n, 6) array of closed candles; rows at or before the last stored one are skipped."""
+        last = self.last_open_time()
+        if last is not None:
+            rows = rows[rows[:, 0] > last]
+        if not len(rows):
+            return 0
+
+        count = self.count
+        if count + len(rows) > self.capacity:
+            self.grow(max(2 * self.capacity, count + len(rows)))
+
+        for i in range(len(COLUMNS)):
+            self.region(i)[count:count + len(rows)] = rows[:, i]
+        self.mm.flush()
+        HEADER.pack_into(self.mm, 0, MAGIC, count + len(rows), self.capacity, self.interval_ms)
+        self.mm.flush()
+        return len(rows)
+
+    def grow(self, capacity):
+        count = self.count
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        self.create(tmp_path, self.interval_ms, capacity, count=count)
+        new = np.memmap(tmp_path, dtype=np.uint8, mode="r+")
+        for i in range(len(COLUMNS)):
+            self.region(i, capacity, new)[:count] = self.region(i)[:count]
+        new.flush()
+        del new
+        self.close()
+        os.replace(tmp_path, self.path)
+        self.open()
+
+    def close(self):
+        # The mapping itself is released once no view handed out still references it
+        if self.mm is not None and self.mode != "r":
+            self.mm.flush()
+        self.mm = None
+
+
+def fetch_page(base_url, symbol, interval, start_ms, end_ms, limit=1000):
+    """One `/api/v3/klines` page as an (n, 6) array, parsed once; also returns the used request weight."""
+    params = {"symbol": symbol, "interval": interval, "startTime": start_ms, "endTime": end_ms, "limit": limit}
+    response = get_transport().request("GET", f"{base_url}/api/v3/klines", params=params)
+    response.raise_for_status()
+    raw = response.json()
+    cutoff = now_ms()
+    rows = np.array([row[:6] for row in raw if row[6] < cutoff], dtype=np.float64).reshape(-1, len(COLUMNS))
+    return rows, int(response.headers.get("X-MBX-USED-WEIGHT-1M", 0))
+
+
+def ingest(root, symbol, interval, start_ms, end_ms=None, test=False, max_weight=4800):
+    """Download klines of [start_ms, end_ms) into the archive of (symbol, interval), resuming after its last candle.
+
+    Pages of 1000 candles are requested back to back; when the minute's used
+    request weight passes `max_weight` the ingester waits for the next minute.
+    Returns the number of candles added.
+    """
+    os.makedirs(root, exist_ok=True)
+    archive = KlineArchive(archive_path(root, symbol, interval), interval, mode="r+")
+    interval_ms = INTERVAL_MS[interval]
+    end_ms = end_ms or now_ms()
+
+    last = archive.last_open_time()
+    cursor = max(start_ms, last + interval_ms) if last is not None else start_ms
+    added = 0
+    try:
+        while cursor < end_ms:
+            rows, weight = fetch_page(BASE_URLS[test], symbol, interval, cursor, end_ms - 1)
+            if not len(rows):
+                break
+            added += archive.append(rows)
+            cursor = int(rows[-1, 0]) + interval_ms
+            logger.info(f"[Ingest] {symbol} {interval}: {archive.count} candles, up to "
+                        f"{datetime.datetime.fromtimestamp(rows[-1, 0] / 1000, datetime.timezone.utc)}")
+
+            if weight > max_weight:
+                time.sleep(60 - time.time() % 60 + 1)
+    finally:
+        archive.close()
+    return added
+
+
+def parse_date(value):
+    date = datetime.datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return int(date.timestamp() * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download Binance klines into memory-mapped archives")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--interval", action="append", required=True, help="Repeatable, e.g. --interval 1m")
+    parser.add_argument("--start", required=True, help="ISO date, e.g. 2021-01-01")
+    parser.add_argument("--end", help="ISO date, defaults to now")
+    parser.add_argument("--root", default="data/klines")
+    parser.add_argument("--test", action="store_true", help="Use the testnet")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    for symbol in args.symbols:
+        for interval in args.interval:
+            added = ingest(args.root, symbol, interval, parse_date(args.start),
+                           parse_date(args.end) if args.end else None, test=args.test)
+            print(f"{symbol} {interval}: {added} candles added -> {archive_path(args.root, symbol, interval)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+import websocket
+
+from ..metrics import observe_message
+from ..redis_client import get_redis
+from .candle_store import CandleStore, now_ms
+
+logger = logging.getLogger(__name__)
+
+STREAM_URL = "wss://stream.binance.com:9443/stream"
+TESTNET_STREAM_URL = "wss://testnet.binance.vision/stream"
+
+
+def stream_name(symbol, interval):
+    return f"{symbol.lower()}@kline_{interval}"
+
+
+class KlineStream:
+    """Subscription state of a single (symbol, interval) kline stream.
+
+    The candles themselves live in the feed's `CandleStore`.
+    """
+
+    def __init__(self, symbol, interval):
+        self.symbol = symbol
+        self.interval = interval
+        self.subscribers = 0
+        self.rest_client = None
+        self.connection = None
+        self.condition = threading.Condition()
+
+    @property
+    def name(self):
+        return stream_name(self.symbol, self.interval)
+
+
+def parse_stream_kline(k):
+    return (int(k["t"]), float(k["o"]), float(k["h"]), float(k["l"]), float(k["c"]), float(k["v"]))
+
+
+class KlineConnection:
+    """One combined-stream WebSocket carrying up to `max_streams` of the feed's streams.
+
+    Binance drops a connection that sends more than 5 messages a second, so
+    SUBSCRIBE / UNSUBSCRIBE requests go through an outbox that a sender thread
+    drains `1 / messages_per_second` apart; the default of 4 leaves room for
+    the ping and pong frames, which count too. Callers never wait for it.
+    """
+
+    def __init__(self, feed, number, max_streams=1024, messages_per_second=4):
+        self.feed = feed
+        self.number = number
+        self.max_streams = max_streams
+        self.send_interval = 1 / messages_per_second
+        self.names = set()
+        self.ws = None
+        self.connected = False
+        self.thread = None
+        self.sender = None
+        self.outbox = queue.Queue()
+
+    def ensure_running(self):
+        with self.feed.lock:
+            if self.thread is not None:
+                return
+            self.ws = websocket.WebSocketApp(self.feed.stream_url,
+                                             on_open=self.on_open,
+                                             on_message=self.feed.on_message,
+                                             on_error=self.on_error,
+                                             on_close=self.on_close)
+            self.thread = threading.Thread(target=self.ws.run_forever,
+                                           kwargs={"ping_interval": 60, "reconnect": 5},
+                                           daemon=True)
+            self.sender = threading.Thread(target=self.send_queued, daemon=True)
+            self.thread.start()
+            self.sender.start()
+
+    def close(self):
+        """Stop the sender and the WebSocket, e.g. once the connection carries no streams."""
+        self.outbox.put(None)
+        if self.ws is not None:
+            self.ws.close()
+        logger.info(f"[MarketData] Closing connection {self.number}, it has no streams left")
+
+    def send_method(self, method, params):
+        """Queue a request; it is dropped if the connection is down, `on_open` subscribes everything again."""
+        if self.connected and params:
+            self.outbox.put((method, params))
+
+    def send_queued(self):
+        next_send = 0.0
+        while True:
+            item = self.outbox.get()
+            if item is None:
+                return
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if not self.connected:
+                continue
+            next_send = time.monotonic() + self.send_interval
+            method, params = item
+            message = json.dumps({"method": method, "params": params, "id": self.feed.next_request_id()})
+            try:
+                self.ws.send(message)
+            except Exception as e:
+                logger.error(f"[MarketData] Failed to send {method} {params} on connection {self.number}: {e}")
+
+    def on_open(self, ws):
+        self.connected = True
+        with self.feed.lock:
+            names = sorted(self.names)
+        # Candles closed while disconnected are backfilled lazily by get_klines
+        self.send_method("SUBSCRIBE", names)
+        logger.info(f"[MarketData] Connection {self.number} opened ({len(names)} streams)")
+
+    def on_error(self, ws, error):
+        logger.error(f"[MarketData] WebSocket error on connection {self.number}: {error}")
+
+    def on_close(self, ws, close_status_code=None, close_msg=None):
+        self.connected = False
+        logger.info(f"[MarketData] Connection {self.number} closed ({close_status_code} {close_msg})")
+
+
+class MarketDataFeed:
+    """Multiplexed kline WebSockets shared by every bot of the process.
+
+    Bots `subscribe` to a (symbol, interval) pair; the first subscriber
+    backfills the stream and adds it to a combined stream, later subscribers
+    just share it. A connection carries at most `max_streams` streams (Binance
+    allows 1024), more streams open further connections. Closed candles pushed
+    by Binance are appended to the shared `CandleStore`, and `get_klines` only
+    falls back to Redis/REST when the stream has a gap, e.g. after a reconnect.
+    """
+
+    def __init__(self, candle_store, stream_url=STREAM_URL, backfill_limit=500, close_wait=5, max_streams=1024,
+                 messages_per_second=4):
+        self.candle_store = candle_store
+        self.stream_url = stream_url
+        self.backfill_limit = backfill_limit
+        self.close_wait = close_wait
+        self.max_streams = max_streams
+        self.messages_per_second = messages_per_second
+        self.streams = {}
+        self.connections = []
+        self.opened = 0
+        self.lock = threading.Lock()
+        self.request_id = 0
+
+    def next_request_id(self):
+        with self.lock:
+            self.request_id += 1
+            return self.request_id
+
+    def connection_for(self, name):
+        """Add `name` to the first connection with room for it, opening a new one when all are full."""
+        for connection in self.connections:
+            if len(connection.names) < connection.max_streams:
+                break
+        else:
+            self.opened += 1
+            connection = KlineConnection(self, self.opened, self.max_streams, self.messages_per_second)
+            self.connections.append(connection)
+        connection.names.add(name)
+        return connection
+
+    def subscribe(self, rest_client, symbol, interval):
+        """Register interest in a (symbol, interval) stream and return it."""
+        name = stream_name(symbol, interval)
+
+        with self.lock:
+            stream = self.streams.get(name)
+            new_stream = stream is None
+            if new_stream:
+                stream = KlineStream(symbol, interval)
+                stream.connection = self.connection_for(name)
+                self.streams[name] = stream
+            stream.subscribers += 1
+            stream.rest_client = rest_client
+
+        if new_stream:
+            self.backfill(stream)
+            stream.connection.send_method("SUBSCRIBE", [name])
+            logger.info(f"[MarketData] Subscribed to {name}")
+
+        stream.connection.ensure_running()
+        return stream
+
+    def unsubscribe(self, symbol, interval):
+        name = stream_name(symbol, interval)
+
+        with self.lock:
+            stream = self.streams.get(name)
+            if stream is None:
+                return
+            stream.subscribers -= 1
+            if stream.subscribers > 0:
+                return
+            del self.streams[name]
+            connection = stream.connection
+            connection.names.discard(name)
+            # A connection left without streams is closed, later streams open a new one
+            idle = not connection.names
+            if idle:
+                self.connections.remove(connection)
+
+        self.candle_store.drop(symbol, interval)
+        if idle:
+            connection.close()
+        else:
+            connection.send_method("UNSUBSCRIBE", [name])
+        logger.info(f"[MarketData] Unsubscribed from {name}")
+
+    def get_klines(self, symbol, interval, start_t=0):
+        """Closed candles of a subscribed stream with open time >= `start_t`.
+
+        Returns a read-only (n, 6) view into the candle store. Waits up to
+        `close_wait` seconds for the candle that just closed to be pushed over
+        the WebSocket before backfilling it.
+        """
+        stream = self.streams[stream_name(symbol, interval)]
+        ring = self.candle_store.ring(symbol, interval)
+
+        with stream.condition:
+            stream.condition.wait_for(lambda: ring.is_current(now_ms()), timeout=self.close_wait)
+
+        if not ring.is_current(now_ms()):
+            self.backfill(stream)
+
+        start_ms = int(start_t.timestamp() * 1000) if start_t != 0 else 0
+        return self.candle_store.window(symbol, interval, start_ms)
+
+    def backfill(self, stream):
+        """Fill the candles missing from the end of `stream` from Redis, then REST."""
+        fetched = self.candle_store.fill_tail(stream.rest_client, stream.symbol, stream.interval,
+                                              limit=self.backfill_limit)
+        with stream.condition:
+            stream.condition.notify_all()
+
+        if fetched:
+            logger.info(f"[MarketData] Backfilled {stream.name} over REST ({fetched} candles)")
+
+    def on_message(self, ws, message):
+        start = time.perf_counter()
+        data = json.loads(message)
+        if "stream" not in data:
+            return  # SUBSCRIBE / UNSUBSCRIBE acknowledgement
+
+        try:
+            k = data["data"].get("k")
+            if not k or not k.get("x"):
+                return  # Only closed candles are published
+
+            stream = self.streams.get(data["stream"])
+            if stream is None:
+                return
+
+            if self.candle_store.append(stream.symbol, stream.interval, parse_stream_kline(k)):
+                with stream.condition:
+                    stream.condition.notify_all()
+        finally:
+            observe_message("market", start, data["data"].get("E"))
+
+
+market_data_feeds = {}
+market_data_feeds_lock = threading.Lock()
+
+
+def get_market_data_feed(test=False):
+    """Process-wide feed for the live or the testnet stream endpoint."""
+    with market_data_feeds_lock:
+        if test not in market_data_feeds:
+            # Testnet candles differ from the live ones, so they get their own Redis keys
+            candle_store = CandleStore(get_redis(), key_prefix="candles:testnet" if test else "candles")
+            market_data_feeds[test] = MarketDataFeed(candle_store, TESTNET_STREAM_URL if test else STREAM_URL)
+        return market_data_feeds[test]
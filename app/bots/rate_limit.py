@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from urllib.parse import urlsplit
+
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+ORDER = "order"
+DEFAULT = "default"
+
+# Request weight of the endpoints the bots call (GET /api/v3/exchangeInfo costs 20 without a symbol)
+ENDPOINT_WEIGHTS = {
+    "/api/v3/klines": 2,
+    "/api/v3/exchangeInfo": 20,
+    "/api/v3/account": 20,
+    "/api/v3/order": 1,
+    "/api/v3/order/cancelReplace": 1,
+    "/api/v3/userDataStream": 2,
+}
+ORDER_PATHS = ("/api/v3/order", "/api/v3/order/cancelReplace")
+
+# KEYS: ban key, then one hash per bucket. ARGV: capacity, refill per ms, cost, floor for each bucket.
+# Takes the tokens from every bucket or from none; returns {0, 0}, or the milliseconds to wait before
+# retrying and 1 if the wait is a ban.
+ACQUIRE_SCRIPT = """
+local ban = redis.call('PTTL', KEYS[1])
+if ban > 0 then return {ban, 1} end
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local wait = 0
+local tokens = {}
+
+for i = 2, #KEYS do
+    local j = (i - 2) * 4
+    local capacity, rate = tonumber(ARGV[j + 1]), tonumber(ARGV[j + 2])
+    -- A request heavier than the bucket (or its reserve) still goes through once the bucket is full
+    local cost = math.min(tonumber(ARGV[j + 3]), capacity)
+    local floor = math.min(tonumber(ARGV[j + 4]), capacity - cost)
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local available = tonumber(bucket[1]) or capacity
+    available = math.min(capacity, available + (now - (tonumber(bucket[2]) or now)) * rate)
+    tokens[i] = available - cost
+    if available - cost < floor then
+        wait = math.max(wait, math.ceil((cost + floor - available) / rate))
+    end
+end
+
+for i = 2, #KEYS do
+    local j = (i - 2) * 4
+    local capacity, rate = tonumber(ARGV[j + 1]), tonumber(ARGV[j + 2])
+    if wait > 0 then tokens[i] = tokens[i] + math.min(tonumber(ARGV[j + 3]), capacity) end
+    redis.call('HSET', KEYS[i], 'tokens', tokens[i], 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(capacity / rate) + 1000)
+end
+return {wait, 0}
+"""
+
+# KEYS[1]: bucket. ARGV[1]: what the exchange says is left. Never lets the bucket hold more than that.
+SYNC_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens and tokens > tonumber(ARGV[1]) then
+    redis.call('HSET', KEYS[1], 'tokens', ARGV[1])
+end
+return 0
+"""
+
+
+class RateLimitError(Exception):
+    """The host banned this IP (418/429) and the ban outlasted the wait; sending now would extend it."""
+
+
+class Bucket:
+    """Token bucket parameters: `limit` units per `period` seconds, of which `safety` is used."""
+
+    def __init__(self, limit, period, safety=0.9, burst=None):
+        self.limit = limit
+        self.safety = safety
+        self.capacity = burst or limit * safety
+        self.rate_per_ms = limit * safety / (period * 1000)
+
+
+class RateLimiter:
+    """Binance request limits shared by every process through Redis token buckets.
+
+    Each request takes its endpoint weight from the REQUEST_WEIGHT bucket of
+    the host (Binance counts it per IP, so every worker behind `scope` shares
+    it) and, for orders, one unit from the ORDERS bucket of the account.
+    Order traffic may drain the weight bucket; other requests leave
+    `market_reserve` of it for orders. Buckets refill continuously, which
+    spreads the candle-close burst over time instead of failing it.
+
+    Response headers keep the buckets honest: `X-MBX-USED-WEIGHT-1M` and
+    `X-MBX-ORDER-COUNT-10S` cap the tokens at what the exchange says is left,
+    and a 429/418 blocks the host for its `Retry-After`. A request still
+    waiting for its tokens after `max_wait` seconds is sent anyway, one still
+    waiting out a ban raises `RateLimitError`. If Redis is down requests are
+    let through rather than blocking trading.
+    """
+
+    def __init__(self, client, scope="default", weight=None, orders=None, market_reserve=0.2, max_wait=30):
+        self.client = client
+        self.scope = scope
+        self.weight = weight or Bucket(6000, 60, burst=1200)
+        self.orders = orders or Bucket(100, 10, burst=50)
+        self.market_reserve = market_reserve
+        self.max_wait = max_wait
+        self.acquire_script = client.register_script(ACQUIRE_SCRIPT)
+        self.sync_script = client.register_script(SYNC_SCRIPT)
+        self.waits = 0
+        self.waited = 0.0
+        self.bans = 0
+
+    def weight_key(self, host):
+        return f"ratelimit:{self.scope}:{host}:weight"
+
+    def ban_key(self, host):
+        return f"ratelimit:{self.scope}:{host}:ban"
+
+    def order_key(self, host, api_key):
+        account = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        return f"ratelimit:{host}:{account}:orders"
+
+    def plan(self, method, url, headers):
+        """(keys, args, priority) of the acquire script for one request."""
+        parts = urlsplit(url)
+        host, path = parts.netloc, parts.path
+        priority = ORDER if method in ("POST", "DELETE") and path in ORDER_PATHS else DEFAULT
+
+        floor = 0 if priority == ORDER else self.market_reserve * self.weight.capacity
+        keys = [self.ban_key(host), self.weight_key(host)]
+        args = [self.weight.capacity, self.weight.rate_per_ms, ENDPOINT_WEIGHTS.get(path, 1), floor]
+
+        api_key = (headers or {}).get("X-MBX-APIKEY")
+        # Only new orders count towards the account's order limit, cancels just take weight
+        if method == "POST" and priority == ORDER and api_key:
+            keys.append(self.order_key(host, api_key))
+            args += [self.orders.capacity, self.orders.rate_per_ms, 1, 0]
+        return keys, args, priority
+
+    def observed(self, url, status, headers, request_headers=None):
+        """What a response implies: (bucket key, tokens left) pairs to sync and a ban in ms, if any."""
+        host = urlsplit(url).netloc
+        syncs = []
+        used = headers.get("X-MBX-USED-WEIGHT-1M")
+        if used is not None:
+            syncs.append((self.weight_key(host), max(self.weight.limit * self.weight.safety - int(used), 0)))
+        orders = headers.get("X-MBX-ORDER-COUNT-10S")
+        api_key = (request_headers or {}).get("X-MBX-APIKEY")
+        if orders is not None and api_key:
+            syncs.append((self.order_key(host, api_key), max(self.orders.limit * self.orders.safety - int(orders), 0)))
+
+        ban_ms = 0
+        if status in (418, 429):
+            ban_ms = int(float(headers.get("Retry-After", 60)) * 1000)
+            self.bans += 1
+            logger.error(f"[RateLimit] {host} answered {status}, pausing requests for {ban_ms / 1000:.0f}s")
+        return host, syncs, ban_ms
+
+    def give_up(self, url, banned, wait_ms):
+        """Called once `max_wait` is over: send the request, unless the host still bans this IP."""
+        if banned:
+            raise RateLimitError(f"{urlsplit(url).netloc} bans requests for another {wait_ms / 1000:.0f}s")
+
+    def record_wait(self, seconds):
+        self.waits += 1
+        self.waited += seconds
+
+    def acquire(self, method, url, headers=None):
+        """Block until the request may be sent; `RateLimitError` if the host still bans this IP after `max_wait`."""
+        keys, args, _ = self.plan(method, url, headers)
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            try:
+                wait_ms, banned = self.acquire_script(keys=keys, args=args, client=self.client)
+            except redis.RedisError as e:
+                logger.error(f"[RateLimit] Redis unavailable, sending without a limit: {e}")
+                return
+            if wait_ms <= 0:
+                return
+            if time.monotonic() >= deadline:
+                self.give_up(url, banned, wait_ms)
+                return
+            self.record_wait(wait_ms / 1000)
+            time.sleep(wait_ms / 1000)
+
+    def observe(self, url, status, headers, request_headers=None):
+        """Sync the buckets with the limits reported by a response."""
+        host, syncs, ban_ms = self.observed(url, status, headers, request_headers)
+        try:
+            for key, left in syncs:
+                self.sync_script(keys=[key], args=[left], client=self.client)
+            if ban_ms:
+                self.client.set(self.ban_key(host), status, px=ban_ms)
+        except redis.RedisError as e:
+            logger.error(f"[RateLimit] Could not record response limits: {e}")
+
+    def stats(self):
+        return {"waits": self.waits, "waited_s": self.waited, "bans": self.bans}
+
+
+class AsyncRateLimiter(RateLimiter):
+    """`RateLimiter` on a redis.asyncio client, for the transports running on an event loop."""
+
+    async def acquire(self, method, url, headers=None):
+        keys, args, _ = self.plan(method, url, headers)
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            try:
+                wait_ms, banned = await self.acquire_script(keys=keys, args=args, client=self.client)
+            except redis.RedisError as e:
+                logger.error(f"[RateLimit] Redis unavailable, sending without a limit: {e}")
+                return
+            if wait_ms <= 0:
+                return
+            if time.monotonic() >= deadline:
+                self.give_up(url, banned, wait_ms)
+                return
+            self.record_wait(wait_ms / 1000)
+            await asyncio.sleep(wait_ms / 1000)
+
+    async def observe(self, url, status, headers, request_headers=None):
+        host, syncs, ban_ms = self.observed(url, status, headers, request_headers)
+        try:
+            for key, left in syncs:
+                await self.sync_script(keys=[key], args=[left], client=self.client)
+            if ban_ms:
+                await self.client.set(self.ban_key(host), status, px=ban_ms)
+        except redis.RedisError as e:
+            logger.error(f"[RateLimit] Could not record response limits: {e}")
+
+
+def limiter_settings():
+    """RateLimiter keyword arguments from the RATE_LIMIT_* / BINANCE_* environment variables."""
+    safety = float(os.getenv("RATE_LIMIT_SAFETY", "0.9"))
+    return {
+        "scope": os.getenv("RATE_LIMIT_SCOPE", "default"),
+        "weight": Bucket(int(os.getenv("BINANCE_WEIGHT_LIMIT", "6000")), 60, safety,
+                         burst=int(os.getenv("RATE_LIMIT_WEIGHT_BURST", "1200"))),
+        "orders": Bucket(int(os.getenv("BINANCE_ORDER_LIMIT_10S", "100")), 10, safety,
+                         burst=int(os.getenv("RATE_LIMIT_ORDER_BURST", "50"))),
+        "market_reserve": float(os.getenv("RATE_LIMIT_MARKET_RESERVE", "0.2")),
+    }
+
+
+def rate_limit_enabled():
+    return os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+
+
+def new_rate_limiter():
+    from ..redis_client import get_redis
+    return RateLimiter(get_redis(), **limiter_settings())
+
+
+def new_async_rate_limiter():
+    from ..redis_client import REDIS_URL
+    return AsyncRateLimiter(aioredis.Redis.from_url(REDIS_URL), **limiter_settings())
@@ -0,0 +1,109 @@
+import asyncio
+import heapq
+import logging
+import weakref
+
+from .candle_store import INTERVAL_MS, now_ms
+
+logger = logging.getLogger(__name__)
+
+# Boundaries not aligned to the unix epoch: 3d candles count from 2017-08-17, weeks start on Monday
+INTERVAL_OFFSET_MS = {
+    "3d": 1502928000000 % INTERVAL_MS["3d"],
+    "1w": 4 * INTERVAL_MS["1d"],
+}
+
+
+def next_boundary(interval, at_ms):
+    """Open time (ms) of the first candle of `interval` starting after `at_ms`."""
+    interval_ms = INTERVAL_MS[interval]
+    offset = INTERVAL_OFFSET_MS.get(interval, 0)
+    return offset + ((at_ms - offset) // interval_ms + 1) * interval_ms
+
+
+class CandleScheduler:
+    """Sleeps bots until their next candle boundary.
+
+    Bots waiting for the same boundary share one future, and a single
+    `loop.call_at` timer is armed for the earliest pending boundary, so each
+    bot wakes once per candle and all bots on a boundary wake in one batch.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.heap = []
+        self.waiters = {}
+        self.counts = {}
+        self.timer = None
+        self.timer_at = None
+        self.batches = 0
+        self.woken = 0
+
+    async def wait_next(self, interval):
+        """Sleep until the next `interval` boundary and return its open time (ms)."""
+        boundary = next_boundary(interval, now_ms())
+        future = self.waiters.get(boundary)
+        if future is None:
+            future = self.waiters[boundary] = self.loop.create_future()
+            self.counts[boundary] = 0
+            heapq.heappush(self.heap, boundary)
+            self.arm()
+        self.counts[boundary] += 1
+
+        # Shielded so a cancelled bot does not cancel the batch it shares with others
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if boundary in self.counts:
+                self.counts[boundary] -= 1
+            raise
+
+    def arm(self):
+        if not self.heap:
+            return
+        earliest = self.heap[0]
+        if self.timer is not None:
+            if self.timer_at <= earliest:
+                return
+            self.timer.cancel()
+        delay = max(earliest - now_ms(), 0) / 1000
+        self.timer = self.loop.call_at(self.loop.time() + delay, self.fire)
+        self.timer_at = earliest
+
+    def fire(self):
+        self.timer = None
+        self.timer_at = None
+
+        now = now_ms()
+        while self.heap and self.heap[0] <= now:
+            boundary = heapq.heappop(self.heap)
+            future = self.waiters.pop(boundary)
+            count = self.counts.pop(boundary)
+            if not future.done():
+                future.set_result(boundary)
+            self.batches += 1
+            self.woken += count
+            logger.debug(f"[Scheduler] Woke {count} bots at boundary {boundary}")
+
+        # The monotonic loop clock may run slightly ahead of wall time, re-arm for whatever is left
+        self.arm()
+
+    def stats(self):
+        return {
+            "pending_boundaries": len(self.heap),
+            "waiting_bots": sum(self.counts.values()),
+            "batches": self.batches,
+            "woken": self.woken,
+        }
+
+
+_schedulers = weakref.WeakKeyDictionary()
+
+
+def get_candle_scheduler(loop=None):
+    """Scheduler of `loop`, by default the running event loop (the bot runner's loop in a worker)."""
+    loop = loop or asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = CandleScheduler(loop)
+    return scheduler
@@ -0,0 +1,32 @@
+import numpy as np
+
+# Strategy Parameters
+ema_short_period = 45
+ema_long_period = 100
+regime_filter = 480
+band_window = 20
+band_std = 2
+band_width_filter = 1.03
+
+fee_percent = 0.01
+
+
+def round_step(value, step):
+    """Round to the nearest multiple of `step`, for a single value or a NumPy array."""
+    return np.round(step * np.floor(np.asarray(value) / step + 0.5), 9)
+
+
+def round_step_down(value, step):
+    """Round down to a multiple of `step`, for a single value or a NumPy array."""
+    return np.round(step * np.floor(np.asarray(value) / step), 9)
+
+
+def quantity_after_fees(quantity, price, qty_step, fee=None):
+    """Quantity left to sell after a buy of `quantity` at `price`, rounded down to the quantity step."""
+    fee = fee_percent if fee is None else fee
+    return round_step_down(quantity - fee / np.asarray(price), qty_step)
+
+
+def position_size(order_size, close_price, qty_step):
+    """Base quantity bought with `order_size` quote at `close_price`."""
+    return round_step(order_size / np.asarray(close_price), qty_step)
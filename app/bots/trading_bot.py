@@ -1,22 +1,24 @@
-import sys
+import asyncio
 import datetime
-import requests
+import functools
 from urllib.parse import urlencode
 import time
 import hmac
 import hashlib
-import pandas as pd
-from enum import Enum
-import numpy as np
-import json
-import websocket
-import threading
-from ..db.base_repo import MongoDB
+from ..db.base_repo import get_mongo_db
 from ..db.trades_repo import TradeDB
-from ..db.user_task_repo import UserTaskDB
-from ..db.users_repo import UserDB
-from cryptography.fernet import Fernet
-from .aws_secret import get_secret
+from ..metrics import CANDLE_LAG_SECONDS, CYCLE_SECONDS, INDICATOR_SECONDS, ORDER_SECONDS, timed
+from .credentials import get_cipher
+from .bot_state import BotState, OrderStatus, TakeProfitStatus
+from .candle_store import closed_klines
+from .events import BotEvents
+from .exchange_info import exchange_info_cache
+from .indicators import IndicatorEngine
+from .market_data import get_market_data_feed
+from .scheduler import get_candle_scheduler
+from . import strategy
+from .transport import get_async_transport, get_transport
+from .user_data import get_user_data_manager
 
 # Feeding auth
 from dotenv import load_dotenv
@@ -24,65 +26,44 @@ import os
 
 load_dotenv()
 
-# Configuring the logs
+# Logs go to bot.log once the worker's startup hooks ran `configure_logging`
 import logging
-
-# Configure logging
-logging.basicConfig(
-    filename='bot.log',
-    filemode='a',
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from ..logging_config import LogThrottle, bind_log_context
 
 logger = logging.getLogger(__name__)
-
-mongo_db = MongoDB(str(os.getenv('MONGODB_URI')), "test")
-trade_db = TradeDB(mongo_db)
-user_db = UserDB(mongo_db)
-user_task_db = UserTaskDB(mongo_db)
-
-secret_name = os.getenv('SECRET_NAME')
-encryption_key = get_secret(secret_name)
-
-def decrypt_data(encrypted_data, key):
-    fernet = Fernet(key)
-    return fernet.decrypt(encrypted_data.encode()).decode()
+countdown_throttle = LogThrottle(float(os.getenv("COUNTDOWN_LOG_INTERVAL", "300")))
 
 user_trade_mapping = {}
-symbols = []
 
-# Strategy Parameters
-ema_short_period = 45
-ema_long_period = 100
-regime_filter = 480
 
-fee_percent = 0.01
-order_status = {}
-target_order_status = {}
-target_order_qty = {}
+class OrderError(Exception):
+    """Binance rejected an order; stops the bot that placed it instead of the whole worker."""
 
-# BUY Order Parameters
-buy_symbol_pair_order_counter = {}
-buy_symbol_pair_order_id = {}
-buy_symbol_pair_order_status = {}
-buy_symbol_pair_quantity_after_fee = {}
 
-# Take Profit Parameters
-buy_symbol_pair_target_counter = {}
-buy_symbol_pair_target_order_id = {}
-buy_symbol_pair_target_order_count = {}
-buy_symbol_pair_target_order_status = {}
+def build_chart(raw):
+    """Build the `getChart` (chart, DataFrame) pair from kline rows.
 
+    Rows may be raw `/api/v3/klines` rows or (open_time, open, high, low, close, volume) tuples.
+    """
+    chart = {"t": [], "o": [], "h": [], "l": [], "c": [], "v": []}
 
-class OrderStatus(Enum):
-    OPEN_ORDER = 'OPEN_ORDER',
-    POSITION = 'POSITION'
+    for r in raw:
+        chart["t"].append(datetime.datetime.fromtimestamp(r[0] / 1000, datetime.timezone.utc))
+        chart["o"].append(float(r[1]))
+        chart["h"].append(float(r[2]))
+        chart["l"].append(float(r[3]))
+        chart["c"].append(float(r[4]))
+        chart["v"].append(float(r[5]))
 
+    import pandas as pd  # Only needed here, kept off the worker's import path
 
-class TakeProfitStatus(Enum):
-    NOT_PLACED = "NOT_PLACED",
-    PLACED = 'PLACED'
+    # Creating DataFrame from raw data
+    df = pd.DataFrame({'Open': chart["o"], 'High': chart["h"], 'Low': chart["l"], 'Close': chart["c"],
+                       'Volume': chart["v"]},
+                      index=pd.to_datetime([r[0] for r in raw], unit='ms'))
+    df.index.name = 'Time'
+
+    return chart, df
 
 
 class Binance():
@@ -90,62 +71,50 @@ class Binance():
     secretkey = ""
     test = False
     baseurl = ""
-    tick_sizes = {}
-    qty_steps = {}
     recv_window = 59999
-    symbol_base = {}  # base/quote
-    symbol_quote = {}
 
-    def __init__(self, apikey="", secretkey="", test=False):
+    def __init__(self, apikey="", secretkey="", test=False, state=None):
 
         self.apikey = apikey
         self.secretkey = secretkey
+        self.state = state  # BotState of the bot placing orders through this client
         if test:
             self.baseurl = "https://testnet.binance.vision"
         else:
             self.baseurl = "https://api.binance.com"
 
-        raw = self.getExchangeInfo()
-
-        for r in raw["symbols"]:
+    def symbol_info(self, symbol):
+        # Filters are loaded per symbol on first use and shared through the process-wide cache
+        return exchange_info_cache.get(self, symbol)
 
-            symbol = r["symbol"]
-            self.symbol_quote[symbol] = r["quoteAsset"]
-            self.symbol_base[symbol] = r["baseAsset"]
+    def tick_size(self, symbol):
+        return self.symbol_info(symbol).tick_size
 
-            tick_size = 0
-            qty_step = 0
+    def qty_step(self, symbol):
+        return self.symbol_info(symbol).qty_step
 
-            for f in r["filters"]:
-                if f["filterType"] == "PRICE_FILTER":
-                    tick_size = float(f["tickSize"])
-                elif f["filterType"] == "LOT_SIZE":
-                    qty_step = float(f["stepSize"])
+    def base_asset(self, symbol):
+        return self.symbol_info(symbol).base_asset
 
-            self.tick_sizes[symbol] = tick_size
-            self.qty_steps[symbol] = qty_step
+    def quote_asset(self, symbol):
+        return self.symbol_info(symbol).quote_asset
 
     def priceRound(self, symbol, price):
-        return round(self.tick_sizes[symbol] * int(price / self.tick_sizes[symbol] + 0.5), 9)
+        return float(strategy.round_step(price, self.tick_size(symbol)))
 
     def qtyRound(self, symbol, qty):
-        return round(self.qty_steps[symbol] * int(qty / self.qty_steps[symbol] + 0.5), 9)
+        return float(strategy.round_step(qty, self.qty_step(symbol)))
 
     def qtyRoundDown(self, symbol, qty):
-        return round(self.qty_steps[symbol] * int(qty / self.qty_steps[symbol]), 9)
+        return float(strategy.round_step_down(qty, self.qty_step(symbol)))
 
     def dispatch_request(self, http_method):
-        session = requests.Session()
-        session.headers.update({
+        # Requests go through the process-wide pooled transport, so connections are kept alive
+        headers = {
             'Content-Type': 'application/json;charset=utf-8',
             'X-MBX-APIKEY': self.apikey
-        })
-        return {
-            'GET': session.get,
-            'DELETE': session.delete,
-            'PUT': session.put,
-            'POST': session.post,
-        }.get(http_method, 'GET')
+        }
+        return functools.partial(get_transport().request, http_method, headers=headers)
 
     def get_timestamp(self):
         return int(time.time() * 1000)
@@ -153,7 +122,7 @@ class Binance():
     def hashing(self, query_string):
         return hmac.new(self.secretkey.encode('utf-8'), query_string.encode('utf-8'), hashlib.sha256).hexdigest()
 
-    def send_signed_request(self, http_method, url_path, payload={}):
+    def signed_url(self, url_path, payload):
 
         payload["recvWindow"] = self.recv_window
 
@@ -163,14 +132,9 @@ class Binance():
         else:
             query_string = 'timestamp={}'.format(self.get_timestamp())
 
-        url = self.baseurl + url_path + '?' + query_string + '&signature=' + self.hashing(query_string)
-
-        params = {'url': url, 'params': {}}
-        response = self.dispatch_request(http_method)(**params)
-
-        return response.json()
+        return self.baseurl + url_path + '?' + query_string + '&signature=' + self.hashing(query_string)
 
-    def send_public_request(self, url_path, payload={}):
+    def public_url(self, url_path, payload):
 
         query_string = urlencode(payload, True)
         url = self.baseurl + url_path
@@ -178,124 +142,89 @@ class Binance():
         if query_string:
             url = url + '?' + query_string
 
-        response = self.dispatch_request('GET')(url=url)
+        return url
+
+    def send_signed_request(self, http_method, url_path, payload={}):
+
+        url = self.signed_url(url_path, payload)
+
+        params = {'url': url, 'params': {}}
+        response = self.dispatch_request(http_method)(**params)
+
+        return response.json()
+
+    def send_public_request(self, url_path, payload={}):
+
+        response = self.dispatch_request('GET')(url=self.public_url(url_path, payload))
         return response.json()
 
     def Account(self):
         return self.send_signed_request("GET", "/api/v3/account")
 
-    def getChart(self, symbol, interval, start_t=0, end_t=0):
-
-        if not interval in ["1m", "3m", "5m", "15m", "30m", "1h", "2h", "4h", "6h", "8h", "12h", "1d", "3d", "1w",
-                            "1M"]:
-            print("getChart: invalid interval")
-            return
+    def klines_payload(self, symbol, interval, start_t=0, end_t=0, limit=0):
 
         payload = {"symbol": symbol, "interval": interval}
         if start_t != 0:
             payload["startTime"] = int(start_t.timestamp() * 1000)
         if end_t != 0:
             payload["endTime"] = int(end_t.timestamp() * 1000)
+        if limit != 0:
+            payload["limit"] = limit
+
+        return payload
+
+    def getKlines(self, symbol, interval, start_t=0, end_t=0, limit=0):
+        payload = self.klines_payload(symbol, interval, start_t=start_t, end_t=end_t, limit=limit)
+        return self.send_public_request("/api/v3/klines", payload=payload)
+
+    def getChart(self, symbol, interval, start_t=0, end_t=0):
+
+        if not interval in ["1m", "3m", "5m", "15m", "30m", "1h", "2h", "4h", "6h", "8h", "12h", "1d", "3d", "1w",
+                            "1M"]:
+            logger.error(f"[{symbol}] getChart: invalid interval {interval}")
+            return
 
-        # payload = {"symbol":symbol,"interval":interval,"startTime":int(sT.timestamp()*1000),"endTime":int(eT.timestamp()*1000)}
-        raw = self.send_public_request("/api/v3/klines", payload=payload)
-        chart = {"t": [], "o": [], "h": [], "l": [], "c": [], "v": []}
-
-        for r in raw:
-            chart["t"].append(datetime.datetime.fromtimestamp(r[0] / 1000, datetime.timezone.utc))
-            chart["o"].append(float(r[1]))
-            chart["h"].append(float(r[2]))
-            chart["l"].append(float(r[3]))
-            chart["c"].append(float(r[4]))
-            chart["v"].append(float(r[5]))
-
-        # Creating DataFrame from raw data
-        columns = ['Time', 'Open', 'High', 'Low', 'Close', 'Volume', 'Close Time',
-                   'Quote Asset Volume', 'Number of Trades', 'Taker Buy Base Asset Volume',
-                   'Taker Buy Quote Asset Volume', 'Ignore']
-        df = pd.DataFrame(raw, columns=columns)
-        df['Time'] = pd.to_datetime(df['Time'], unit='ms')
-        df.set_index('Time', inplace=True)
-        df = df[['Open', 'High', 'Low', 'Close', 'Volume']].astype(float)
-
-        return chart, df
-
-    def get_chart_data(self, order_size_dict, symbol, interval, start_t, buy_timedelta):
-
-        candle_chart, candle_chart_df = self.getChart(symbol, interval, start_t=start_t)
-
-        if candle_chart["t"][-1].astimezone(datetime.timezone.utc) > datetime.datetime.now(datetime.timezone.utc) - \
-                buy_timedelta[symbol] / 2:
-            candle_chart["t"] = candle_chart["t"][:-1]  # Remove excessive candle
-            candle_chart["o"] = candle_chart["o"][:-1]
-            candle_chart["h"] = candle_chart["h"][:-1]
-            candle_chart["l"] = candle_chart["l"][:-1]
-            candle_chart["c"] = candle_chart["c"][:-1]
-            candle_chart["v"] = candle_chart["v"][:-1]
-
-        # Ensure DataFrame is not empty and is sorted by index (Open Time)
-        if candle_chart_df.empty or candle_chart_df.index[-1].tz_localize('UTC') > datetime.datetime.now(
-                datetime.timezone.utc) - buy_timedelta[symbol] / 2:
-            # Remove the last row if the candle is not fully formed
-            candle_chart_df = candle_chart_df.iloc[:-1]
-
-        candle_chart_df["rolling_mean"] = candle_chart_df['Close'].rolling(window=20).mean()
-        candle_chart_df["rolling_std"] = candle_chart_df['Close'].rolling(window=20).std()
-        candle_chart_df["upper_band"] = candle_chart_df["rolling_mean"] + (2 * candle_chart_df["rolling_std"])
-        candle_chart_df["lower_band"] = candle_chart_df["rolling_mean"] - (2 * candle_chart_df["rolling_std"])
-        candle_chart_df["ema_short_period"] = candle_chart_df['Close'].ewm(span=ema_short_period).mean()
-        candle_chart_df["ema_long_period"] = candle_chart_df['Close'].ewm(span=ema_long_period).mean()
-        candle_chart_df["ema_regime"] = candle_chart_df['Close'].ewm(span=regime_filter).mean()
-
-        candle_chart_df["ema_trend_filter"] = candle_chart_df["ema_short_period"] > candle_chart_df["ema_long_period"]
-        candle_chart_df["ema_regime_filter"] = candle_chart_df["Close"] > candle_chart_df["ema_regime"]
-        candle_chart_df["bbands_width_filter"] = np.where(
-            candle_chart_df["upper_band"] / candle_chart_df["lower_band"] > 1.03, True, False)
-
-        # Calculate the short-term (12-period) exponential moving average (EMA)
-        short_ema = candle_chart_df['Close'].ewm(span=12, adjust=False).mean()
-
-        # Calculate the long-term (26-period) exponential moving average (EMA)
-        long_ema = candle_chart_df['Close'].ewm(span=26, adjust=False).mean()
-
-        # Calculate the MACD line
-        macd_line = short_ema - long_ema
-
-        # Calculate the signal line (9-period EMA of the MACD line)
-        signal_line = macd_line.ewm(span=9, adjust=False).mean()
-
-        # Calculate the MACD histogram
-        macd_histogram = macd_line - signal_line
-
-        # Add MACD indicators to the DataFrame
-        candle_chart_df['MACD Line'] = macd_line
-        candle_chart_df['Signal Line'] = signal_line
-        candle_chart_df['MACD Histogram'] = macd_histogram
-
-        # Add a column indicating whether MACD histogram is above 0 or not
-        candle_chart_df['MACD Above 0'] = candle_chart_df['MACD Histogram'] > 0
-
-        # Add a column indicating crossover points of MACD and Signal lines
-        candle_chart_df['MACD_Crossover'] = np.where((candle_chart_df['MACD Line'] > candle_chart_df['Signal Line']) & (
-                candle_chart_df['MACD Line'].shift(1) < candle_chart_df['Signal Line'].shift(1)), 1,
-                                                     np.where(
-                                                         (candle_chart_df['MACD Line'] < candle_chart_df[
-                                                             'Signal Line']) & (
-                                                                 candle_chart_df['MACD Line'].shift(1) >
-                                                                 candle_chart_df[
-                                                                     'Signal Line'].shift(1)), -1, 0))
-
-        qty = self.calculate_position_size(symbol, order_size_dict[symbol], candle_chart["c"][-1])
-        return candle_chart, candle_chart_df, qty
+        raw = self.getKlines(symbol, interval, start_t=start_t, end_t=end_t)
+        return build_chart(raw)
+
+    def indicators_start_time(self, indicators, start_t):
+        # `start_t` only bounds the window used to seed an empty engine
+        if indicators.last_open_time is None:
+            return start_t
+        return datetime.datetime.fromtimestamp((indicators.last_open_time + 1) / 1000, datetime.timezone.utc)
+
+    def apply_candles(self, indicators, order_size_dict, symbol, candles):
+        indicators.update_many(candles)
+
+        qty = self.calculate_position_size(symbol, order_size_dict[symbol], indicators.close)
+        return qty
+
+    def update_indicators(self, indicators, order_size_dict, symbol, interval, start_t, market_feed=None):
+        """Feed the candles closed since the last update into `indicators` and size the next order.
+
+        `start_t` only bounds the window used to seed an empty engine; afterwards
+        just the newly closed candles are fetched and each costs O(1) to apply.
+        """
+
+        start_t = self.indicators_start_time(indicators, start_t)
+
+        if market_feed is not None:
+            # Closed candles pushed over the shared kline stream, REST only backfills gaps
+            candles = market_feed.get_klines(symbol, interval, start_t=start_t)
+        else:
+            candles = closed_klines(self.getKlines(symbol, interval, start_t=start_t))
+
+        return self.apply_candles(indicators, order_size_dict, symbol, candles)
 
     def calculate_position_size(self, symbol, set_order_size, close_price):
-        return self.qtyRound(symbol, set_order_size / close_price)
+        return float(strategy.position_size(set_order_size, close_price, self.qty_step(symbol)))
 
-    def getExchangeInfo(self):
-        raw = self.send_public_request("/api/v3/exchangeInfo")
+    def getExchangeInfo(self, symbol=None):
+        payload = {"symbol": symbol} if symbol else {}
+        raw = self.send_public_request("/api/v3/exchangeInfo", payload=payload)
         return raw
 
-    def Buy(self, symbol, rounded_qty, price):
+    def buy_payload(self, symbol, rounded_qty, price):
 
         rounded_price = self.priceRound(symbol, price)
 
@@ -312,25 +241,31 @@ class Binance():
             payload["timeInForce"] = "GTC"
             payload["price"] = rounded_price
 
-        a = self.send_signed_request("POST", "/api/v3/order", payload=payload)
+        return payload
+
+    def handle_buy_response(self, symbol, payload, a):
 
         if not "orderId" in a:
-            std_log(str(a))
-            std_log(payload)
-            std_log("Order error")
-            sys.exit()
+            logger.error(f"[{symbol}] Order error. Payload: {payload}. Response: {a}")
+            raise OrderError(f"[{symbol}] Order rejected: {a}")
 
-        std_log("[%s] Buy (quantity:%f, price:%f, orderID:%d)" % (symbol, rounded_qty, rounded_price, a["orderId"]))
+        logger.info("[%s] Buy (quantity:%f, price:%f, orderID:%d)"
+                % (symbol, payload["quantity"], payload.get("price", 0), a["orderId"]))
 
-        std_log("[%s] Quantity: %f" % (symbol, rounded_qty))
+        logger.info("[%s] Quantity: %f" % (symbol, payload["quantity"]))
 
-        update_buy_order_id_for_symbol_pair(a, symbol)
-        buy_symbol_pair_order_status[symbol] = OrderStatus.OPEN_ORDER
+        self.state.set_buy_order_id(a["orderId"])
+        self.state.buy_order_status = OrderStatus.OPEN_ORDER
+        self.state.open_orders.record_response(a)
         return a
 
-    def ReplaceOrder(self, order_id, symbol_pair, quantity, new_price):
+    def Buy(self, symbol, rounded_qty, price):
+        payload = self.buy_payload(symbol, rounded_qty, price)
+        a = self.send_signed_request("POST", "/api/v3/order", payload=payload)
+        return self.handle_buy_response(symbol, payload, a)
 
-        payload = {
+    def replace_order_payload(self, order_id, symbol_pair, quantity, new_price):
+        return {
             "symbol": symbol_pair,
             "side": 'BUY',
             "type": "LIMIT",
@@ -341,46 +276,76 @@ class Binance():
             "price": self.priceRound(symbol_pair, new_price)
         }
 
+    def handle_replace_order_response(self, symbol_pair, quantity, new_price, replaced_order_response):
+
+        logger.info("[%s] BUY Order Replaced. New Order Parameters: (quantity:%f, price:%f, orderID:%d)"
+                % (symbol_pair, quantity, new_price, replaced_order_response["newOrderResponse"]["orderId"]))
+
+        self.state.set_buy_order_id(replaced_order_response["newOrderResponse"]["orderId"])
+        self.state.buy_order_status = OrderStatus.OPEN_ORDER
+        self.record_replaced_orders(replaced_order_response)
+        return replaced_order_response["newOrderResponse"]
+
+    def record_replaced_orders(self, replaced_order_response):
+        self.state.open_orders.record_response(replaced_order_response.get("cancelResponse"))
+        self.state.open_orders.record_response(replaced_order_response.get("newOrderResponse"))
+
+    def amendment_needed(self, symbol_pair, order_id, price, quantity):
+        """False if the resting order already has the rounded `price` and `quantity`, so replacing it is a no-op."""
+        if self.state.open_orders.unchanged(order_id, price, quantity):
+            logger.info(f"[{symbol_pair}] Order {order_id} already at price {price}, quantity {quantity}. "
+                        f"Not replaced.")
+            return False
+        return True
+
+    def ReplaceOrder(self, order_id, symbol_pair, quantity, new_price):
+
+        payload = self.replace_order_payload(order_id, symbol_pair, quantity, new_price)
+
         try:
             replaced_order_response = (
                 self.send_signed_request("POST", "/api/v3/order/cancelReplace", payload))
-
-            std_log("[%s] BUY Order Replaced. New Order Parameters: (quantity:%f, price:%f, orderID:%d)"
-                    % (symbol_pair, quantity, new_price, replaced_order_response["newOrderResponse"]["orderId"]))
-
-            update_buy_order_id_for_symbol_pair(replaced_order_response["newOrderResponse"], symbol_pair)
-            buy_symbol_pair_order_status[symbol_pair] = OrderStatus.OPEN_ORDER
-            return replaced_order_response["newOrderResponse"]
+            return self.handle_replace_order_response(symbol_pair, quantity, new_price, replaced_order_response)
         except Exception as e:
-            std_log(f"[{symbol_pair}] Error canceling order {order_id}. Error Info: {e}")
+            logger.error(f"[{symbol_pair}] Error canceling order {order_id}. Error Info: {e}")
             return None
 
-    def ReplaceTakeProfitOrder(self, order_id, symbol_pair, quantity, new_price):
+    def take_profit_payload(self, symbol_pair, quantity, price, order_id=None):
 
-        target_price = self.priceRound(symbol_pair, new_price)
-        buy_symbol_pair_quantity_after_fee[symbol_pair] = self.quantity_after_fees(symbol_pair, quantity, target_price)
-        take_profit_quantity = buy_symbol_pair_quantity_after_fee[symbol_pair]
+        target_price = self.priceRound(symbol_pair, price)
+        take_profit_quantity = self.quantity_after_fees(symbol_pair, quantity, target_price)
+        self.state.quantity_after_fee = take_profit_quantity
 
         # Prepare the payload for the limit sell order
         payload = {
             "symbol": symbol_pair,
             "side": "SELL",
             "type": "LIMIT",
-            "timeInForce": "GTC",
-            "cancelReplaceMode": "STOP_ON_FAILURE",
-            "cancelOrderId": order_id,
-            "quantity": take_profit_quantity,
-            "price": target_price
+            "timeInForce": "GTC",  # Good till cancelled
         }
 
-        std_log("[%s] Quantity: %f" % (symbol_pair, take_profit_quantity))
+        if order_id is not None:
+            # Replace the resting take profit order in one cancelReplace call
+            payload["cancelReplaceMode"] = "STOP_ON_FAILURE"
+            payload["cancelOrderId"] = order_id
+
+        payload["quantity"] = take_profit_quantity
+        payload["price"] = target_price
+
+        logger.info("[%s] Quantity: %f" % (symbol_pair, take_profit_quantity))
+        return payload
+
+    def ReplaceTakeProfitOrder(self, order_id, symbol_pair, quantity, new_price):
+
+        payload = self.take_profit_payload(symbol_pair, quantity, new_price, order_id=order_id)
 
         try:
             replaced_order_response = (
                 self.send_signed_request("POST", "/api/v3/order/cancelReplace", payload))
+            self.record_replaced_orders(replaced_order_response)
             return replaced_order_response["newOrderResponse"]
         except Exception as e:
-            std_log(f"[{symbol_pair}] Error canceling order {order_id}. Error Info: {e}")
+            logger.error(f"[{symbol_pair}] Error canceling order {order_id}. Error Info: {e}")
             return None
 
     def boundaryRemaining(self, tf):
@@ -426,19 +391,17 @@ class Binance():
         return remaining
 
     def replace_position_with_new_order(self, symbol_pair, order_id, buy_amount, new_price):
+        if not self.amendment_needed(symbol_pair, order_id, self.priceRound(symbol_pair, new_price), buy_amount):
+            return None
         try:
-            self.ReplaceOrder(order_id, symbol_pair, buy_amount, new_price)
+            return self.ReplaceOrder(order_id, symbol_pair, buy_amount, new_price)
         except Exception as e:
-            std_log(f"[{symbol_pair}] Error modifying order. Error Info: {e}")
+            logger.error(f"[{symbol_pair}] Error modifying order. Error Info: {e}")
             return None
 
     def quantity_after_fees(self, symbol_pair, quantity, buy_price):
-
-        after_fee_quantity = quantity - (fee_percent / buy_price)  # Adjust the quantity for the fee
-
-        # Round the quantity down to match the asset's quantity step
-        buy_symbol_pair_quantity_after_fee[symbol_pair] = self.qtyRoundDown(symbol_pair, after_fee_quantity)
-        return buy_symbol_pair_quantity_after_fee[symbol_pair]
+        # Adjusted for the fee and rounded down to the asset's quantity step, shared with the backtester
+        return float(strategy.quantity_after_fees(quantity, buy_price, self.qty_step(symbol_pair)))
 
     def set_take_profit(self, symbol_pair, quantity, price):
 
@@ -451,146 +414,248 @@ class Binance():
                price (float): The price at which the order should execute.
                """
 
-        target_price = self.priceRound(symbol_pair, price)
-        buy_symbol_pair_quantity_after_fee[symbol_pair] = self.quantity_after_fees(symbol_pair, quantity, target_price)
-        take_profit_quantity = buy_symbol_pair_quantity_after_fee[symbol_pair]
-
-        # Prepare the payload for the limit sell order
-        payload = {
-            "symbol": symbol_pair,
-            "side": "SELL",
-            "type": "LIMIT",
-            "timeInForce": "GTC",  # Good till cancelled
-            "quantity": take_profit_quantity,
-            "price": target_price
-        }
-
-        std_log("[%s] Quantity: %f" % (symbol_pair, take_profit_quantity))
+        payload = self.take_profit_payload(symbol_pair, quantity, price)
 
         try:
             response = self.send_signed_request("POST", "/api/v3/order", payload)
-            if response and 'orderId' in response:
-                update_take_profit_order_id_for_symbol_pair(response, symbol_pair)
-                buy_symbol_pair_target_order_status[symbol_pair] = TakeProfitStatus.PLACED
-                std_log(
-                    f"[{symbol_pair}] Target Order Placed. Will Sell {take_profit_quantity} of {symbol_pair} at: {price}!"
-                    f" Order ID: {response['orderId']}")
-                return response
-            else:
-                std_log(f"[{symbol_pair}] Failed to place target order. Response: {response}")
-                return None
+            return self.handle_take_profit_response(symbol_pair, payload, price, response)
         except Exception as e:
-            std_log(f"[{symbol_pair}] Error placing target order. Error Info: {e}")
+            logger.error(f"[{symbol_pair}] Error placing target order. Error Info: {e}")
             return None
 
-    def update_take_profit(self, symbol_pair, order_id, take_profit_quantity, new_take_profit_price):
+    def handle_take_profit_response(self, symbol_pair, payload, price, response):
 
-        try:
+        if response and 'orderId' in response:
+            self.state.set_target_order_id(response["orderId"])
+            self.state.take_profit_status = TakeProfitStatus.PLACED
+            self.state.open_orders.record_response(response)
+            logger.info(
+                f"[{symbol_pair}] Target Order Placed. Will Sell {payload['quantity']} of {symbol_pair} at: {price}!"
+                f" Order ID: {response['orderId']}")
+            return response
+        else:
+            logger.error(f"[{symbol_pair}] Failed to place target order. Response: {response}")
+            return None
 
-            response = self.ReplaceTakeProfitOrder(order_id, symbol_pair, take_profit_quantity, new_take_profit_price)
+    def handle_update_take_profit_response(self, symbol_pair, take_profit_quantity, new_take_profit_price, response):
 
-            if response and 'orderId' in response:
+        if response and 'orderId' in response:
 
-                update_take_profit_order_id_for_symbol_pair(response, symbol_pair)
-                buy_symbol_pair_target_order_status[symbol_pair] = TakeProfitStatus.PLACED
+            self.state.set_target_order_id(response["orderId"])
+            self.state.take_profit_status = TakeProfitStatus.PLACED
 
-                std_log("[%s] Target Order Replaced. New Order Parameters: (quantity:%f, price:%f, orderID:%d)"
-                        % (symbol_pair, take_profit_quantity, new_take_profit_price, response["orderId"]))
+            logger.info("[%s] Target Order Replaced. New Order Parameters: (quantity:%f, price:%f, orderID:%d)"
+                    % (symbol_pair, take_profit_quantity, new_take_profit_price, response["orderId"]))
 
-                return response
+            return response
 
-            else:
-                std_log(f"[{symbol_pair}] Failed to place new take profit order. Response: {response}")
-                return None
+        else:
+            logger.error(f"[{symbol_pair}] Failed to place new take profit order. Response: {response}")
+            return None
+
+    def take_profit_unchanged(self, symbol_pair, order_id, quantity, price):
+        target_price = self.priceRound(symbol_pair, price)
+        return not self.amendment_needed(symbol_pair, order_id, target_price,
+                                         self.quantity_after_fees(symbol_pair, quantity, target_price))
 
+    def update_take_profit(self, symbol_pair, order_id, take_profit_quantity, new_take_profit_price):
+
+        if self.take_profit_unchanged(symbol_pair, order_id, take_profit_quantity, new_take_profit_price):
+            return None
+        try:
+            response = self.ReplaceTakeProfitOrder(order_id, symbol_pair, take_profit_quantity, new_take_profit_price)
+            return self.handle_update_take_profit_response(symbol_pair, take_profit_quantity,
+                                                           new_take_profit_price, response)
         except Exception as e:
-            std_log(f"[{symbol_pair}] Error placing take_profit for order. Error Info: {e}")
+            logger.error(f"[{symbol_pair}] Error placing take_profit for order. Error Info: {e}")
             return None
 
 
-class WebSocketHandler:
-    def __init__(self, api_key):
-        self.api_key = api_key
-        self.ws = None
-        self.base_url = "https://api.binance.com"
-        self.listen_key = self.start_user_data_stream()
+class AsyncBinance(Binance):
+    """Non-blocking variant of `Binance` for bots running on an asyncio event loop.
 
-    def start_user_data_stream(self):
-        """Post a request to start a new user data stream and obtain the listen key."""
-        url = f"{self.base_url}/api/v3/userDataStream"
-        headers = {'X-MBX-APIKEY': self.api_key}
-        response = requests.post(url, headers=headers)
-        data = response.json()
-        return data.get('listenKey')
+    Requests go through the pooled aiohttp transport; payloads, rounding,
+    signing and the response handling are inherited from `Binance`, so both
+    clients place exactly the same orders.
+    """
 
-    def renew_listen_key(self):
-        """PUT request to keep the listen key alive."""
-        url = f"{self.base_url}/api/v3/userDataStream?listenKey={self.listen_key}"
-        headers = {'X-MBX-APIKEY': self.api_key}
-        requests.put(url, headers=headers)
-        print("Listen key renewed.")
+    def __init__(self, apikey="", secretkey="", test=False, state=None):
+        super().__init__(apikey=apikey, secretkey=secretkey, test=test, state=state)
+        self.sync_client = Binance(apikey=apikey, secretkey=secretkey, test=test)
 
-    def on_message(self, ws, message):
+    def symbol_info(self, symbol):
+        # Never block the loop: filters are loaded by `load_symbol_info` and kept even past their TTL
+        info = exchange_info_cache.peek(self.baseurl, symbol)
+        if info is None:
+            raise ValueError(f"Exchange info for {symbol} is not loaded, await load_symbol_info first")
+        return info
 
-        data = json.loads(message)
+    async def load_symbol_info(self, symbol):
+        return await asyncio.to_thread(exchange_info_cache.get, self.sync_client, symbol)
 
-        if data.get('e') == 'executionReport' and data.get('X') == 'FILLED':
-            self.handle_filled_order(data)
+    def headers(self):
+        return {
+            'Content-Type': 'application/json;charset=utf-8',
+            'X-MBX-APIKEY': self.apikey
+        }
 
-    def on_error(self, ws, error):
-        std_log("[WebSocket] Error: {%s}" % error)
-        print("WebSocket error:", error)
+    async def send_signed_request(self, http_method, url_path, payload={}):
+        url = self.signed_url(url_path, payload)
+        return await get_async_transport().request_json(http_method, url, headers=self.headers())
 
-    def on_close(self, ws):
-        std_log("[WebSocket] Connection Closed")
+    async def send_public_request(self, url_path, payload={}):
+        return await get_async_transport().request_json('GET', self.public_url(url_path, payload),
+                                                        headers=self.headers())
 
-    def on_open(self, ws):
-        std_log("[WebSocket] Connection Opened")
+    async def Account(self):
+        return await self.send_signed_request("GET", "/api/v3/account")
 
-    def start_listening(self):
-        """Start the WebSocket connection and schedule the listen key renewal."""
-        stream_url = f"wss://stream.binance.com:9443/ws/{self.listen_key}"
-        self.ws = websocket.WebSocketApp(stream_url,
-                                         on_message=self.on_message,
-                                         on_error=self.on_error,
-                                         on_close=self.on_close)
-        self.ws.on_open = self.on_open
+    async def getKlines(self, symbol, interval, start_t=0, end_t=0, limit=0):
+        payload = self.klines_payload(symbol, interval, start_t=start_t, end_t=end_t, limit=limit)
+        return await self.send_public_request("/api/v3/klines", payload=payload)
 
-        # Run the WebSocket in a separate thread
-        threading.Thread(target=self.ws.run_forever).start()
+    async def getChart(self, symbol, interval, start_t=0, end_t=0):
+        raw = await self.getKlines(symbol, interval, start_t=start_t, end_t=end_t)
+        return build_chart(raw)
 
-        # Schedule the listen key to be renewed every 30 minutes
-        threading.Thread(target=self.keep_alive).start()
+    async def getExchangeInfo(self, symbol=None):
+        payload = {"symbol": symbol} if symbol else {}
+        return await self.send_public_request("/api/v3/exchangeInfo", payload=payload)
 
-    def keep_alive(self):
-        """Keep renewing the listen key every 30 minutes."""
-        while True:
-            time.sleep(1800)  # Sleep for 30 minutes
-            self.renew_listen_key()
+    @timed(INDICATOR_SECONDS)
+    async def update_indicators(self, indicators, order_size_dict, symbol, interval, start_t, market_feed=None):
+        """Async `Binance.update_indicators`; also refreshes the symbol filters once their TTL expired."""
+
+        await self.load_symbol_info(symbol)
+        start_t = self.indicators_start_time(indicators, start_t)
+
+        if market_feed is not None:
+            # The feed may wait for the closing candle or backfill it, keep that off the loop
+            candles = await asyncio.to_thread(market_feed.get_klines, symbol, interval, start_t)
+        else:
+            candles = closed_klines(await self.getKlines(symbol, interval, start_t=start_t))
+
+        return self.apply_candles(indicators, order_size_dict, symbol, candles)
+
+    @timed(ORDER_SECONDS, "buy")
+    async def Buy(self, symbol, rounded_qty, price):
+        payload = self.buy_payload(symbol, rounded_qty, price)
+        a = await self.send_signed_request("POST", "/api/v3/order", payload=payload)
+        return self.handle_buy_response(symbol, payload, a)
+
+    @timed(ORDER_SECONDS, "replace_entry")
+    async def ReplaceOrder(self, order_id, symbol_pair, quantity, new_price):
+
+        payload = self.replace_order_payload(order_id, symbol_pair, quantity, new_price)
+
+        try:
+            replaced_order_response = await self.send_signed_request("POST", "/api/v3/order/cancelReplace", payload)
+            return self.handle_replace_order_response(symbol_pair, quantity, new_price, replaced_order_response)
+        except Exception as e:
+            logger.error(f"[{symbol_pair}] Error canceling order {order_id}. Error Info: {e}")
+            return None
+
+    @timed(ORDER_SECONDS, "replace_take_profit")
+    async def ReplaceTakeProfitOrder(self, order_id, symbol_pair, quantity, new_price):
+
+        payload = self.take_profit_payload(symbol_pair, quantity, new_price, order_id=order_id)
+
+        try:
+            replaced_order_response = await self.send_signed_request("POST", "/api/v3/order/cancelReplace", payload)
+            self.record_replaced_orders(replaced_order_response)
+            return replaced_order_response["newOrderResponse"]
+        except Exception as e:
+            logger.error(f"[{symbol_pair}] Error canceling order {order_id}. Error Info: {e}")
+            return None
 
-    def handle_filled_order(self, order_data):
+    async def replace_position_with_new_order(self, symbol_pair, order_id, buy_amount, new_price):
+        if not self.amendment_needed(symbol_pair, order_id, self.priceRound(symbol_pair, new_price), buy_amount):
+            return None
+        try:
+            return await self.ReplaceOrder(order_id, symbol_pair, buy_amount, new_price)
+        except Exception as e:
+            logger.error(f"[{symbol_pair}] Error modifying order. Error Info: {e}")
+            return None
 
-        order_type = order_data.get('S')
-        order_symbol = order_data.get('s')
-        order_id = order_data.get('i')
-        order_qty = order_data.get('q')
+    @timed(ORDER_SECONDS, "set_take_profit")
+    async def set_take_profit(self, symbol_pair, quantity, price):
 
-        if order_type == 'BUY' and order_id == buy_symbol_pair_order_id[order_symbol]:
-            order_status[order_symbol] = OrderStatus.POSITION
-            target_order_qty[order_symbol] = float(order_qty)
+        payload = self.take_profit_payload(symbol_pair, quantity, price)
 
-        if order_type == 'SELL' and order_id == buy_symbol_pair_target_order_id[order_symbol]:
-            target_order_status[order_symbol] = OrderStatus.POSITION
+        try:
+            response = await self.send_signed_request("POST", "/api/v3/order", payload)
+            return self.handle_take_profit_response(symbol_pair, payload, price, response)
+        except Exception as e:
+            logger.error(f"[{symbol_pair}] Error placing target order. Error Info: {e}")
+            return None
+
+    async def update_take_profit(self, symbol_pair, order_id, take_profit_quantity, new_take_profit_price):
+
+        if self.take_profit_unchanged(symbol_pair, order_id, take_profit_quantity, new_take_profit_price):
+            return None
+        try:
+            response = await self.ReplaceTakeProfitOrder(order_id, symbol_pair, take_profit_quantity,
+                                                         new_take_profit_price)
+            return self.handle_update_take_profit_response(symbol_pair, take_profit_quantity,
+                                                           new_take_profit_price, response)
+        except Exception as e:
+            logger.error(f"[{symbol_pair}] Error placing take_profit for order. Error Info: {e}")
+            return None
 
-        std_log("[%s] %s Order { %s } is FILLED" % (order_symbol, order_type, order_data['i']))
+    async def query_order(self, symbol, order_id):
+        return await self.send_signed_request("GET", "/api/v3/order", {"symbol": symbol, "orderId": order_id})
 
+    async def restore_state(self, symbol, snapshot):
+        """Pick up the orders of a restarted bot from the trade's `bot_state` and their status on Binance.
 
-def validate_order_status(symbol_pair):
-    return order_status[symbol_pair]
+        A resting entry or take profit is adopted, a filled entry becomes the
+        position. Orders that are gone (cancelled, expired) are placed again by
+        the next cycle, and a filled take profit means the trade completed
+        while the bot was down.
+        """
+        state = self.state
+        if snapshot.get("buy_order_id"):
+            order = await self.query_order(symbol, snapshot["buy_order_id"])
+            status = order.get("status") if isinstance(order, dict) else None
+            if status in ("NEW", "PARTIALLY_FILLED"):
+                state.buy_order_counter = 1
+                state.set_buy_order_id(order["orderId"])
+                state.open_orders.record_response(order)
+            elif status == "FILLED":
+                state.buy_order_counter = 1
+                state.set_buy_order_id(order["orderId"])
+                state.order_status = OrderStatus.POSITION
+                state.target_order_qty = float(order["executedQty"])
+
+        if state.order_status == OrderStatus.POSITION and snapshot.get("target_order_id"):
+            order = await self.query_order(symbol, snapshot["target_order_id"])
+            status = order.get("status") if isinstance(order, dict) else None
+            if status in ("NEW", "PARTIALLY_FILLED"):
+                state.set_target_order_id(order["orderId"])
+                state.take_profit_status = TakeProfitStatus.PLACED
+                # target_order_qty stays the entry's executedQty: the take profit's origQty is already net of
+                # fees, and update_take_profit takes them off again
+                state.open_orders.record_response(order)
+            elif status == "FILLED":
+                state.reset()
+
+        logger.info(f"[{symbol}] Restored bot state: {state.snapshot()}")
+
+    async def start_user_data_stream(self):
+        """Start a new user data stream and return its listen key."""
+        data = await get_async_transport().request_json('POST', f"{self.baseurl}/api/v3/userDataStream",
+                                                        headers=self.headers())
+        return data.get('listenKey')
 
+    async def renew_listen_key(self, listen_key):
+        """Keep a listen key alive for another 60 minutes."""
+        await get_async_transport().request_json('PUT', f"{self.baseurl}/api/v3/userDataStream?listenKey={listen_key}",
+                                                 headers=self.headers())
 
-def validate_take_profit_order_status(symbol_pair):
-    return target_order_status[symbol_pair]
+    async def close_user_data_stream(self, listen_key):
+        await get_async_transport().request_json('DELETE',
+                                                 f"{self.baseurl}/api/v3/userDataStream?listenKey={listen_key}",
+                                                 headers=self.headers())
 
 
 def configure_api_parameters(ticker: str, quantity: float, pair_timeframe: str, demo: bool):
@@ -618,52 +683,28 @@ def configure_api_parameters(ticker: str, quantity: float, pair_timeframe: str,
         "1w": datetime.timedelta(days=7)
     }
 
-    if not ticker in symbols:
-        symbols.append(ticker)
-
     buy_timeframe[ticker] = pair_timeframe
     buy_order_type[ticker] = "LIMIT"  # Or another default value if required
     order_size_dict[ticker] = quantity
     h_period[ticker] = 20  # Or another default value if required
 
-    std_log(f"[Booting] Buy timeframe for {ticker}: {buy_timeframe[ticker]}")
-    std_log(f"[Booting] Buy order type for {ticker}: {buy_order_type[ticker]}")
-    std_log(f"[Booting] Order size for {ticker}: {order_size_dict[ticker]}")
-    std_log(f"[Booting] Highest period for {ticker}: {h_period[ticker]}")
-    std_log(f"[Booting] Demo account: {demo}")
+    logger.info(f"[Booting] Buy timeframe for {ticker}: {buy_timeframe[ticker]}")
+    logger.info(f"[Booting] Buy order type for {ticker}: {buy_order_type[ticker]}")
+    logger.info(f"[Booting] Order size for {ticker}: {order_size_dict[ticker]}")
+    logger.info(f"[Booting] Highest period for {ticker}: {h_period[ticker]}")
+    logger.info(f"[Booting] Demo account: {demo}")
 
-    for symbol_pair in symbols:
-        if symbol_pair in buy_timeframe:
-            buy_timedelta[symbol_pair] = tdelta_conv[buy_timeframe[symbol_pair]]  # to get candle closing period
-        else:
-            buy_timedelta[symbol_pair] = None  # or some default value, or skip setting it altogether
+    buy_timedelta[ticker] = tdelta_conv[buy_timeframe[ticker]]  # to get candle closing period
 
     return buy_timedelta, buy_timeframe, buy_order_type, order_size_dict, h_period, demo, buy_limit
 
 
 def initialize_binance_client(api_key, api_secret, demo):
-    binance = Binance(test=demo, apikey='', secretkey='')
-
-    if demo:
-        binance = Binance(test=demo, apikey=api_key, secretkey=api_secret)
-    else:
-        binance = Binance(test=demo, apikey=api_key, secretkey=api_secret)
-
-    return binance
-
-
-def initialize_binance_websocket(api_key):
-    # Initialize & Start Websocket Connection
-    websocket_handler = WebSocketHandler(api_key=api_key)
-    websocket_handler.start_listening()
-
+    return Binance(test=demo, apikey=api_key, secretkey=api_secret)
 
-def set_old_remain_buy():
-    old_remain_buy = {}
-    for symbol in symbols:
-        old_remain_buy[symbol] = datetime.timedelta(days=365)  # to get candle closing period
 
-    return old_remain_buy
+def initialize_async_binance_client(api_key, api_secret, demo, state=None):
+    return AsyncBinance(test=demo, apikey=api_key, secretkey=api_secret, state=state)
 
 
 def custom_Nate_conditions(binance: Binance, symbol, order_size_dict):
@@ -711,227 +752,205 @@ def custom_Nate_conditions(binance: Binance, symbol, order_size_dict):
     return 1  # to overwrite and not use conditions in main logic
 
 
-def reset_dict_for_symbol(symbol):
-    order_status[symbol] = OrderStatus.OPEN_ORDER
-    target_order_status[symbol] = OrderStatus.OPEN_ORDER
-    target_order_qty[symbol] = 0
-
-    buy_symbol_pair_order_counter[symbol] = 0
-    buy_symbol_pair_order_id[symbol] = 0
-    buy_symbol_pair_order_status[symbol] = OrderStatus.OPEN_ORDER
-    buy_symbol_pair_quantity_after_fee[symbol] = 0
-
-    buy_symbol_pair_target_counter[symbol] = 0
-    buy_symbol_pair_target_order_id[symbol] = 0
-    buy_symbol_pair_target_order_count[symbol] = 0
-    buy_symbol_pair_target_order_status[symbol] = TakeProfitStatus.NOT_PLACED
-
-
-def set_dicts(symbols):
-
-    global order_status, target_order_status, target_order_qty, \
-        buy_symbol_pair_order_counter, buy_symbol_pair_order_id, buy_symbol_pair_quantity_after_fee, \
-        buy_symbol_pair_target_order_count, buy_symbol_pair_target_counter, buy_symbol_pair_target_order_id, \
-        buy_symbol_pair_order_status, buy_symbol_pair_order_status, buy_symbol_pair_target_order_status
-
-    order_status = {symbol: OrderStatus.OPEN_ORDER for symbol in symbols}
-    target_order_status = {symbol: OrderStatus.OPEN_ORDER for symbol in symbols}
-    target_order_qty = {symbol: 0 for symbol in symbols}
-
-    buy_symbol_pair_order_counter = {symbol: 0 for symbol in symbols}
-    buy_symbol_pair_order_id = {symbol: 0 for symbol in symbols}
-    buy_symbol_pair_order_status = {symbol: OrderStatus.OPEN_ORDER for symbol in symbols}
-    buy_symbol_pair_quantity_after_fee = {symbol: 0 for symbol in symbols}
-
-    buy_symbol_pair_target_counter = {symbol: 0 for symbol in symbols}
-    buy_symbol_pair_target_order_id = {symbol: 0 for symbol in symbols}
-    buy_symbol_pair_target_order_count = {symbol: 0 for symbol in symbols}
-    buy_symbol_pair_target_order_status = {symbol: TakeProfitStatus.NOT_PLACED for symbol in symbols}
-
-
-def cur_time():
-    s = "[" + time.strftime("%d%b%Y", time.localtime()) + "]"
-    s = s + "[" + time.strftime("%H:%M:%S", time.localtime()) + "]"
-    return s.upper()
-
-
-def std_log(message):
-    logger.info(cur_time() + message + "\n")
-
-
-def update_take_profit_order_id_for_symbol_pair(order_info, symbol_pair):
-    global buy_symbol_pair_target_order_id
-    if order_info is not None:
-        buy_symbol_pair_target_order_id[symbol_pair] = order_info['orderId']
-
-    return buy_symbol_pair_target_order_id[symbol_pair]
-
-def update_buy_order_id_for_symbol_pair(order_info, symbol_pair):
-    global buy_symbol_pair_order_id
-    if order_info is not None:
-        buy_symbol_pair_order_id[symbol_pair] = order_info['orderId']
-
-    return buy_symbol_pair_order_id[symbol_pair]
-
-def get_latest_bbands(candles_chart_df: pd.DataFrame):
-    closes = candles_chart_df['Close'].values
-    dates = pd.to_datetime(candles_chart_df.index)
-    close_prices = pd.Series(closes, index=dates)
-
-    # Calculate Bollinger Bands
-    rolling_mean = close_prices.rolling(window=20).mean()
-    rolling_std = close_prices.rolling(window=20).std()
-    upper_band = rolling_mean + (2 * rolling_std)
-    lower_band = rolling_mean - (2 * rolling_std)
-
-    latest_close_price = closes[-1]
-    latest_upper_band_price = upper_band.iloc[-1]
-    latest_lower_band_price = lower_band.iloc[-1]
-
-    return latest_close_price, latest_lower_band_price, latest_upper_band_price
-
-
 def check_bband_buy_signal(symbol_pair, latest_close, latest_lower_bband_price):
     # Check if the latest close price is below or equal to the Lower Bollinger Band
     if latest_close <= latest_lower_bband_price:
-        std_log(f"[{symbol_pair}] Latest Close Price {latest_close} is below or equal to "
+        logger.info(f"[{symbol_pair}] Latest Close Price {latest_close} is below or equal to "
                 f"the Lower Latest Bollinger Band {latest_lower_bband_price}")
         return False
     else:
-        std_log(f"[{symbol_pair}] Bollinger Bands filter condition met "
+        logger.info(f"[{symbol_pair}] Bollinger Bands filter condition met "
                 f"(Latest Lower Bollinger Band: {latest_lower_bband_price} / Latest Close: {latest_close})")
         return True
 
 async def run_bot(self, db_created_trade_id: str, api_key: str, api_secret: str, ticker: str, quantity: float,
-                  timeframe: str, demo: bool):
+                  timeframe: str, demo: bool, user_id: str = None):
+
+    # Every record this bot logs (in this task and the threads it starts) carries its trade, symbol and user
+    bind_log_context(trade_id=db_created_trade_id, symbol=ticker, user_id=user_id)
 
     buy_timedelta, buy_timeframe, buy_order_type, order_size_dict, h_period, demo, buy_limit = (
         configure_api_parameters(ticker=ticker, quantity=quantity, pair_timeframe=timeframe, demo=demo)
     )
 
-    decrypted_api_key = decrypt_data(api_key, encryption_key)
-    decrypted_api_secret = decrypt_data(api_secret, encryption_key)
-
-    # Connect to Binance
-    binance = initialize_binance_client(decrypted_api_key, decrypted_api_secret, demo)
-    initialize_binance_websocket(decrypted_api_key)
+    # The first decryption in a process fetches the encryption keys, keep that off the loop
+    cipher = get_cipher()
+    decrypted_api_key, decrypted_api_secret = await asyncio.to_thread(
+        lambda: (cipher.decrypt(api_key), cipher.decrypt(api_secret)))
 
-    old_remain_buy = {ticker: datetime.timedelta(days=365)}
-    set_dicts(symbols)
+    trade_db = TradeDB(get_mongo_db())
 
-    std_log(f"[Booting] Complete. Starting Bot Execution With Trade ID: [{db_created_trade_id}]")
-
-    # Trading Bot Starts Executing 👇
-    while True:
-
-        if self.is_aborted():
-            message = f"Task for trade with ID [{db_created_trade_id}] has been aborted!"
-            print(message)
-            return f"Task for trade with ID [{db_created_trade_id}] has been aborted!"
-
-        showed_remain = datetime.timedelta(days=365)  # To show remain time to candle closing
-
-        # 3.1. Buy Routine
-        if ticker in buy_timeframe:  # and len(balance) < buy_limit
-
-            remain = binance.boundaryRemaining(buy_timeframe[ticker])  # Remain time to buy candle closing
-            showed_remain = min(remain, showed_remain)
-
-            if old_remain_buy[ticker] < remain:  # Get into new candle
-
-                start_time = (datetime.datetime.now(datetime.timezone.utc)
-                              - buy_timedelta[ticker] * h_period[ticker] * 2)
-
-                (chart, chart_df, rounded_qty) = binance.get_chart_data(order_size_dict,
-                                                                        ticker,
-                                                                        buy_timeframe[ticker],
-                                                                        start_time,
-                                                                        buy_timedelta)
+    # Connect to Binance
+    state = BotState(ticker)  # This bot's orders and position, released when the bot stops
+    # What the bot does is pushed to the user's dashboard through the API's live endpoint
+    events = state.events = BotEvents(user_id, db_created_trade_id, ticker)
+    binance = initialize_async_binance_client(decrypted_api_key, decrypted_api_secret, demo, state)
+    user_data = get_user_data_manager()
+    market_feed = get_market_data_feed(demo)
+    # Bots sleep until their candle closes; bots sharing a boundary are woken together
+    scheduler = get_candle_scheduler()
+    acquired = False
+    subscription = None
+
+    # Everything acquired from here on is released by the `finally`, also when the bot is stopped while booting
+    try:
+        await binance.load_symbol_info(ticker)  # Load the symbol filters up front, failing fast on unknown symbols
+
+        # Fills arrive on the account's user data stream, shared with the other bots of the same account
+        await user_data.acquire(binance)
+        acquired = True
+
+        # A bot restarted on another worker carries on with the orders it already placed
+        trade = await trade_db.get_trade_by_id(db_created_trade_id)
+        if trade and trade.get("bot_state"):
+            await binance.restore_state(ticker, trade["bot_state"])
+
+        # Closed candles come from the process-wide kline stream shared by every bot. The subscription is
+        # shielded: a stopped bot waits for it to complete below and then undoes it
+        subscription = asyncio.ensure_future(
+            asyncio.to_thread(market_feed.subscribe, binance.sync_client, ticker, timeframe))
+        await asyncio.shield(subscription)
+
+        indicators = IndicatorEngine(band_window=strategy.band_window,
+                                     band_std=strategy.band_std,
+                                     ema_short_period=strategy.ema_short_period,
+                                     ema_long_period=strategy.ema_long_period,
+                                     regime_filter=strategy.regime_filter,
+                                     band_width_filter=strategy.band_width_filter)
+
+        logger.info(f"[Booting] Complete. Starting Bot Execution With Trade ID: [{db_created_trade_id}]")
+
+        # Trading Bot Starts Executing 👇
+        await events.emit("started", timeframe=timeframe)
 
-                (latest_close_price,
-                 latest_lower_bband_price,
-                 latest_upper_bband_price) = get_latest_bbands(chart_df)
+        while True:
 
-                if buy_symbol_pair_order_counter[ticker] > 0:
+            # Stopped bots are cancelled by their runner (pushed aborts, checked again whenever it resubscribes)
+            boundary_ms = await scheduler.wait_next(buy_timeframe[ticker])
+            woke_at = time.perf_counter()
+
+            # 3.1. Buy Routine
+            start_time = (datetime.datetime.now(datetime.timezone.utc)
+                          - buy_timedelta[ticker] * h_period[ticker] * 2)
+
+            rounded_qty = await binance.update_indicators(indicators,
+                                                          order_size_dict,
+                                                          ticker,
+                                                          buy_timeframe[ticker],
+                                                          start_time,
+                                                          market_feed)
+
+            latest_close_price = indicators.close
+            latest_lower_bband_price = indicators.lower_band
+            latest_upper_bband_price = indicators.upper_band
+            # Published in the background, the orders of this candle must not wait for Redis
+            events.emit_soon("candle", close=latest_close_price, lower_band=latest_lower_bband_price,
+                             upper_band=latest_upper_bband_price)
+
+            if state.buy_order_counter > 0:
+
+                position_status = state.order_status
+                order_id = state.buy_order_id
+
+                if position_status == OrderStatus.POSITION:
+
+                    first_target_order = False
+                    # Trade updates are buffered and written in batches with the other bots' updates
+                    trade_db.queue_trade_update(db_created_trade_id, {
+                                                                      "take_profit_price": latest_upper_bband_price,
+                                                                      "order_status": "POSITION"
+                                                                    })
+
+                    if state.take_profit_status == TakeProfitStatus.NOT_PLACED:
+                        take_profit_response = await binance.set_take_profit(ticker,
+                                                                             state.target_order_qty,
+                                                                             latest_upper_bband_price)
+                        first_target_order = True
+                        if take_profit_response:
+                            events.emit_soon("take_profit_placed", price=latest_upper_bband_price,
+                                             order_id=take_profit_response["orderId"])
+
+                    if (first_target_order is False
+                            and state.take_profit_status == TakeProfitStatus.PLACED):
+
+                        take_profit_order_id = state.target_order_id
+                        take_profit_status = state.target_order_status
+
+                        if take_profit_status != OrderStatus.POSITION:
+
+                            take_profit_response = await binance.update_take_profit(ticker,
+                                                                                    take_profit_order_id,
+                                                                                    state.target_order_qty,
+                                                                                    latest_upper_bband_price)
+                            if take_profit_response:
+                                events.emit_soon("take_profit_moved", price=latest_upper_bband_price,
+                                                 order_id=take_profit_response["orderId"])
+                            trade_db.queue_trade_update(db_created_trade_id,
+                                                       {"take_profit_price": latest_upper_bband_price})
+                        else:
+                            state.reset()
+                            events.emit_soon("trade_completed")
+                else:
 
-                    position_status = validate_order_status(ticker)
-                    order_id = buy_symbol_pair_order_id[ticker]
+                    replaced = await binance.replace_position_with_new_order(ticker, order_id, rounded_qty,
+                                                                             latest_lower_bband_price)
+                    if replaced:
+                        events.emit_soon("entry_replaced", price=latest_lower_bband_price, quantity=rounded_qty,
+                                         order_id=replaced["orderId"])
+                    trade_db.queue_trade_update(db_created_trade_id,
+                                               {"price": latest_lower_bband_price})
 
-                    if position_status == OrderStatus.POSITION:
+            # Place to add additional indicators / validations
+            conditions_met = custom_Nate_conditions(binance, ticker, order_size_dict)
 
-                        first_target_order = False
-                        await trade_db.update_trade(db_created_trade_id, {
-                                                                           "take_profit_price": latest_upper_bband_price,
-                                                                           "order_status": "POSITION"
-                                                                         })
+            if conditions_met:
 
-                        if buy_symbol_pair_target_order_status[ticker] == TakeProfitStatus.NOT_PLACED:
-                            take_profit_response = binance.set_take_profit(ticker,
-                                                                           target_order_qty[ticker],
-                                                                           latest_upper_bband_price)
-                            first_target_order = True
+                if state.buy_order_counter == 0:
 
-                        if (first_target_order is False
-                                and buy_symbol_pair_target_order_status[ticker] == TakeProfitStatus.PLACED):
+                    bband_signal_triggered = check_bband_buy_signal(ticker,
+                                                                    latest_close_price,
+                                                                    latest_lower_bband_price)
 
-                            take_profit_order_id = buy_symbol_pair_target_order_id[ticker]
-                            take_profit_status = validate_take_profit_order_status(ticker)
+                    if bband_signal_triggered:
 
-                            if take_profit_status != OrderStatus.POSITION:
+                        if buy_order_type[ticker] == "LMT":
+                            buy_response = await binance.Buy(ticker, rounded_qty, latest_lower_bband_price)
+                            state.buy_order_counter += 1
+                            events.emit_soon("entry_placed", price=latest_lower_bband_price, quantity=rounded_qty,
+                                             order_id=buy_response["orderId"])
+                            trade_db.queue_trade_update(db_created_trade_id,
+                                                       {"price": latest_lower_bband_price})
 
-                                binance.update_take_profit(ticker,
-                                                           take_profit_order_id,
-                                                           target_order_qty[ticker],
-                                                           latest_upper_bband_price)
-                                await trade_db.update_trade(db_created_trade_id,
-                                                            {"take_profit_price": latest_upper_bband_price})
-                            else:
-                                reset_dict_for_symbol(ticker)
                     else:
-
-                        binance.replace_position_with_new_order(ticker, order_id, rounded_qty,
-                                                                latest_lower_bband_price)
-                        await trade_db.update_trade(db_created_trade_id,
-                                                    {"price": latest_lower_bband_price})
-
-                # Place to add additional indicators / validations
-                conditions_met = custom_Nate_conditions(binance, ticker, order_size_dict)
-
-                if conditions_met:
-
-                    if buy_symbol_pair_order_counter[ticker] == 0:
-
-                        bband_signal_triggered = check_bband_buy_signal(ticker,
-                                                                        latest_close_price,
-                                                                        latest_lower_bband_price)
-
-                        if bband_signal_triggered:
-
-                            if buy_order_type[ticker] == "LMT":
-                                binance.Buy(ticker, rounded_qty, latest_lower_bband_price)
-                                buy_symbol_pair_order_counter[ticker] += 1
-                                await trade_db.update_trade(db_created_trade_id,
-                                                            {"price": latest_lower_bband_price})
-
-                        else:
-                            std_log(
-                                "[%s] Bollinger Band Condition Not Met For BUY Position . No Order/Positions Set.")
-
-            old_remain_buy[ticker] = remain
-
-        # 3.3. Log
-        r_hour = int(showed_remain.seconds / 3600)
-        r_minute = int((showed_remain.seconds - 3600 * r_hour) / 60)
-        r_second = showed_remain.seconds - 3600 * r_hour - 60 * r_minute
-        text = ""
-
-        if showed_remain.days == 0:
-            text = text + " Time to next candle .. %02d:%02d:%02d           " % (r_hour,
-                                                                                 r_minute, r_second)
-        else:
-            text = text + " Time to next candle .. %d days %02d:%02d:%02d   " % (showed_remain.days,
-                                                                                 r_hour, r_minute,
-                                                                                 r_second)
-
-        print("\r" + cur_time() + text, end="\r")
-        time.sleep(1)
+                        logger.info(
+                            f"[{ticker}] Bollinger Band Condition Not Met For BUY Position . No Order/Positions Set.")
+
+            # Persisted every cycle (coalesced by the write-behind buffer) for `restore_state`
+            trade_db.queue_trade_update(db_created_trade_id, {"bot_state": state.snapshot()})
+
+            # 3.3. Log, at most once per COUNTDOWN_LOG_INTERVAL per bot so short timeframes don't flood the log
+            if countdown_throttle.allow(db_created_trade_id):
+                remain = binance.boundaryRemaining(buy_timeframe[ticker])  # Remain time to next candle closing
+                r_hour = int(remain.seconds / 3600)
+                r_minute = int((remain.seconds - 3600 * r_hour) / 60)
+                r_second = remain.seconds - 3600 * r_hour - 60 * r_minute
+
+                if remain.days == 0:
+                    logger.info(f"[{ticker}] Time to next candle .. %02d:%02d:%02d" % (r_hour, r_minute, r_second))
+                else:
+                    logger.info(f"[{ticker}] Time to next candle .. %d days %02d:%02d:%02d" % (remain.days, r_hour,
+                                                                                          r_minute, r_second))
+            # How late after the candle closed this bot has acted on it
+            CYCLE_SECONDS.labels(timeframe).observe(time.perf_counter() - woke_at)
+            CANDLE_LAG_SECONDS.labels(timeframe).observe(max(time.time() - boundary_ms / 1000, 0))
+    finally:
+        countdown_throttle.forget(db_created_trade_id)
+        if subscription is not None:
+            # `subscribe` counts the bot in as soon as it starts, even if its backfill then fails
+            await asyncio.gather(subscription, return_exceptions=True)
+            # Closing a connection left without streams waits for the close handshake, off the shared loop
+            await asyncio.to_thread(market_feed.unsubscribe, ticker, timeframe)
+        state.release()
+        if acquired:
+            await user_data.release(binance)
+        await events.emit("stopped")
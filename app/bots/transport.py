@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..metrics import REST_SECONDS
+from .rate_limit import new_async_rate_limiter, new_rate_limiter, rate_limit_enabled
+
+logger = logging.getLogger(__name__)
+
+
+def parse_host_limits(value):
+    """Parse "api.binance.com=50,testnet.binance.vision=10" into {host: pool size}."""
+    limits = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            host, size = item.split("=", 1)
+            limits[host.strip()] = int(size)
+    return limits
+
+
+class LatencyStats:
+    """Request counters and latencies of one (method, path) route."""
+
+    def __init__(self, samples=512):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.samples = deque(maxlen=samples)
+
+    def record(self, elapsed, error):
+        self.count += 1
+        self.errors += error
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.last = elapsed
+        self.samples.append(elapsed)
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+            "last_ms": self.last * 1000,
+        }
+
+
+class RouteStats:
+    """Latency counters keyed by (method, path), shared by the sync and async transports."""
+
+    def __init__(self):
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    def record(self, method, path, elapsed, error):
+        REST_SECONDS.labels(method, path, "error" if error else "ok").observe(elapsed)
+        with self.stats_lock:
+            stats = self.stats.get((method, path))
+            if stats is None:
+                stats = self.stats[(method, path)] = LatencyStats()
+            stats.record(elapsed, error)
+
+    def latency_stats(self):
+        """Snapshot of the counters, keyed by "METHOD /path"."""
+        with self.stats_lock:
+            return {f"{method} {path}": stats.snapshot() for (method, path), stats in self.stats.items()}
+
+
+class HttpTransport(RouteStats):
+    """Pooled keep-alive HTTP transport shared by every client in the process.
+
+    One `requests.Session` holds a connection pool per host, so signed orders,
+    cancelReplace and kline requests reuse established TCP/TLS connections.
+    `pool_maxsize` bounds the connections kept per host; `host_limits` overrides
+    it for specific hosts. Latencies are recorded per (method, path). With a
+    `limiter` (see `rate_limit.RateLimiter`) every request waits for its
+    Binance request weight first and reports the used weight back.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=20, pool_block=False, host_limits=None, timeout=10,
+                 limiter=None):
+        super().__init__()
+        self.timeout = timeout
+        self.limiter = limiter
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                                   pool_block=pool_block))
+        self.session.mount("http://", HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                                  pool_block=pool_block))
+        for host, maxsize in (host_limits or {}).items():
+            self.session.mount(f"https://{host}", HTTPAdapter(pool_connections=1, pool_maxsize=maxsize,
+                                                              pool_block=pool_block))
+
+    def request(self, method, url, headers=None, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        if self.limiter is not None:
+            self.limiter.acquire(method, url, headers)
+        start = time.perf_counter()
+        error = True
+        try:
+            response = self.session.request(method, url, headers=headers, **kwargs)
+            error = response.status_code >= 400
+            if self.limiter is not None:
+                self.limiter.observe(url, response.status_code, response.headers, headers)
+            return response
+        finally:
+            self.record(method, urlsplit(url).path, time.perf_counter() - start, error)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncHttpTransport(RouteStats):
+    """aiohttp counterpart of `HttpTransport` for clients running on an event loop.
+
+    `limit` bounds the connections kept in total and `limit_per_host` per host.
+    An aiohttp session belongs to the loop it was created on, so there is one
+    transport per event loop (see `get_async_transport`), and one `limiter`.
+    """
+
+    def __init__(self, limit=100, limit_per_host=20, timeout=10, limiter=None):
+        super().__init__()
+        self.limiter = limiter
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        )
+
+    async def request_json(self, method, url, headers=None, **kwargs):
+        if self.limiter is not None:
+            await self.limiter.acquire(method, url, headers)
+        start = time.perf_counter()
+        error = True
+        try:
+            async with self.session.request(method, url, headers=headers, **kwargs) as response:
+                error = response.status >= 400
+                if self.limiter is not None:
+                    await self.limiter.observe(url, response.status, response.headers, headers)
+                return await response.json(content_type=None)
+        finally:
+            self.record(method, urlsplit(url).path, time.perf_counter() - start, error)
+
+    async def close(self):
+        await self.session.close()
+        if self.limiter is not None:
+            await self.limiter.client.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+_async_transports = weakref.WeakKeyDictionary()
+
+
+def get_transport():
+    """Process-wide transport, sized from HTTP_POOL_* environment variables."""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HttpTransport(
+                pool_connections=int(os.getenv("HTTP_POOL_CONNECTIONS", "10")),
+                pool_maxsize=int(os.getenv("HTTP_POOL_MAXSIZE", "20")),
+                pool_block=os.getenv("HTTP_POOL_BLOCK", "false").lower() == "true",
+                host_limits=parse_host_limits(os.getenv("HTTP_HOST_POOL_MAXSIZE")),
+                timeout=float(os.getenv("HTTP_TIMEOUT", "10")),
+                limiter=new_rate_limiter() if rate_limit_enabled() else None,
+            )
+        return _transport
+
+
+def get_async_transport():
+    """Transport of the running event loop, sized from HTTP_ASYNC_POOL_LIMIT (total) and HTTP_POOL_MAXSIZE (per host)."""
+    loop = asyncio.get_running_loop()
+    transport = _async_transports.get(loop)
+    if transport is None or transport.session.closed:
+        transport = _async_transports[loop] = AsyncHttpTransport(
+            limit=int(os.getenv("HTTP_ASYNC_POOL_LIMIT", "100")),
+            limit_per_host=int(os.getenv("HTTP_POOL_MAXSIZE", "20")),
+            timeout=float(os.getenv("HTTP_TIMEOUT", "10")),
+            limiter=new_async_rate_limiter() if rate_limit_enabled() else None,
+        )
+    return transport
+
+
+def rate_limit_stats(loop=None):
+    """Throttling counters of the process transport and of the transport of `loop`."""
+    stats = {}
+    if _transport is not None and _transport.limiter is not None:
+        stats["sync"] = _transport.limiter.stats()
+    transport = _async_transports.get(loop) if loop is not None else None
+    if transport is not None and transport.limiter is not None:
+        stats["async"] = transport.limiter.stats()
+    return stats
+
+
+def transport_stats(loop=None):
+    """Per-route latencies of the process transport and of the transport of `loop`."""
+    stats = {}
+    if _transport is not None:
+        stats["sync"] = _transport.latency_stats()
+    transport = _async_transports.get(loop) if loop is not None else None
+    if transport is not None:
+        stats["async"] = transport.latency_stats()
+    return stats
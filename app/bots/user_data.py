@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import weakref
+
+import aiohttp
+
+from ..logging_config import clear_log_context
+from ..metrics import observe_message
+from .bot_state import apply_execution_report
+
+logger = logging.getLogger(__name__)
+
+STREAM_URLS = {
+    "https://api.binance.com": "wss://stream.binance.com:9443/ws",
+    "https://testnet.binance.vision": "wss://testnet.binance.vision/ws",
+}
+
+
+class UserDataStream:
+    """One account's user data stream, shared by every bot running with that API key."""
+
+    def __init__(self, client):
+        self.client = client
+        self.listen_key = None
+        self.refs = 0
+        self.task = None
+        self.connected = False
+        self.messages = 0
+        self.reconnects = 0
+        self.lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.renewed_at = 0.0
+        self.last_message_at = 0.0
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "bots": self.refs,
+            "messages": self.messages,
+            "reconnects": self.reconnects,
+            "lag_ms": self.lag_ms,
+            "max_lag_ms": self.max_lag_ms,
+            "last_message_age_s": time.time() - self.last_message_at if self.last_message_at else None,
+        }
+
+
+class UserDataStreamManager:
+    """Runs the listen-key WebSocket connections of every bot on one event loop.
+
+    Bots `acquire` the stream of their account and `release` it when they stop;
+    the last release closes the socket and the listen key, and the account's
+    next `acquire` waits for that close to finish. Connections are
+    restarted with exponential backoff (up to `max_backoff` seconds), and one
+    renewal task keeps every listen key alive, renewing it once
+    `renew_interval` seconds have passed (Binance expires keys after 60 minutes).
+    Execution reports of filled orders are applied to the owning bot's state.
+    The sockets hold their connection for as long as they live, so they get a
+    session of their own without a per-host cap rather than taking slots of
+    the REST transport's pool.
+    """
+
+    def __init__(self, renew_interval=1800, renew_check_interval=60, max_backoff=60):
+        self.renew_interval = renew_interval
+        self.renew_check_interval = renew_check_interval
+        self.max_backoff = max_backoff
+        self.streams = {}
+        self.closing = {}  # key -> future done once the released stream's listen key is closed
+        self.renew_task = None
+        self.session = None
+
+    def ws_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0, limit_per_host=0))
+        return self.session
+
+    def key(self, client):
+        return f"{client.baseurl}|{client.apikey}"
+
+    async def acquire(self, client):
+        key = self.key(client)
+        # Binance hands out the same listen key again, wait until a released stream has closed it
+        while key in self.closing:
+            await asyncio.shield(self.closing[key])
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.streams[key] = UserDataStream(client)
+            stream.task = asyncio.create_task(self.run(stream), name="user-data-stream")
+        stream.refs += 1
+
+        if self.renew_task is None or self.renew_task.done():
+            self.renew_task = asyncio.create_task(self.renew_listen_keys(), name="user-data-renewal")
+        return stream
+
+    async def release(self, client):
+        key = self.key(client)
+        stream = self.streams.get(key)
+        if stream is None:
+            return
+        stream.refs -= 1
+        if stream.refs > 0:
+            return
+
+        del self.streams[key]
+        closed = self.closing[key] = asyncio.get_running_loop().create_future()
+        # Decided before awaiting: a stream acquired meanwhile gets a new session and renewal task
+        session = None
+        if not self.streams:
+            if self.renew_task is not None:
+                self.renew_task.cancel()
+                self.renew_task = None
+            session, self.session = self.session, None
+
+        try:
+            stream.task.cancel()
+            await asyncio.gather(stream.task, return_exceptions=True)
+            if stream.listen_key is not None:
+                try:
+                    await stream.client.close_user_data_stream(stream.listen_key)
+                except Exception as e:
+                    logger.error(f"[UserData] Could not close listen key: {e}")
+            if session is not None:
+                await session.close()
+        finally:
+            del self.closing[key]
+            closed.set_result(None)
+
+    async def run(self, stream):
+        """Keep the stream connected until it is released."""
+        clear_log_context()  # Shared by every bot of the account
+        backoff = 1
+        while True:
+            try:
+                # Returns the active listen key of the account, or a new one if it expired
+                stream.listen_key = await stream.client.start_user_data_stream()
+                if not stream.listen_key:
+                    raise ConnectionError("Binance did not return a listen key")
+                stream.renewed_at = time.time()
+                url = f"{STREAM_URLS[stream.client.baseurl]}/{stream.listen_key}"
+
+                async with self.ws_session().ws_connect(url, timeout=10) as ws:
+                    stream.connected = True
+                    backoff = 1
+                    logger.info(f"[UserData] Connection opened ({len(self.streams)} streams)")
+
+                    async for message in ws:
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            self.on_message(stream, json.loads(message.data))
+                        elif message.type == aiohttp.WSMsgType.ERROR:
+                            raise ConnectionError(ws.exception())
+                        if stream.listen_key is None:
+                            break  # Expired, reconnect with a new key
+
+                logger.info("[UserData] Connection closed by the server")
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[UserData] Connection error, reconnecting in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                stream.connected = False
+            stream.reconnects += 1
+
+    def on_message(self, stream, data):
+        start = time.perf_counter()
+        stream.messages += 1
+        stream.last_message_at = time.time()
+        if "E" in data:
+            stream.lag_ms = stream.last_message_at * 1000 - data["E"]
+            stream.max_lag_ms = max(stream.max_lag_ms, stream.lag_ms)
+
+        try:
+            if data.get('e') == 'executionReport':
+                apply_execution_report(data)
+            elif data.get('e') == 'listenKeyExpired':
+                stream.listen_key = None
+        finally:
+            observe_message("user_data", start, data.get("E"))
+
+    async def renew_listen_keys(self):
+        clear_log_context()
+        while True:
+            await asyncio.sleep(self.renew_check_interval)
+            now = time.time()
+            for stream in list(self.streams.values()):
+                if stream.listen_key is None or now - stream.renewed_at < self.renew_interval:
+                    continue
+                try:
+                    await stream.client.renew_listen_key(stream.listen_key)
+                    stream.renewed_at = now
+                except Exception as e:
+                    logger.error(f"[UserData] Listen key renewal failed: {e}")
+
+    def stats(self):
+        streams = list(self.streams.values())
+        return {
+            "streams": len(streams),
+            "connected": sum(stream.connected for stream in streams),
+            "bots": sum(stream.refs for stream in streams),
+            "max_lag_ms": max((stream.lag_ms for stream in streams), default=0.0),
+            "per_stream": [stream.stats() for stream in streams],
+        }
+
+
+_managers = weakref.WeakKeyDictionary()
+
+
+def get_user_data_manager(loop=None):
+    """Manager of `loop`, by default the running event loop (the bot runner's loop in a worker)."""
+    loop = loop or asyncio.get_running_loop()
+    manager = _managers.get(loop)
+    if manager is None:
+        manager = _managers[loop] = UserDataStreamManager(
+            renew_interval=int(os.getenv("LISTEN_KEY_RENEW_INTERVAL", "1800")),
+        )
+    return manager
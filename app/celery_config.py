@@ -1,3 +1,5 @@
+import os
+
 from celery import Celery
 
 celery_app = Celery(
@@ -18,3 +20,15 @@ celery_app.conf.update(
     worker_prefetch_multiplier=1,  # This tells workers to fetch one message at a time
     task_acks_late=True  # Ensures tasks are acknowledged after they're completed
 )
+
+# Periodic jobs, run by `celery -A app.celery_worker beat`
+celery_app.conf.beat_schedule = {
+    'reconcile-user-summaries': {
+        'task': 'reconcile_user_summaries',
+        'schedule': float(os.getenv('SUMMARY_RECONCILE_INTERVAL', '900')),
+    },
+    'recover-bots': {
+        'task': 'recover_bots',
+        'schedule': float(os.getenv('BOT_RECOVERY_INTERVAL', '120')),
+    },
+}
@@ -1,12 +1,166 @@
-from celery.contrib.abortable import AbortableTask
+from celery.contrib.abortable import AbortableAsyncResult, AbortableTask
+from celery.exceptions import Ignore
+from celery.signals import (after_setup_logger, worker_process_init, worker_process_shutdown, worker_ready,
+                            worker_shutting_down)
+from celery.worker.control import inspect_command
 import asyncio
+import functools
+import logging
+import os
 from .celery_config import celery_app
+from .bots.bot_runner import RunnerFull, get_bot_runner, lease_key
+from .bots.credentials import get_cipher
 from .bots.trading_bot import run_bot
+from .db.base_repo import MongoDB
+from .db.trades_repo import TradeDB
+from .db.cache import cache_stats
+from .logging_config import configure_logging, logging_stats
+from .metrics import register_stats, start_metrics_server
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
 
 @celery_app.task(name="execute_trade", bind=True, base=AbortableTask)
-def execute_trade(self, db_created_trade_id, api_key, api_secret, ticker, quantity, timeframe, demo):
+def execute_trade(self, db_created_trade_id, api_key, api_secret, ticker, quantity, timeframe, demo, user_id=None):
+
+    # The bot runs on this process' bot runner, next to many others, instead of pinning the worker
+    runner = get_bot_runner()
+    task_id = self.request.id
+    bot_kwargs = dict(db_created_trade_id=db_created_trade_id, api_key=api_key, api_secret=api_secret,
+                      ticker=ticker, quantity=quantity, timeframe=timeframe, demo=demo, user_id=user_id)
+
+    abortable_result = AbortableAsyncResult(task_id, app=celery_app)
+    if abortable_result.is_aborted():
+        return f"Task for trade with ID [{db_created_trade_id}] has been aborted!"  # Stopped while queued
+
+    # Duplicates (e.g. a recovery racing the original message) find the bot leased by another runner
+    if not runner.claim(task_id):
+        logger.info(f"Bot {task_id} is already hosted by another runner")
+        raise Ignore()
+
+    self.update_state(state="RUNNING", meta={"runner": runner.name})
+    try:
+        runner.submit(task_id, ticker, bot_kwargs, functools.partial(run_bot, abortable_result),
+                      on_done=store_bot_result, is_aborted=abortable_result.is_aborted)
+    except RunnerFull as e:
+        runner.release_claim(task_id)
+        raise self.retry(exc=e, countdown=30, max_retries=None)
+
+    # The result is stored by store_bot_result once the bot stops
+    raise Ignore()
+
+
+def store_bot_result(task_id, result, exception):
+    if exception is not None:
+        celery_app.backend.mark_as_failure(task_id, exception)
+    elif result is not None:
+        celery_app.backend.mark_as_done(task_id, result)
+
+
+@celery_app.task(name="reconcile_user_summaries")
+def reconcile_user_summaries():
+    """Correct the per-user investment totals that drifted from the trades, run by celery beat."""
+
+    async def reconcile():
+        # A client of its own: the bots' client belongs to the runner loop
+        mongo_db = MongoDB(str(os.getenv('MONGODB_URI')), "test")
+        try:
+            return await TradeDB(mongo_db).reconcile_summaries()
+        finally:
+            mongo_db.client.close()
+
+    return asyncio.run(reconcile())
+
+
+def trade_task_kwargs(trade):
+    """`execute_trade` arguments of a stored trade."""
+    return dict(db_created_trade_id=str(trade["_id"]), api_key=trade["api_key"], api_secret=trade["api_secret"],
+                ticker=trade["ticker"], quantity=trade["quantity"], timeframe=trade["timeframe"],
+                demo=trade["demo"], user_id=trade["user_id"])
+
+
+@celery_app.task(name="recover_bots")
+def recover_bots():
+    """Start the bots of active trades that no runner holds a lease for, e.g. after their worker crashed.
+
+    Run by celery beat and once after a worker starts. Finished, failed and
+    stopped bots are left alone; a bot that is merely still queued gets a
+    duplicate message, which finds it leased once it started and is ignored.
+    """
+
+    async def active_trades():
+        mongo_db = MongoDB(str(os.getenv('MONGODB_URI')), "test")
+        try:
+            return await TradeDB(mongo_db).get_all_trades()
+        finally:
+            mongo_db.client.close()
+
+    trades = [trade for trade in asyncio.run(active_trades()) if trade.get("task_id")]
+    with get_redis().pipeline(transaction=False) as pipe:
+        for trade in trades:
+            pipe.exists(lease_key(trade["task_id"]))
+        leased = pipe.execute()
+
+    recovered = 0
+    for trade, is_leased in zip(trades, leased):
+        task_id = trade["task_id"]
+        if is_leased:
+            continue
+        if "demo" not in trade:
+            # Trades created before the account type was stored; guessing could send orders to the wrong exchange
+            logger.error(f"Cannot recover bot {task_id}: its trade does not record whether it is a demo account")
+            continue
+        result = AbortableAsyncResult(task_id, app=celery_app)
+        if result.is_aborted() or result.state in ("SUCCESS", "FAILURE"):
+            continue
+        execute_trade.apply_async(kwargs=trade_task_kwargs(trade), task_id=task_id)
+        recovered += 1
+        logger.info(f"Recovered bot {task_id} on {trade['ticker']}")
+    return recovered
+
+
+@inspect_command()
+def runner_stats(state):
+    """Capacity of this worker's bot runner, collected by the API's /bot/runners."""
+    return get_bot_runner().stats()
+
+
+@after_setup_logger.connect
+def log_to_file(**kwargs):
+    configure_logging()
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    # Prefork children get their runner and keys up front; with other pools they are created on first use
+    get_bot_runner().start()
+    register_stats("runner", lambda: get_bot_runner().stats())
+    register_stats("cache", cache_stats)
+    register_stats("credentials", lambda: get_cipher().stats())
+    register_stats("logging", logging_stats)
+    start_metrics_server()
+    try:
+        get_cipher().load()
+    except Exception as e:
+        logger.error(f"Could not load the encryption keys, retrying on the first bot: {e}")
+
 
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(run_bot(self, db_created_trade_id, api_key, api_secret, ticker, quantity, timeframe, demo))
+@worker_ready.connect
+def run_startup_jobs(**kwargs):
+    # Leases of a crashed worker expire after BOT_LEASE_TTL, its bots are recovered once they have
+    recover_bots.apply_async(countdown=get_bot_runner().lease_ttl)
+    # Backfills the summaries of users that had trades before summaries existed, rather than waiting for beat
+    reconcile_user_summaries.delay()
 
 
+# Bots live in the pool processes under prefork (worker_process_shutdown) and in the main one with solo
+@worker_shutting_down.connect
+@worker_process_shutdown.connect
+def requeue_hosted_bots(**kwargs):
+    # Hand the bots of a stopping worker back to the queue so another runner picks them up
+    for bot in get_bot_runner().drain():
+        if AbortableAsyncResult(bot.task_id, app=celery_app).is_aborted():
+            continue
+        execute_trade.apply_async(kwargs=bot.kwargs, task_id=bot.task_id)
+        logger.info(f"Requeued bot {bot.task_id} on {bot.ticker}")
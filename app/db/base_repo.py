@@ -1,14 +1,36 @@
 # base_repo.py
+import logging
+import os
+import threading
+
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+from ..metrics import MongoCommandMetrics
+
+logger = logging.getLogger(__name__)
 
 class MongoDB:
     def __init__(self, uri, db_name):
-        self.client = AsyncIOMotorClient(uri)
+        # Every command of the client is timed, covering the repos and the write-behind bulk writes
+        self.client = AsyncIOMotorClient(uri, event_listeners=[MongoCommandMetrics()])
         self.db = self.client[db_name]
 
     def get_collection(self, collection_name):
         return self.db[collection_name]
 
+    async def ensure_indexes(self, *repos):
+        """Create the `INDEXES` of each repo; existing indexes are left as they are."""
+        for repo in repos:
+            if not repo.INDEXES:
+                continue
+            try:
+                names = await repo.collection.create_indexes(repo.INDEXES)
+                logger.info(f"[Mongo] Indexes of {repo.collection.name}: {names}")
+            except PyMongoError as e:
+                # e.g. duplicates left over from before a unique index existed
+                logger.error(f"[Mongo] Could not create the indexes of {repo.collection.name}: {e}")
+
     async def fetch_one(self, collection, query):
         document = await self.db[collection].find_one(query)
         if document:
@@ -33,3 +55,16 @@ class MongoDB:
     async def delete(self, collection, query):
         result = await self.db[collection].delete_one(query)
         return result.deleted_count
+
+
+_mongo_db = None
+_mongo_db_lock = threading.Lock()
+
+
+def get_mongo_db():
+    """Process-wide client of the MONGODB_URI database, created on first use rather than on import."""
+    global _mongo_db
+    with _mongo_db_lock:
+        if _mongo_db is None:
+            _mongo_db = MongoDB(str(os.getenv('MONGODB_URI')), "test")
+        return _mongo_db
@@ -0,0 +1,108 @@
+import logging
+import os
+
+from bson import json_util
+from redis.exceptions import RedisError
+
+from ..redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def snapshot(self):
+        reads = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / reads if reads else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+
+class ReadThroughCache:
+    """Redis read-through cache of the documents one repo looks up, expiring after `ttl` seconds.
+
+    `get` serves a key from Redis or loads it from Mongo and stores it, `None`
+    included unless `cache_misses` is off, so polling for a missing document
+    stays off Mongo too. The repo
+    write methods call `invalidate`; a cached document can also be reached
+    through aliases (e.g. its `_id` when it is cached by user id), stored next
+    to it, so writes that only know the alias still drop it. If Redis is
+    unavailable reads go straight to Mongo.
+    """
+
+    def __init__(self, name, ttl=30):
+        self.name = name
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    def key(self, *parts):
+        return f"cache:{self.name}:{':'.join(str(part) for part in parts)}"
+
+    async def get(self, key, load, aliases=None, cache_misses=True):
+        """Cached value of `key`, or `await load()` cached under `key` and `aliases(value)`."""
+        client = get_async_redis()
+        try:
+            cached = await client.get(key)
+        except RedisError as e:
+            self.stats.errors += 1
+            logger.error(f"[Cache] Redis unavailable, reading {key} from Mongo: {e}")
+            return await load()
+
+        if cached is not None:
+            self.stats.hits += 1
+            return json_util.loads(cached)
+
+        self.stats.misses += 1
+        value = await load()
+        if value is None and not cache_misses:
+            return value
+        try:
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.set(key, json_util.dumps(value), ex=self.ttl)
+                for alias in (aliases(value) if aliases else ()):
+                    pipe.set(alias, key, ex=self.ttl)
+                await pipe.execute()
+        except RedisError as e:
+            self.stats.errors += 1
+            logger.error(f"[Cache] Could not cache {key}: {e}")
+        return value
+
+    async def invalidate(self, keys=(), aliases=()):
+        """Drop `keys` and the keys `aliases` point to."""
+        keys = list(keys)
+        aliases = list(aliases)
+        if not keys and not aliases:
+            return
+        client = get_async_redis()
+        try:
+            if aliases:
+                keys += [key for key in await client.mget(aliases) if key is not None]
+            await client.delete(*keys, *aliases)
+            self.stats.invalidations += 1
+        except RedisError as e:
+            self.stats.errors += 1
+            logger.error(f"[Cache] Could not invalidate {keys + aliases}: {e}")
+
+
+_caches = {}
+
+
+def get_cache(name):
+    """Cache `name` of this process, expiring after CACHE_TTL seconds."""
+    cache = _caches.get(name)
+    if cache is None:
+        cache = _caches[name] = ReadThroughCache(name, ttl=int(os.getenv("CACHE_TTL", "30")))
+    return cache
+
+
+def cache_stats():
+    return {name: cache.stats.snapshot() for name, cache in _caches.items()}
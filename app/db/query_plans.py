@@ -0,0 +1,22 @@
+def plan_stages(plan):
+    """Every stage name of an explain() winning plan."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_stages(value)
+
+
+async def check_query_plans(repos):
+    """explain() the `QUERIES` of each repo; returns the queries whose winning plan scans the whole collection."""
+    scans = []
+    for repo in repos:
+        for name, query in repo.QUERIES.items():
+            explain = await repo.collection.find(query).explain()
+            stages = set(plan_stages(explain["queryPlanner"]["winningPlan"]))
+            if "COLLSCAN" in stages:
+                scans.append(f"{repo.collection.name}.{name}")
+    return scans
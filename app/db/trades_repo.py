@@ -1,37 +1,60 @@
 from bson.objectid import ObjectId
+from pymongo import IndexModel
 import logging
+
+from .cache import get_cache
+from .user_summary_repo import UserSummaryDB
+from .write_behind import get_write_behind
+
 logger = logging.getLogger(__name__)
 
 class TradeDB:
+    # Only one active trade per user, so user_id is unique; task_id is set on every trade the API creates
+    INDEXES = [
+        IndexModel("user_id", name="user_id_unique", unique=True),
+        IndexModel("task_id", name="task_id"),
+    ]
+
+    # Filter of each query, checked against the indexes by tests/test_query_plans.py
+    QUERIES = {
+        "get_trade_by_id": {"_id": ObjectId()},
+        "get_trade_by_task_id": {"task_id": ""},
+        "get_trade_by_user_id": {"user_id": ""},
+        "update_trade": {"_id": ObjectId()},
+    }
+
     def __init__(self, mongo_db):
         self.collection = mongo_db.get_collection("trades")
+        # Trades cached by user id, reachable by trade id for the writes that only know that
+        self.cache = get_cache("trades")
+        # Investment totals, kept in step with every trade created or deleted here
+        self.summaries = UserSummaryDB(mongo_db, trades=self.collection)
 
     async def get_total_investment_by_user(self, user_id: str):
-        pipeline = [
-            {"$match": {"user_id": user_id}},
-            {"$group": {
-                "_id": "$user_id",
-                "total_investment": {
-                    "$sum": "$quantity"
-                }
-            }}
-        ]
-        result = await self.collection.aggregate(pipeline).to_list(None)
-        logger.info(result)
-        if result:
-            return result[0]['total_investment']
-        return 0
+        return await self.summaries.get_total_investment(user_id)
+
+    async def get_trade_by_id(self, trade_id: str):
+        return await self.collection.find_one({"_id": ObjectId(trade_id)})
 
     async def get_trade_by_task_id(self, task_id: str):
         return await self.collection.find_one({"task_id": task_id})
 
+    async def invalidate_trades(self, trade_ids):
+        await self.cache.invalidate(aliases=[self.cache.key("id", trade_id) for trade_id in trade_ids])
+
     async def delete_trade_by_id(self, trade_id: str):
-        result = await self.collection.delete_one({"_id": ObjectId(trade_id)})
-        return result.deleted_count
+        trade = await self.collection.find_one_and_delete({"_id": ObjectId(trade_id)})
+        if trade is None:
+            return 0
+        await self.cache.invalidate([self.cache.key("user", trade["user_id"])])
+        await self.summaries.remove_trade(trade["user_id"], trade.get("quantity", 0))
+        return 1
 
     async def create_trade(self, trade_data: dict):
         result = await self.collection.insert_one(trade_data)
         inserted_id = result.inserted_id
+        await self.cache.invalidate([self.cache.key("user", trade_data["user_id"])])
+        await self.summaries.add_trade(trade_data["user_id"], trade_data.get("quantity", 0))
         return str(inserted_id)
 
     async def get_all_trades_by_user_id(self, user_id: str):
@@ -40,7 +63,9 @@ class TradeDB:
         return trades
 
     async def get_trade_by_user_id(self, user_id: str):
-        trade = await self.collection.find_one({"user_id": user_id})
+        trade = await self.cache.get(self.cache.key("user", user_id),
+                                     lambda: self.collection.find_one({"user_id": user_id}),
+                                     aliases=lambda trade: [self.cache.key("id", trade["_id"])] if trade else [])
         return trade
 
     async def get_all_trades(self):
@@ -50,8 +75,23 @@ class TradeDB:
 
     async def update_trade(self, trade_id: str, update_data: dict):
         result = await self.collection.update_one({"_id": ObjectId(trade_id)}, {"$set": update_data})
+        await self.invalidate_trades([trade_id])
         return result.modified_count
 
+    def queue_trade_update(self, trade_id: str, update_data: dict):
+        """Buffered `update_trade`: merged with the trade's other pending updates and written in the next batch."""
+        get_write_behind(self.collection, on_flushed=self.invalidate_trades).set(ObjectId(trade_id), update_data)
+
     async def delete_trade_by_user_id(self, user_id: str):
-        result = await self.collection.delete_many({"user_id": user_id})
-        return result.deleted_count
+        deleted_count = 0
+        while True:
+            trade = await self.collection.find_one_and_delete({"user_id": user_id})
+            if trade is None:
+                await self.cache.invalidate([self.cache.key("user", user_id)])
+                return deleted_count
+            await self.summaries.remove_trade(user_id, trade.get("quantity", 0))
+            deleted_count += 1
+
+    async def reconcile_summaries(self):
+        """Recompute the investment totals from the trades, correcting any drift."""
+        return await self.summaries.reconcile(self.collection)
@@ -0,0 +1,136 @@
+import datetime
+import logging
+
+from pymongo import UpdateOne
+
+from .cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+
+class UserSummaryDB:
+    """Per-user totals of the trades collection, one document per user keyed by the user id.
+
+    `add_trade` and `remove_trade` keep the totals current with `$inc`, so the
+    investment status is a point read on `_id` instead of an aggregation over
+    the user's trades. `reconcile` recomputes every total from the trades and
+    corrects whatever drifted, e.g. after a failed `$inc`.
+    """
+
+    INDEXES = []
+
+    # Filter of each query, checked against the indexes by tests/test_query_plans.py
+    QUERIES = {
+        "get_total_investment": {"_id": ""},
+    }
+
+    def __init__(self, mongo_db, trades=None):
+        self.collection = mongo_db.get_collection("user_summaries")
+        # The trades collection, aggregated for users whose summary does not exist yet
+        self.trades = trades
+        self.cache = get_cache("user_summaries")
+
+    async def increment(self, user_id: str, quantity: float, trades: int):
+        await self.collection.update_one(
+            {"_id": user_id},
+            {"$inc": {"total_investment": quantity, "trades": trades},
+             "$set": {"updated_at": datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True,
+        )
+        await self.cache.invalidate([self.cache.key(user_id)])
+
+    async def add_trade(self, user_id: str, quantity: float):
+        await self.increment(user_id, quantity, 1)
+
+    async def remove_trade(self, user_id: str, quantity: float):
+        await self.increment(user_id, -quantity, -1)
+
+    async def get_total_investment(self, user_id: str):
+        summary = await self.cache.get(self.cache.key(user_id), lambda: self.load_summary(user_id))
+        return summary["total_investment"] if summary else 0
+
+    async def load_summary(self, user_id: str):
+        summary = await self.collection.find_one({"_id": user_id}, {"total_investment": 1})
+        if summary is not None or self.trades is None:
+            return summary
+        # No summary yet (e.g. trades from before summaries existed): aggregate and store it, unless an `$inc`
+        # created it meanwhile
+        totals = await self.trades.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$group": {"_id": "$user_id", "total_investment": {"$sum": "$quantity"}, "trades": {"$sum": 1}}},
+        ]).to_list(None)
+        if not totals:
+            return None
+        await self.collection.update_one(
+            {"_id": user_id},
+            {"$setOnInsert": {"total_investment": totals[0]["total_investment"], "trades": totals[0]["trades"],
+                              "updated_at": datetime.datetime.now(datetime.timezone.utc)}},
+            upsert=True,
+        )
+        return totals[0]
+
+    async def reconcile(self, trades_collection, batch_size=1000):
+        """Recompute every user's totals from `trades_collection`; returns the number of summaries corrected.
+
+        Totals are written `batch_size` users at a time; summaries of users
+        the trades no longer mention are then zeroed, also in batches.
+        """
+        pipeline = [
+            {"$group": {"_id": "$user_id", "total_investment": {"$sum": "$quantity"}, "trades": {"$sum": 1}}},
+        ]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        seen = set()
+        corrected = 0
+
+        batch = []
+        async for total in trades_collection.aggregate(pipeline, allowDiskUse=True):
+            seen.add(total["_id"])
+            batch.append(total)
+            if len(batch) >= batch_size:
+                corrected += await self.write_totals(batch, now)
+                batch = []
+        if batch:
+            corrected += await self.write_totals(batch, now)
+
+        # Users left without trades
+        emptied = []
+        async for summary in self.collection.find(
+                {"$or": [{"total_investment": {"$ne": 0}}, {"trades": {"$ne": 0}}]}, {"_id": 1}):
+            if summary["_id"] not in seen:
+                emptied.append(summary["_id"])
+            if len(emptied) >= batch_size:
+                corrected += await self.zero_totals(emptied, now)
+                emptied = []
+        if emptied:
+            corrected += await self.zero_totals(emptied, now)
+
+        if corrected:
+            logger.info(f"[Summary] Reconciled {corrected} user summaries")
+        return corrected
+
+    async def write_totals(self, totals, now):
+        # Only summaries that differ are rewritten (or created, for users without one)
+        result = await self.collection.bulk_write([
+            UpdateOne({"_id": total["_id"]},
+                      [{"$set": {
+                          "updated_at": {"$cond": [{"$and": [
+                              {"$eq": ["$total_investment", total["total_investment"]]},
+                              {"$eq": ["$trades", total["trades"]]}]}, "$updated_at", now]},
+                          "total_investment": total["total_investment"],
+                          "trades": total["trades"],
+                      }}],
+                      upsert=True)
+            for total in totals
+        ], ordered=False)
+        corrected = result.modified_count + result.upserted_count
+        if corrected:
+            await self.cache.invalidate([self.cache.key(total["_id"]) for total in totals])
+        return corrected
+
+    async def zero_totals(self, user_ids, now):
+        result = await self.collection.update_many(
+            {"_id": {"$in": user_ids}},
+            {"$set": {"total_investment": 0, "trades": 0, "updated_at": now}},
+        )
+        await self.cache.invalidate([self.cache.key(user_id) for user_id in user_ids])
+        return result.modified_count
@@ -1,11 +1,34 @@
 from bson.objectid import ObjectId
+from pymongo import IndexModel
+
+from .cache import get_cache
 
 class UserTaskDB:
+    INDEXES = [
+        IndexModel("task_id", name="task_id_unique", unique=True),
+        IndexModel("user_id", name="user_id"),
+    ]
+
+    # Filter of each query, checked against the indexes by tests/test_query_plans.py
+    QUERIES = {
+        "get_user_task_by_task_id": {"task_id": ""},
+        "get_user_task_by_user_id": {"user_id": ""},
+        "delete_user_task_by_id": {"_id": ObjectId()},
+    }
+
     def __init__(self, mongo_db):
         self.collection = mongo_db.get_collection("user_tasks")
+        # Mappings cached by user id, reachable by mapping id and task id for the deletes
+        self.cache = get_cache("user_tasks")
+
+    def aliases(self, user_task):
+        if not user_task:
+            return []
+        return [self.cache.key("id", user_task["_id"]), self.cache.key("task", user_task["task_id"])]
 
     async def create_user_task(self, user_id: str, task_id: str):
         result = await self.collection.insert_one({"user_id": user_id, "task_id": task_id})
+        await self.cache.invalidate([self.cache.key("user", user_id)])
         return str(result.inserted_id)
 
     async def get_user_task_by_task_id(self, task_id: str):
@@ -13,20 +36,26 @@ class UserTaskDB:
         return user_task
 
     async def get_user_task_by_user_id(self, user_id: str):
-        user_task = await self.collection.find_one({"user_id": user_id})
+        # Mappings are also written outside this repo, which invalidates nothing, so misses are not cached
+        user_task = await self.cache.get(self.cache.key("user", user_id),
+                                         lambda: self.collection.find_one({"user_id": user_id}),
+                                         aliases=self.aliases, cache_misses=False)
         return user_task
 
     async def delete_user_task_by_id(self, user_task_id: str):
         """Delete a user-task mapping by its ID."""
         result = await self.collection.delete_one({"_id": ObjectId(user_task_id)})
+        await self.cache.invalidate(aliases=[self.cache.key("id", user_task_id)])
         return result.deleted_count
 
     async def delete_user_task_by_task_id(self, task_id: str):
         """Delete a user-task mapping by task ID."""
         result = await self.collection.delete_one({"task_id": task_id})
+        await self.cache.invalidate(aliases=[self.cache.key("task", task_id)])
         return result.deleted_count
 
     async def delete_user_task_by_user_id(self, user_id: str):
         """Delete a user-task mapping by user ID."""
         result = await self.collection.delete_one({"user_id": user_id})
+        await self.cache.invalidate([self.cache.key("user", user_id)])
         return result.deleted_count
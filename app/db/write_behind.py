@@ -0,0 +1,150 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+import weakref
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from ..logging_config import clear_log_context
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Coalesces `$set` updates per document and writes them in `bulk_write` batches.
+
+    `set` only merges the values into the pending update of the document, so
+    the two or three updates a bot makes in one candle become a single write,
+    and the updates of every bot on the loop share one round trip. Pending
+    updates are flushed every `flush_interval` seconds, or as soon as
+    `max_batch` documents are waiting. A failed batch is merged back under
+    newer values and retried on the next flush. `on_flushed(doc_ids)` is
+    awaited after each written batch. Lives on one event loop.
+    """
+
+    def __init__(self, collection, flush_interval=0.5, max_batch=500, on_flushed=None):
+        self.collection = collection
+        self.on_flushed = on_flushed
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.pending = {}
+        self.wakeup = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.task = None
+
+        self.queued = 0
+        self.coalesced = 0
+        self.written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def set(self, doc_id, values):
+        """Queue `{"$set": values}` on the document `doc_id`."""
+        pending = self.pending.get(doc_id)
+        if pending is None:
+            self.pending[doc_id] = dict(values)
+        else:
+            pending.update(values)
+            self.coalesced += 1
+        self.queued += 1
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        if len(self.pending) >= self.max_batch:
+            self.wakeup.set()
+
+    async def run(self):
+        clear_log_context()  # Flushes the updates of every bot on the loop
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write every pending update, `max_batch` documents per `bulk_write`. False if a batch failed."""
+        async with self.flush_lock:
+            while self.pending:
+                batch = {doc_id: self.pending.pop(doc_id)
+                         for doc_id in list(itertools.islice(self.pending, self.max_batch))}
+                start = time.perf_counter()
+                try:
+                    await self.collection.bulk_write(
+                        [UpdateOne({"_id": doc_id}, {"$set": values}) for doc_id, values in batch.items()],
+                        ordered=False)
+                except PyMongoError as e:
+                    self.errors += 1
+                    for doc_id, values in batch.items():
+                        self.pending[doc_id] = {**values, **self.pending.get(doc_id, {})}
+                    logger.error(f"[WriteBehind] Writing {len(batch)} {self.collection.name} updates failed, "
+                                 f"retrying: {e}")
+                    return False
+                finally:
+                    self.last_flush_ms = (time.perf_counter() - start) * 1000
+                    self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+                self.written += len(batch)
+                self.flushes += 1
+                if self.on_flushed is not None:
+                    await self.on_flushed(list(batch))
+            return True
+
+    async def close(self, attempts=3):
+        """Stop the flusher and write what is still pending."""
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for attempt in range(attempts):
+            if await self.flush():
+                return True
+            await asyncio.sleep(2 ** attempt)
+        logger.error(f"[WriteBehind] Dropping {len(self.pending)} pending {self.collection.name} updates: "
+                     f"{list(self.pending)}")
+        return False
+
+    def stats(self):
+        return {
+            "depth": len(self.pending),
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "written": self.written,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+        }
+
+
+_buffers = weakref.WeakKeyDictionary()
+
+
+def get_write_behind(collection, loop=None, on_flushed=None):
+    """Buffer of `collection` on the running loop, tuned by WRITE_BEHIND_INTERVAL and WRITE_BEHIND_MAX_BATCH."""
+    loop = loop or asyncio.get_running_loop()
+    buffers = _buffers.setdefault(loop, {})
+    buffer = buffers.get(collection.name)
+    if buffer is None:
+        buffer = buffers[collection.name] = WriteBehindBuffer(
+            collection,
+            flush_interval=float(os.getenv("WRITE_BEHIND_INTERVAL", "0.5")),
+            max_batch=int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500")),
+            on_flushed=on_flushed,
+        )
+    return buffer
+
+
+async def close_write_behind():
+    """Flush and stop every buffer of the running loop, e.g. before the worker exits."""
+    buffers = _buffers.pop(asyncio.get_running_loop(), {})
+    await asyncio.gather(*(buffer.close() for buffer in buffers.values()))
+
+
+def write_behind_stats(loop):
+    return {name: buffer.stats() for name, buffer in _buffers.get(loop, {}).items()}
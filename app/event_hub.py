@@ -0,0 +1,100 @@
+import asyncio
+import json
+import logging
+
+from redis.exceptions import RedisError
+
+from .bots.events import EVENT_STREAM
+from .redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+
+class EventHub:
+    """Fans the `bot_events` Redis stream out to the clients connected to this API process.
+
+    One reader task follows the stream for every client; each client gets a
+    bounded queue of its user's events. A client that stops reading loses its
+    oldest events rather than holding up the others. The reader only runs
+    while clients are connected.
+    """
+
+    def __init__(self, queue_size=100, block_ms=5000):
+        self.queue_size = queue_size
+        self.block_ms = block_ms
+        self.subscribers = {}  # user_id -> set of queues
+        self.reader = None
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.get_running_loop().create_task(self.read())
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    async def read(self, backoff=1):
+        last_id = "$"
+        while self.subscribers:
+            try:
+                reply = await get_async_redis().xread({EVENT_STREAM: last_id}, block=self.block_ms, count=500)
+                backoff = 1
+            except RedisError as e:
+                logger.error(f"[Events] Reading {EVENT_STREAM} failed, retrying in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            for _, entries in reply:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    self.dispatch(entry_id.decode(), fields)
+
+    def dispatch(self, entry_id, fields):
+        for queue in self.subscribers.get(fields[b"user_id"].decode(), ()):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait((entry_id, fields[b"event"].decode()))
+            self.delivered += 1
+
+    async def backlog(self, user_id, after_id, count=500, pages=20):
+        """The user's events after `after_id` still in the stream, to resume a dropped connection."""
+        events = []
+        for _ in range(pages):
+            entries = await get_async_redis().xrange(EVENT_STREAM, min=f"({after_id}", count=count)
+            for entry_id, fields in entries:
+                after_id = entry_id.decode()
+                if fields[b"user_id"].decode() == user_id:
+                    events.append((after_id, fields[b"event"].decode()))
+            if len(entries) < count:
+                break
+        return events
+
+    def stats(self):
+        return {
+            "clients": sum(len(queues) for queues in self.subscribers.values()),
+            "users": len(self.subscribers),
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+event_hub = EventHub()
+
+
+def entry_key(entry_id):
+    """Sortable form of a stream entry id ("<ms>-<seq>")."""
+    ms, seq = entry_id.split("-")
+    return int(ms), int(seq)
+
+
+def format_sse(entry_id, event):
+    return f"id: {entry_id}\nevent: {json.loads(event)['type']}\ndata: {event}\n\n"
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+from cryptography.fernet import Fernet
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry point -> (import budget in seconds, modules it must not import), checked by tests/test_import_budget.py.
+# IMPORT_BUDGET_SCALE multiplies every budget, e.g. for slower CI machines.
+ENTRY_POINTS = {
+    "app.main": (1.5, ("app.bots.trading_bot", "pandas", "boto3")),
+    "app.celery_worker": (1.5, ("pandas", "boto3")),
+}
+
+
+def parse_importtime(output):
+    """{module: cumulative seconds} from `python -X importtime` output."""
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def measure(module, runs=3):
+    """Best-of-`runs` import time of `module` in a fresh interpreter, and the modules it imported.
+
+    The interpreter gets a local stand-in encryption key and no AWS or Mongo
+    settings, so an import that reaches out to either fails here.
+    """
+    env = dict(os.environ, ENCRYPTION_KEYS=Fernet.generate_key().decode(), SECRET_NAME="",
+               MONGODB_URI="mongodb://127.0.0.1:1", AWS_ACCESS_KEY_ID="", AWS_SECRET_ACCESS_KEY="")
+    best, modules = None, {}
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                env=env, cwd=PROJECT_ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+        modules = parse_importtime(result.stderr)
+        best = modules[module] if best is None else min(best, modules[module])
+    return best, modules
@@ -0,0 +1,148 @@
+import atexit
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Fields of the bot the current task runs, added to every record it logs
+log_context = contextvars.ContextVar("log_context", default={})
+
+
+def bind_log_context(**fields):
+    """Add `fields` (e.g. trade_id, symbol) to the records logged by the current task and what it starts."""
+    return log_context.set({**log_context.get(), **fields})
+
+
+def clear_log_context():
+    """Drop the copied context in a task shared by many bots, which would otherwise log as the bot that started it.
+
+    Tasks copy the context they were created in, and `create_task(context=...)` needs Python 3.11.
+    """
+    log_context.set({})
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, the bot's context fields and any traceback."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without ever blocking the caller.
+
+    The message is rendered and the bot context captured here, on the
+    caller's task; formatting and file I/O happen on the writer. When the
+    queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        record.context = log_context.get()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogThrottle:
+    """Lets a recurring message (e.g. a bot's countdown) through at most once per `interval` seconds per key."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.last = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last.get(key, float("-inf")) < self.interval:
+                return False
+            self.last[key] = now
+            return True
+
+    def forget(self, key):
+        with self.lock:
+            self.last.pop(key, None)
+
+
+_queue_handler = None
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def _start_listener(handlers):
+    global _listener
+    _queue_handler.queue = queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def configure_logging(filename='bot.log', level=logging.INFO):
+    """Log every module to `filename` through a background writer; called once by the API and worker startup hooks.
+
+    Records are JSON lines unless LOG_JSON=0, which keeps the plain LOG_FORMAT.
+    """
+    global _queue_handler
+    with _configure_lock:
+        if _queue_handler is not None:
+            return
+        file_handler = logging.FileHandler(filename, mode='a')
+        if os.getenv("LOG_JSON", "1") == "1":
+            file_handler.setFormatter(JsonFormatter())
+        else:
+            file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        _queue_handler = DroppingQueueHandler(None)
+        _start_listener([file_handler])
+        root = logging.getLogger()
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+
+        atexit.register(stop_logging)
+        # The writer thread does not survive a fork (prefork workers), start a new one in the child
+        os.register_at_fork(after_in_child=lambda: _start_listener([file_handler]))
+
+
+def stop_logging():
+    """Write out what is queued and stop the writer."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def logging_stats():
+    if _queue_handler is None:
+        return {}
+    return {"depth": _queue_handler.queue.qsize(), "dropped": _queue_handler.dropped}
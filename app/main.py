@@ -1,24 +1,57 @@
 # main.py
+from contextlib import asynccontextmanager
 from celery.app.control import Control
-from fastapi import FastAPI, HTTPException
+from celery.contrib.abortable import AbortableAsyncResult
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from .celery_worker import execute_trade
-from fastapi.responses import JSONResponse
+from .bots.events import publish_abort
+from .redis_client import get_async_redis
+from .event_hub import entry_key, event_hub, format_sse
+from redis.exceptions import RedisError
+import asyncio
+import re
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from celery.result import AsyncResult
 from .celery_config import celery_app
 from pydantic import BaseModel
-from .db.base_repo import MongoDB
+from .db.base_repo import get_mongo_db
+from .db.cache import cache_stats
 from .db.trades_repo import TradeDB
 from .db.user_task_repo import UserTaskDB
-import os
-from cryptography.fernet import Fernet
-from .bots.aws_secret import get_secret
+import uuid
+from pymongo.errors import DuplicateKeyError
+from .bots.credentials import get_cipher
+from .logging_config import configure_logging, logging_stats
+from .metrics import register_stats
 
 logger = logging.getLogger(__name__)
 
+# Created by `lifespan`, nothing connects on import
+mongo_db = None
+trade_db = None
+user_task_db = None
+
+@asynccontextmanager
+async def lifespan(app):
+    global mongo_db, trade_db, user_task_db
+    configure_logging()
+    mongo_db = get_mongo_db()
+    trade_db = TradeDB(mongo_db)
+    user_task_db = UserTaskDB(mongo_db)
+    await mongo_db.ensure_indexes(trade_db, trade_db.summaries, user_task_db)
+    # Fetched here rather than on the first trade request; if the secret is unreachable, the first trade retries
+    try:
+        await asyncio.to_thread(get_cipher().load)
+    except Exception as e:
+        logger.error(f"Could not load the encryption keys, retrying on the first trade: {e}")
+    yield
+    mongo_db.client.close()
+
 app = FastAPI(
-    root_path="/api"
+    root_path="/api",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -31,23 +64,17 @@ app.add_middleware(
 
 celery_control = Control(app=celery_app)
 
-mongo_db = MongoDB(str(os.getenv('MONGODB_URI')), "test")
-trade_db = TradeDB(mongo_db)
-user_task_db = UserTaskDB(mongo_db)
-
-secret_name = os.getenv('SECRET_NAME')
-encryption_key = get_secret(secret_name)
-
-def encrypt_data(data, key):
-    fernet = Fernet(key)
-    return fernet.encrypt(data.encode()).decode()
+register_stats("cache", cache_stats)
+register_stats("events", event_hub.stats)
+register_stats("credentials", lambda: get_cipher().stats())
+register_stats("logging", logging_stats)
 
 class TradeLimitException(Exception):
     def __init__(self, name: str):
         self.name = name
 
 @app.exception_handler(TradeLimitException)
-async def trade_limit_exception_handler(exc: TradeLimitException):
+async def trade_limit_exception_handler(request: Request, exc: TradeLimitException):
     return JSONResponse(
         status_code=400,
         content={"message": f"Currently supporting only 1 trade per user. You already have an active trade: {exc.name}"},
@@ -99,33 +126,49 @@ async def trade(request: TradeRequest):
     try:
         logger.info(f"Received trade request: {request.json()}")
 
+        task_id = str(uuid.uuid4())  # Stored on the trade before the task is queued, so the task can always find it
+        # Encrypted once: the same ciphertexts go to Mongo and into the task
+        cipher = get_cipher()
+        encrypted_api_key = cipher.encrypt(request.api_key)
+        encrypted_api_secret = cipher.encrypt(request.api_secret)
         trade_data = {
             "user_id": request.user_id,
-            "api_key": encrypt_data(request.api_key, encryption_key),
-            "api_secret": encrypt_data(request.api_secret, encryption_key),
+            "api_key": encrypted_api_key,
+            "api_secret": encrypted_api_secret,
             "ticker": request.ticker,
             "quantity": request.quantity,
             "timeframe": request.timeframe,
             "price": 0,
             "take_profit_price": 0,
             "order_status": "OPEN_ORDER",
+            "task_id": task_id,
+            "demo": request.demo,  # Needed to restart the bot if its worker is lost
         }
 
-        db_created_trade_id = await trade_db.create_trade(trade_data)
+        try:
+            db_created_trade_id = await trade_db.create_trade(trade_data)
+        except DuplicateKeyError:
+            # Another request for the same user got its trade in first
+            existing_trade = await trade_db.get_trade_by_user_id(request.user_id)
+            raise TradeLimitException(existing_trade['ticker'] if existing_trade else request.ticker)
 
-        task = execute_trade.delay(
+        # Sent by name, so the API never imports the bot code
+        task = celery_app.send_task("execute_trade", kwargs=dict(
             db_created_trade_id=db_created_trade_id,
-            api_key=encrypt_data(request.api_key, encryption_key),
-            api_secret=encrypt_data(request.api_secret, encryption_key),
+            api_key=encrypted_api_key,
+            api_secret=encrypted_api_secret,
             ticker=request.ticker,
             quantity=request.quantity,
             timeframe=request.timeframe,
-            demo=request.demo
-        )
+            demo=request.demo,
+            user_id=request.user_id
+        ), task_id=task_id)
 
         logger.info(f"Trade initiated for {request.ticker}, task id: {task.id}")
         return {"task_id": task.id}
 
+    except TradeLimitException:
+        raise
     except Exception as e:
         logger.error(f"Error processing trade request: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -142,7 +185,8 @@ async def stop(request: StopRequest):
 
     # Stop the Celery task
     task_id = user_task["task_id"]
-    execute_trade.AsyncResult(task_id).abort()
+    await asyncio.to_thread(AbortableAsyncResult(task_id, app=celery_app).abort)
+    await publish_abort(get_async_redis(), task_id)  # The hosting runner cancels the bot right away
     logger.info(f"Stop trade requested for task id: {task_id}")
 
     # Fetch the trade associated with the user_id and task_id
@@ -162,6 +206,42 @@ async def stop(request: StopRequest):
 
     return {"message": "Trade and task mapping deleted successfully"}
 
+@app.get("/bot/events/{user_id}")
+async def bot_events(user_id: str, request: Request):
+    # Server-Sent Events of the user's bots: candles, orders, fills and take profit moves as they happen
+    queue = event_hub.subscribe(user_id)
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and not re.fullmatch(r"\d+-\d+", last_event_id):
+        last_event_id = None  # Not a stream entry id
+
+    async def stream():
+        try:
+            sent = last_event_id
+            if last_event_id:
+                # Reconnecting client: replay what it missed first
+                try:
+                    for entry_id, event in await event_hub.backlog(user_id, last_event_id):
+                        sent = entry_id
+                        yield format_sse(entry_id, event)
+                except RedisError as e:
+                    logger.error(f"Could not replay events after {last_event_id}: {e}")
+
+            while True:
+                try:
+                    entry_id, event = await asyncio.wait_for(queue.get(), 15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if sent and entry_key(entry_id) <= entry_key(sent):
+                    continue  # Already replayed from the backlog
+                sent = entry_id
+                yield format_sse(entry_id, event)
+        finally:
+            event_hub.unsubscribe(user_id, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/tasks/{task_id}")
 def get_status(task_id: str):
     try:
@@ -180,6 +260,35 @@ def get_status(task_id: str):
         logger.error(f"Error retrieving task status for task_id {task_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/bot/runners")
+def get_runners():
+    # Every worker answers with the capacity of its bot runner
+    try:
+        replies = celery_control.broadcast("runner_stats", reply=True, timeout=1.0)
+    except Exception as e:
+        logger.error(f"Error collecting bot runner stats: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    runners = [stats for reply in replies or [] for stats in reply.values()]
+    bots = sum(runner["bots"] for runner in runners)
+    capacity = sum(runner["capacity"] for runner in runners)
+    return {
+        "runners": runners,
+        "bots": bots,
+        "capacity": capacity,
+        "utilization": bots / capacity if capacity else 0.0,
+    }
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    # Hits and misses of this API process' read-through caches
+    return cache_stats()
+
+@app.get("/metrics")
+def get_metrics():
+    # Latency histograms and the stats above, in the Prometheus text format
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 
 if __name__ == "__main__":
     import uvicorn
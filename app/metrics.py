@@ -0,0 +1,150 @@
+import functools
+import logging
+import numbers
+import os
+import re
+import threading
+import time
+
+from prometheus_client import REGISTRY, Counter, Histogram, start_http_server
+from prometheus_client.core import GaugeMetricFamily
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# Request latencies span fast local calls to multi-second throttled order round trips
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REST_SECONDS = Histogram("binance_request_seconds", "Binance REST round trips by route and outcome",
+                         ["method", "path", "outcome"], buckets=LATENCY_BUCKETS)
+ORDER_SECONDS = Histogram("bot_order_seconds", "Bot exchange calls, including rate limit waits and signing",
+                          ["action"], buckets=LATENCY_BUCKETS)
+INDICATOR_SECONDS = Histogram("bot_indicator_seconds", "Bot candle and indicator refreshes, including backfills",
+                              buckets=LATENCY_BUCKETS)
+CANDLE_LAG_SECONDS = Histogram("bot_candle_lag_seconds", "From candle close until the bot has acted on it",
+                               ["timeframe"], buckets=LATENCY_BUCKETS)
+CYCLE_SECONDS = Histogram("bot_cycle_seconds", "One bot cycle, from waking on a candle until it has acted",
+                          ["timeframe"], buckets=LATENCY_BUCKETS)
+WS_MESSAGES = Counter("websocket_messages_total", "WebSocket messages handled", ["stream"])
+WS_HANDLE_SECONDS = Histogram("websocket_message_seconds", "Time spent handling one WebSocket message", ["stream"],
+                              buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5))
+WS_LAG_SECONDS = Histogram("websocket_event_lag_seconds", "From the exchange's event time until it is handled",
+                           ["stream"], buckets=LATENCY_BUCKETS)
+MONGO_SECONDS = Histogram("mongo_command_seconds", "MongoDB commands by collection, command and outcome",
+                          ["collection", "command", "outcome"], buckets=LATENCY_BUCKETS)
+
+
+def timed(histogram, *labels):
+    """Decorator observing how long each call of an async function takes in `histogram`."""
+    child = histogram.labels(*labels) if labels else histogram
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def observe_message(stream, start, event_time_ms=None):
+    """Record one WebSocket message of `stream` handled since `start` (perf_counter)."""
+    WS_MESSAGES.labels(stream).inc()
+    WS_HANDLE_SECONDS.labels(stream).observe(time.perf_counter() - start)
+    if event_time_ms is not None:
+        WS_LAG_SECONDS.labels(stream).observe(max(time.time() - event_time_ms / 1000, 0))
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command of a Mongo client, so each repo method and bulk write is covered."""
+
+    def __init__(self):
+        self.pending = {}  # (connection, request id) -> (collection, command)
+
+    def key(self, event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        self.pending[self.key(event)] = (collection, event.command_name)
+
+    def finished(self, event, outcome):
+        labels = self.pending.pop(self.key(event), None)
+        if labels is not None:
+            MONGO_SECONDS.labels(*labels, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self.finished(event, "ok")
+
+    def failed(self, event):
+        self.finished(event, "error")
+
+
+class StatsCollector:
+    """Exports the numbers of the existing stats snapshots (runner, caches, ...) as gauges.
+
+    Nested keys are joined into the metric name, e.g. `tradelikebot_runner_scheduler_batches`;
+    strings, lists and missing values are left out.
+    """
+
+    def __init__(self):
+        self.sources = {}
+
+    def collect(self):
+        for name, source in list(self.sources.items()):
+            try:
+                stats = source()
+            except Exception as e:
+                logger.error(f"[Metrics] Could not collect {name} stats: {e}")
+                continue
+            for path, value in flatten(stats, name):
+                yield GaugeMetricFamily(f"tradelikebot_{path}", f"{name} stats", value=value)
+
+
+def flatten(stats, prefix):
+    for key, value in stats.items():
+        path = re.sub(r"\W+", "_", f"{prefix}_{key}").strip("_")
+        if isinstance(value, dict):
+            yield from flatten(value, path)
+        elif isinstance(value, numbers.Number):
+            yield path, float(value)
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def register_stats(name, source):
+    """Export the snapshot returned by `source()` under `tradelikebot_<name>_*`."""
+    stats_collector.sources[name] = source
+
+
+_server_port = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server():
+    """Serve /metrics of a worker process on the first free port from METRICS_PORT (0 disables it).
+
+    Prefork children each take the next port of the METRICS_PORT_SPAN ports. Returns the port.
+    """
+    global _server_port
+    base = int(os.getenv("METRICS_PORT", "9100"))
+    with _server_lock:
+        if _server_port is not None or not base:
+            return _server_port
+        for port in range(base, base + int(os.getenv("METRICS_PORT_SPAN", "16"))):
+            try:
+                start_http_server(port)
+            except OSError:
+                continue
+            _server_port = port
+            logger.info(f"[Metrics] Serving metrics on port {port}")
+            return port
+        logger.error(f"[Metrics] No free metrics port from {base}")
+        return None
@@ -0,0 +1,36 @@
+import asyncio
+import os
+import threading
+import weakref
+
+import redis
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+REDIS_URL = os.getenv('REDIS_URL') or 'redis://localhost:6379/0'
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_redis():
+    """Process-wide Redis client (binary responses) on the Redis instance Celery already uses."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = redis.Redis.from_url(REDIS_URL)
+        return _client
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis():
+    """redis.asyncio client of the running event loop (its connections belong to that loop)."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = aioredis.Redis.from_url(REDIS_URL)
+    return client
@@ -0,0 +1,104 @@
+import fakeredis
+import numpy as np
+
+from app.bots.candle_store import INTERVAL_MS, CandleRing, CandleStore
+
+MINUTE = INTERVAL_MS["1m"]
+
+
+def candle(i, start_ms=1_700_000_000_000 // MINUTE * MINUTE):
+    t = start_ms + i * MINUTE
+    return (t, 1.0 + i, 2.0 + i, 0.5 + i, 1.5 + i, 10.0 * i)
+
+
+def test_ring_keeps_newest_candles_contiguous_after_wrapping():
+    ring = CandleRing("1m", 5)
+    for i in range(13):
+        assert ring.append(candle(i))
+
+    tail = ring.tail()
+    assert tail.shape == (5, 6)
+    np.testing.assert_array_equal(tail, [candle(i) for i in range(8, 13)])
+    np.testing.assert_array_equal(ring.tail(2), [candle(11), candle(12)])
+    assert ring.last_open_time() == candle(12)[0]
+    assert not tail.flags.writeable
+
+
+def test_ring_views_stay_valid_for_capacity_minus_n_appends():
+    ring = CandleRing("1m", 4)
+    for i in range(6):
+        ring.append(candle(i))
+    view = ring.tail(2)
+    expected = view.copy()
+    ring.append(candle(6))
+    ring.append(candle(7))
+    np.testing.assert_array_equal(view, expected)
+
+
+def test_ring_hands_out_a_full_ring_as_a_copy():
+    ring = CandleRing("1m", 4)
+    for i in range(6):
+        ring.append(candle(i))
+    full = ring.tail()
+    since = ring.since(0)
+    ring.append(candle(6))
+    np.testing.assert_array_equal(full, [candle(i) for i in range(2, 6)])
+    np.testing.assert_array_equal(since, [candle(i) for i in range(2, 6)])
+    assert not since.flags.writeable
+
+
+def test_ring_clear_leaves_earlier_views_intact():
+    ring = CandleRing("1m", 4)
+    for i in range(3):
+        ring.append(candle(i))
+    view = ring.tail()
+    ring.clear()
+    for i in range(10, 14):
+        ring.append(candle(i))
+    np.testing.assert_array_equal(view, [candle(i) for i in range(3)])
+    np.testing.assert_array_equal(ring.tail(), [candle(i) for i in range(10, 14)])
+
+
+def test_ring_since_returns_candles_from_start():
+    ring = CandleRing("1m", 5)
+    for i in range(8):
+        ring.append(candle(i))
+
+    np.testing.assert_array_equal(ring.since(candle(5)[0]), [candle(i) for i in range(5, 8)])
+    # A start between two open times begins at the next candle, one before the window returns all of it
+    np.testing.assert_array_equal(ring.since(candle(5)[0] - 1), [candle(i) for i in range(5, 8)])
+    assert len(ring.since(0)) == 5
+    assert len(ring.since(candle(8)[0])) == 0
+
+
+def test_ring_refuses_gaps_and_ignores_duplicates():
+    ring = CandleRing("1m", 5)
+    ring.append(candle(0))
+    ring.append(candle(1))
+    assert ring.append(candle(1))
+    assert not ring.append(candle(3))
+    assert ring.size == 2
+    assert ring.last_open_time() == candle(1)[0]
+
+
+def test_ring_is_current():
+    ring = CandleRing("1m", 5)
+    assert not ring.is_current(candle(0)[0])
+    ring.append(candle(0))
+    # Candle 0 closes when candle 1 opens; it is the latest closed one until candle 2 opens
+    assert ring.is_current(candle(1)[0] + 1)
+    assert not ring.is_current(candle(2)[0])
+
+
+def test_store_syncs_candles_published_by_another_worker():
+    client = fakeredis.FakeRedis()
+    writer = CandleStore(client, capacity=5)
+    reader = CandleStore(client, capacity=5)
+    for i in range(8):
+        writer.append("BTCUSDT", "1m", candle(i))
+
+    assert client.zcard(writer.key("BTCUSDT", "1m")) == 5
+    assert reader.sync("BTCUSDT", "1m") == 5
+    np.testing.assert_array_equal(reader.window("BTCUSDT", "1m"), [candle(i) for i in range(3, 8)])
+    writer.append("BTCUSDT", "1m", candle(8))
+    assert reader.sync("BTCUSDT", "1m") == 1
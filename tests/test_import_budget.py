@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+from app.import_budget import ENTRY_POINTS, measure
+
+
+@pytest.mark.parametrize("module", list(ENTRY_POINTS))
+def test_entry_point_imports_within_budget(module):
+    budget, forbidden = ENTRY_POINTS[module]
+    budget *= float(os.getenv("IMPORT_BUDGET_SCALE", "1.0"))
+    seconds, modules = measure(module)
+
+    slowest = sorted(((t, name) for name, t in modules.items() if name != module), reverse=True)[:5]
+    assert seconds <= budget, (f"{module} took {seconds:.3f}s, over its {budget:.2f}s budget; slowest: "
+                               + ", ".join(f"{name} {t:.3f}s" for t, name in slowest))
+    assert [name for name in forbidden if name in modules] == []
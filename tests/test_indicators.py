@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.backtest.engine import bollinger_bands, entry_filters
+from app.bots.indicators import EMA, IndicatorEngine, RollingStats
+
+
+def random_closes(n=1500, seed=7):
+    rng = np.random.default_rng(seed)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+
+
+def candles(closes, interval_ms=60_000):
+    return [(i * interval_ms, c, c, c, c, 1.0) for i, c in enumerate(closes)]
+
+
+def run_engine(closes):
+    """Engine values after every candle, as arrays."""
+    engine = IndicatorEngine()
+    rows = []
+    for candle in candles(closes):
+        engine.update(candle)
+        rows.append((engine.lower_band, engine.upper_band, engine.ema_short.value, engine.ema_long.value,
+                     engine.ema_regime.value, engine.macd.histogram, engine.ema_trend_filter,
+                     engine.ema_regime_filter, engine.bbands_width_filter, engine.macd_above_0))
+    return [np.array(column) for column in zip(*rows)]
+
+
+def test_engine_matches_pandas():
+    closes = random_closes()
+    series = pd.Series(closes)
+    lower, upper, short, long, regime, histogram, *filters = run_engine(closes)
+
+    expected_lower, expected_upper = bollinger_bands(closes)
+    np.testing.assert_allclose(lower, expected_lower, rtol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(upper, expected_upper, rtol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(short, series.ewm(span=45).mean(), rtol=1e-9)
+    np.testing.assert_allclose(long, series.ewm(span=100).mean(), rtol=1e-9)
+    np.testing.assert_allclose(regime, series.ewm(span=480).mean(), rtol=1e-9)
+    line = series.ewm(span=12, adjust=False).mean() - series.ewm(span=26, adjust=False).mean()
+    np.testing.assert_allclose(histogram, line - line.ewm(span=9, adjust=False).mean(), rtol=1e-6, atol=1e-9)
+
+    for name, values in zip(("ema_trend", "ema_regime", "band_width", "macd"), filters):
+        np.testing.assert_array_equal(values, entry_filters(closes, expected_lower, expected_upper, [name]), name)
+
+
+def test_rolling_stats_resync_keeps_matching_pandas():
+    closes = random_closes(3000)
+    stats = RollingStats(20, resync_every=100)
+    means, stds = [], []
+    for close in closes:
+        stats.update(close)
+        means.append(stats.mean)
+        stds.append(stats.std)
+
+    rolling = pd.Series(closes).rolling(20)
+    np.testing.assert_allclose(means, rolling.mean(), rtol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(stds, rolling.std(), rtol=1e-7, equal_nan=True)
+
+
+def test_rolling_stats_flat_window_has_zero_std():
+    stats = RollingStats(5)
+    for close in [1.1, 2.2, 3.3] + [0.7] * 5:
+        stats.update(close)
+    assert stats.std == 0.0
+
+
+def test_ema_without_adjust_starts_at_first_value():
+    ema = EMA(10, adjust=False)
+    assert ema.update(5.0) == 5.0
+    assert ema.update(7.0) == pytest.approx(pd.Series([5.0, 7.0]).ewm(span=10, adjust=False).mean().iloc[-1])
+
+
+def test_engine_ignores_candles_already_consumed():
+    closes = random_closes(60)
+    engine = IndicatorEngine()
+    assert engine.update_many(candles(closes[:40])) == 40
+    before = engine.upper_band
+    # An overlapping window only adds the candles after the last one consumed
+    assert engine.update_many(candles(closes[:50])[30:]) == 10
+    assert engine.update_many(candles(closes[:50])) == 0
+    assert engine.upper_band != before
+    assert engine.last_open_time == 49 * 60_000
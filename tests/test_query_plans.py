@@ -0,0 +1,27 @@
+import asyncio
+import os
+
+import pytest
+
+from app.db.base_repo import MongoDB
+from app.db.query_plans import check_query_plans, plan_stages
+from app.db.trades_repo import TradeDB
+from app.db.user_task_repo import UserTaskDB
+
+
+def test_plan_stages_walks_nested_plans():
+    plan = {"stage": "FETCH", "inputStage": {"stage": "OR", "inputStages": [{"stage": "IXSCAN"},
+                                                                           {"stage": "COLLSCAN"}]}}
+    assert set(plan_stages(plan)) == {"FETCH", "OR", "IXSCAN", "COLLSCAN"}
+
+
+@pytest.mark.skipif(not os.getenv("MONGODB_URI"), reason="needs a MongoDB server in MONGODB_URI")
+def test_repo_queries_do_not_scan_collections():
+    async def main():
+        mongo_db = MongoDB(os.getenv("MONGODB_URI"), os.getenv("MONGODB_TEST_DATABASE", "test"))
+        trade_db = TradeDB(mongo_db)
+        repos = [trade_db, trade_db.summaries, UserTaskDB(mongo_db)]
+        await mongo_db.ensure_indexes(*repos)
+        return await check_query_plans(repos)
+
+    assert asyncio.run(main()) == []
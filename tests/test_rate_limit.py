@@ -0,0 +1,106 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from app.bots.rate_limit import AsyncRateLimiter, Bucket, RateLimiter, RateLimitError
+
+KLINES = "https://api.binance.com/api/v3/klines"
+ORDER = "https://api.binance.com/api/v3/order"
+HEADERS = {"X-MBX-APIKEY": "key"}
+
+
+@pytest.fixture
+def limiter():
+    # Bursts of 10 weight and 2 orders, refilling slowly enough not to matter within a test
+    return RateLimiter(fakeredis.FakeRedis(), weight=Bucket(60, 60, safety=1, burst=10),
+                       orders=Bucket(10, 10, safety=1, burst=2), market_reserve=0.2, max_wait=0)
+
+
+def wait_ms(limiter, method, url, headers=None):
+    keys, args, _ = limiter.plan(method, url, headers)
+    return limiter.acquire_script(keys=keys, args=args, client=limiter.client)[0]
+
+
+def test_requests_leave_the_reserve_to_orders(limiter):
+    # Klines weigh 2; the last 2 of the 10 weight are kept for orders
+    assert [wait_ms(limiter, "GET", KLINES) for _ in range(4)] == [0, 0, 0, 0]
+    assert wait_ms(limiter, "GET", KLINES) > 0
+    assert wait_ms(limiter, "POST", ORDER, HEADERS) == 0
+    assert wait_ms(limiter, "DELETE", ORDER, HEADERS) == 0
+
+
+def test_buckets_are_taken_together_or_not_at_all(limiter):
+    assert wait_ms(limiter, "POST", ORDER, HEADERS) == 0
+    assert wait_ms(limiter, "POST", ORDER, HEADERS) == 0
+    # The order bucket is empty, so the weight of the refused order is given back
+    assert wait_ms(limiter, "POST", ORDER, HEADERS) > 0
+    weight = float(limiter.client.hget(limiter.weight_key("api.binance.com"), "tokens"))
+    assert weight == pytest.approx(8, abs=0.1)
+    # Another account has its own order bucket
+    assert wait_ms(limiter, "POST", ORDER, {"X-MBX-APIKEY": "other"}) == 0
+
+
+def test_wait_covers_the_refill(limiter):
+    for _ in range(4):
+        wait_ms(limiter, "GET", KLINES)
+    # 2 more weight at 1 per second
+    assert 1000 <= wait_ms(limiter, "GET", KLINES) <= 2000
+
+
+def test_response_headers_cap_the_bucket(limiter):
+    wait_ms(limiter, "GET", KLINES)
+    limiter.observe(KLINES, 200, {"X-MBX-USED-WEIGHT-1M": "57"})
+    assert float(limiter.client.hget(limiter.weight_key("api.binance.com"), "tokens")) == 3
+    assert wait_ms(limiter, "GET", KLINES) > 0
+
+
+def test_ban_blocks_every_request(limiter):
+    limiter.observe(KLINES, 429, {"Retry-After": "30"})
+    assert 29_000 < wait_ms(limiter, "POST", ORDER, HEADERS) <= 30_000
+    assert limiter.stats()["bans"] == 1
+
+
+def test_acquire_sends_after_max_wait_for_tokens(limiter):
+    for _ in range(4):
+        wait_ms(limiter, "GET", KLINES)
+    limiter.acquire("GET", KLINES)
+    assert limiter.stats()["waits"] == 0
+
+
+def test_acquire_refuses_requests_while_banned(limiter):
+    limiter.observe(KLINES, 418, {"Retry-After": "30"})
+    with pytest.raises(RateLimitError):
+        limiter.acquire("GET", KLINES)
+    with pytest.raises(RateLimitError):
+        limiter.acquire("POST", ORDER, HEADERS)
+
+
+def test_async_acquire_refuses_requests_while_banned():
+    async def main():
+        limiter = AsyncRateLimiter(fakeredis.FakeAsyncRedis(), max_wait=0)
+        await limiter.observe(KLINES, 429, {"Retry-After": "30"})
+        with pytest.raises(RateLimitError):
+            await limiter.acquire("GET", KLINES)
+
+    asyncio.run(main())
+
+
+def test_redis_down_lets_requests_through():
+    limiter = RateLimiter(fakeredis.FakeRedis(connected=False), max_wait=5)
+    limiter.acquire("GET", KLINES)
+    limiter.observe(KLINES, 429, {"Retry-After": "30"})
+
+
+def test_async_limiter_waits_for_tokens():
+    async def main():
+        limiter = AsyncRateLimiter(fakeredis.FakeAsyncRedis(), weight=Bucket(600, 60, safety=1, burst=4),
+                                   market_reserve=0)
+        for _ in range(3):
+            await limiter.acquire("GET", KLINES)
+        return limiter.stats()
+
+    stats = asyncio.run(main())
+    # The third klines request waited for the 2 weight refilled at 10 per second
+    assert stats["waits"] >= 1
+    assert 0 < stats["waited_s"] < 1
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+
+from app.bots import scheduler
+from app.bots.candle_store import INTERVAL_MS
+from app.bots.scheduler import CandleScheduler, next_boundary
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Wall clock shifted so the next 1m boundary, which is not on the hour, is 50ms away."""
+    real = lambda: int(time.time() * 1000)
+    boundary = next_boundary("1m", real() + 60_000)
+    if boundary % INTERVAL_MS["1h"] == 0:
+        boundary += INTERVAL_MS["1m"]
+    offset = boundary - 50 - real()
+    monkeypatch.setattr(scheduler, "now_ms", lambda: real() + offset)
+    return boundary
+
+
+def test_next_boundary():
+    assert next_boundary("1m", 0) == 60_000
+    assert next_boundary("1m", 59_999) == 60_000
+    assert next_boundary("1m", 60_000) == 120_000
+    # Weeks open on Monday (the epoch was a Thursday), 3d candles count from 2017-08-17
+    assert next_boundary("1w", 0) == 4 * INTERVAL_MS["1d"]
+    assert (next_boundary("3d", 1_700_000_000_000) - 1502928000000) % INTERVAL_MS["3d"] == 0
+
+
+def test_bots_on_one_boundary_wake_in_one_batch(clock):
+    async def main():
+        candle_scheduler = CandleScheduler(asyncio.get_running_loop())
+        waits = [asyncio.ensure_future(candle_scheduler.wait_next("1m")) for _ in range(50)]
+        await asyncio.sleep(0)
+        assert candle_scheduler.stats() == {"pending_boundaries": 1, "waiting_bots": 50, "batches": 0, "woken": 0}
+        assert await asyncio.gather(*waits) == [clock] * 50
+        return candle_scheduler.stats()
+
+    assert asyncio.run(main()) == {"pending_boundaries": 0, "waiting_bots": 0, "batches": 1, "woken": 50}
+
+
+def test_cancelled_bot_does_not_cancel_the_batch(clock):
+    async def main():
+        candle_scheduler = CandleScheduler(asyncio.get_running_loop())
+        waits = [asyncio.ensure_future(candle_scheduler.wait_next("1m")) for _ in range(3)]
+        await asyncio.sleep(0)
+        waits[0].cancel()
+        results = await asyncio.gather(*waits, return_exceptions=True)
+        return results, candle_scheduler.stats()
+
+    results, stats = asyncio.run(main())
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert results[1:] == [clock, clock]
+    assert stats["batches"] == 1
+    assert stats["woken"] == 2
+
+
+def test_earlier_boundary_rearms_the_timer(clock):
+    async def main():
+        candle_scheduler = CandleScheduler(asyncio.get_running_loop())
+        hourly = asyncio.ensure_future(candle_scheduler.wait_next("1h"))
+        await asyncio.sleep(0)
+        hour_timer = candle_scheduler.timer
+        minute = await candle_scheduler.wait_next("1m")
+        assert hour_timer.cancelled()
+        assert candle_scheduler.stats()["pending_boundaries"] == 1
+        hourly.cancel()
+        return minute
+
+    assert asyncio.run(main()) == clock
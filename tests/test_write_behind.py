@@ -0,0 +1,103 @@
+import asyncio
+
+from pymongo.errors import AutoReconnect
+
+from app.db.write_behind import WriteBehindBuffer
+
+
+class FakeCollection:
+    """Records the `$set` of every bulk write; fails the next `fail` writes."""
+
+    name = "trades"
+
+    def __init__(self, fail=0):
+        self.fail = fail
+        self.batches = []
+
+    async def bulk_write(self, requests, ordered=True):
+        if self.fail:
+            self.fail -= 1
+            raise AutoReconnect("connection reset")
+        self.batches.append({request._filter["_id"]: request._doc["$set"] for request in requests})
+
+
+def test_updates_of_one_document_are_merged():
+    async def main():
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, flush_interval=60)
+        buffer.set(1, {"status": "open", "price": 1.0})
+        buffer.set(1, {"price": 2.0})
+        buffer.set(2, {"status": "closed"})
+        assert await buffer.flush()
+        await buffer.close()
+        return collection.batches, buffer.stats()
+
+    batches, stats = asyncio.run(main())
+    assert batches == [{1: {"status": "open", "price": 2.0}, 2: {"status": "closed"}}]
+    assert stats["queued"] == 3
+    assert stats["coalesced"] == 1
+    assert stats["written"] == 2
+    assert stats["flushes"] == 1
+
+
+def test_batches_are_capped_at_max_batch():
+    async def main():
+        collection = FakeCollection()
+        flushed = []
+
+        async def on_flushed(doc_ids):
+            flushed.append(doc_ids)
+
+        buffer = WriteBehindBuffer(collection, flush_interval=60, max_batch=2, on_flushed=on_flushed)
+        for doc_id in range(5):
+            buffer.set(doc_id, {"n": doc_id})
+        await buffer.close()
+        return collection.batches, flushed
+
+    batches, flushed = asyncio.run(main())
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert flushed == [[0, 1], [2, 3], [4]]
+
+
+def test_failed_batch_is_retried_under_newer_values():
+    async def main():
+        collection = FakeCollection(fail=1)
+        buffer = WriteBehindBuffer(collection, flush_interval=60)
+        buffer.set(1, {"status": "open", "price": 1.0})
+        assert not await buffer.flush()
+        buffer.set(1, {"price": 2.0})
+        assert await buffer.flush()
+        await buffer.close()
+        return collection.batches, buffer.stats()
+
+    batches, stats = asyncio.run(main())
+    assert batches == [{1: {"status": "open", "price": 2.0}}]
+    assert stats["errors"] == 1
+    assert stats["depth"] == 0
+
+
+def test_flusher_writes_after_the_interval():
+    async def main():
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, flush_interval=0.01)
+        buffer.set(1, {"status": "open"})
+        await asyncio.sleep(0.1)
+        written = list(collection.batches)
+        await buffer.close()
+        return written
+
+    assert asyncio.run(main()) == [{1: {"status": "open"}}]
+
+
+def test_close_retries_then_drops_what_cannot_be_written():
+    async def main():
+        collection = FakeCollection(fail=1)
+        buffer = WriteBehindBuffer(collection, flush_interval=60)
+        buffer.set(1, {"status": "open"})
+        assert await buffer.close(attempts=2)
+        buffer.set(2, {"status": "open"})
+        collection.fail = 1
+        assert not await buffer.close(attempts=1)
+        return collection.batches
+
+    assert asyncio.run(main()) == [{1: {"status": "open"}}]